@@ -0,0 +1,210 @@
+import json
+import math
+
+# Streaming per-sensor analytics for the dashboard's ingest path. Every
+# sample updates an EWMA, a sliding-window mean/stddev (Welford, with the
+# oldest sample removed as a new one enters) and two-sided CUSUM sums in O(1),
+# then checks static limits, the z-score against the window and the CUSUM
+# decision interval. Alarms are returned as dicts and published on
+#
+#   battery_plant/{plant}/alarms/{process}/{sensor}/{kind}
+#
+# Limit and z-score alarms are 'raised' once and 'cleared' when the condition
+# ends. CUSUM alarms are one-off events: the sums and the reference are reset
+# to the current window so a persistent shift is reported once.
+
+EWMA_ALPHA = 0.1
+WINDOW = 60
+Z_THRESHOLD = 4.0
+# CUSUM slack and decision interval, in reference standard deviations
+CUSUM_K = 0.75
+CUSUM_H = 8.0
+
+ALARM_TOPIC = "battery_plant/{plant}/alarms/{process}/{sensor}/{kind}"
+
+ALARM_HIGH = 'high'
+ALARM_LOW = 'low'
+ALARM_ZSCORE = 'zscore'
+ALARM_CUSUM_UP = 'cusum_up'
+ALARM_CUSUM_DOWN = 'cusum_down'
+
+STATE_RAISED = 'raised'
+STATE_CLEARED = 'cleared'
+
+
+class SensorAnalytics:
+    __slots__ = ('window', 'values', 'pos', 'n', 'mean', 'm2', 'ewma',
+                 'low', 'high', 'ref_mean', 'ref_std', 'cusum_up', 'cusum_down', 'active', 'skipped')
+
+    def __init__(self, window=WINDOW, low=None, high=None):
+        self.window = window
+        self.values = [0.0] * window
+        self.pos = 0
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.ewma = None
+        self.low = low
+        self.high = high
+        # CUSUM reference, taken from the first full window
+        self.ref_mean = None
+        self.ref_std = 0.0
+        self.cusum_up = 0.0
+        self.cusum_down = 0.0
+        # Alarm kinds currently raised
+        self.active = set()
+        # Non-finite samples (NaN, e.g. a data gap), left out of the statistics
+        self.skipped = 0
+
+    def std(self):
+        return math.sqrt(self.m2 / (self.n - 1)) if self.n > 1 and self.m2 > 0 else 0.0
+
+    def update(self, value, alpha=EWMA_ALPHA, z_threshold=Z_THRESHOLD, cusum_k=CUSUM_K, cusum_h=CUSUM_H):
+        # Returns [(kind, state, score)] for alarms that changed with this sample
+        if not math.isfinite(value):
+            # One NaN would poison the EWMA, the window and the CUSUM reference for good
+            self.skipped += 1
+            return []
+        events = []
+        self.ewma = value if self.ewma is None else self.ewma + alpha * (value - self.ewma)
+
+        # Static limits
+        if self.high is not None:
+            self.check(events, ALARM_HIGH, value > self.high, value)
+        if self.low is not None:
+            self.check(events, ALARM_LOW, value < self.low, value)
+
+        # z-score against the window before this sample joins it
+        window = self.window
+        if self.n == window:
+            std = self.std()
+            z = (value - self.mean) / std if std > 0 else 0.0
+            self.check(events, ALARM_ZSCORE, abs(z) > z_threshold, z)
+
+            # CUSUM against the reference
+            if self.ref_std > 0:
+                deviation = (value - self.ref_mean) / self.ref_std
+                self.cusum_up = max(0.0, self.cusum_up + deviation - cusum_k)
+                self.cusum_down = max(0.0, self.cusum_down - deviation - cusum_k)
+                if self.cusum_up > cusum_h or self.cusum_down > cusum_h:
+                    kind = ALARM_CUSUM_UP if self.cusum_up > cusum_h else ALARM_CUSUM_DOWN
+                    events.append((kind, STATE_RAISED, max(self.cusum_up, self.cusum_down)))
+                    self.rebase()
+
+            # Sliding Welford: replace the oldest sample with this one
+            old = self.values[self.pos]
+            mean = self.mean + (value - old) / window
+            self.m2 += (value - old) * (value - mean + old - self.mean)
+            self.mean = mean
+        else:
+            self.n += 1
+            delta = value - self.mean
+            self.mean += delta / self.n
+            self.m2 += delta * (value - self.mean)
+            if self.n == window:
+                self.rebase()
+        self.values[self.pos] = value
+        self.pos = 0 if self.pos + 1 == window else self.pos + 1
+        return events
+
+    def check(self, events, kind, condition, score):
+        if condition:
+            if kind not in self.active:
+                self.active.add(kind)
+                events.append((kind, STATE_RAISED, score))
+        elif kind in self.active:
+            self.active.discard(kind)
+            events.append((kind, STATE_CLEARED, score))
+
+    def rebase(self):
+        self.ref_mean = self.mean
+        self.ref_std = self.std()
+        self.cusum_up = self.cusum_down = 0.0
+
+
+class AnalyticsEngine:
+    # Per-sensor analytics keyed by (plant, process, sensor). Static limits
+    # are given per (process, sensor) and apply to every plant.
+    def __init__(self, limits=None, alpha=EWMA_ALPHA, window=WINDOW, z_threshold=Z_THRESHOLD,
+                 cusum_k=CUSUM_K, cusum_h=CUSUM_H):
+        self.limits = limits or {}
+        self.alpha = alpha
+        self.window = window
+        self.z_threshold = z_threshold
+        self.cusum_k = cusum_k
+        self.cusum_h = cusum_h
+        self.sensors = {}
+        # (key, kind) -> alarm of every raised, not yet cleared alarm
+        self.active = {}
+        self.samples = 0
+        self.raised = 0
+
+    def sensor(self, key):
+        analytics = self.sensors.get(key)
+        if analytics is None:
+            low, high = self.limits.get(key[1:], (None, None))
+            analytics = self.sensors[key] = SensorAnalytics(self.window, low, high)
+        return analytics
+
+    def update(self, key, timestamp, value):
+        # Alarms raised or cleared by this sample (usually none)
+        self.samples += 1
+        analytics = self.sensors.get(key) or self.sensor(key)
+        events = analytics.update(value, self.alpha, self.z_threshold, self.cusum_k, self.cusum_h)
+        if not events:
+            return events
+        alarms = []
+        for kind, state, score in events:
+            plant, process, sensor = key
+            alarm = {
+                'plant': plant,
+                'process': process,
+                'sensor': sensor,
+                'kind': kind,
+                'state': state,
+                'timestamp': timestamp,
+                'value': value,
+                'score': score,
+                'ewma': analytics.ewma,
+                'mean': analytics.mean,
+                'std': analytics.std()
+            }
+            if state == STATE_RAISED:
+                self.raised += 1
+                if kind not in (ALARM_CUSUM_UP, ALARM_CUSUM_DOWN):
+                    self.active[(key, kind)] = alarm
+            else:
+                self.active.pop((key, kind), None)
+            alarms.append(alarm)
+        return alarms
+
+    def stats(self, key):
+        analytics = self.sensors.get(key)
+        if analytics is None:
+            return None
+        return {
+            'ewma': analytics.ewma,
+            'mean': analytics.mean,
+            'std': analytics.std(),
+            'samples': analytics.n,
+            'skipped': analytics.skipped,
+            'low': analytics.low,
+            'high': analytics.high,
+            'cusum_up': analytics.cusum_up,
+            'cusum_down': analytics.cusum_down,
+            'active': sorted(analytics.active)
+        }
+
+
+def limits_from_registry(registry):
+    # {(process, sensor): (low, high)} from the registry's normal ranges
+    return {(sensor.process, sensor.sensor): (sensor.low, sensor.high) for sensor in registry.sensors
+            if sensor.low is not None or sensor.high is not None}
+
+
+def alarm_topic(alarm):
+    return ALARM_TOPIC.format(**alarm)
+
+
+def encode_alarm(alarm):
+    return json.dumps(alarm)
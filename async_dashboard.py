@@ -0,0 +1,175 @@
+import argparse
+import asyncio
+import logging
+import os
+import time
+import jinja2
+import paho.mqtt.client as mqtt
+
+try:
+    from aiohttp import web
+except ImportError:
+    raise ImportError("The asyncio dashboard requires aiohttp: pip install aiohttp")
+import socketio
+
+import web_dashboard as dashboard
+import metrics
+from async_mqtt import AsyncMqttClient
+
+logger = logging.getLogger(__name__)
+
+# asyncio variant of web_dashboard.py: MQTT ingest, state updates, the HTTP
+# API and Socket.IO pushes all run on one event loop. Messages are decoded
+# and applied inside on_message as paho reads them, with no ingest queue or
+# worker thread, and HTTP handlers read the sensor state from the same
+# thread that writes it. The routing table, history, historian, analytics,
+# metrics and API handlers are web_dashboard's own.
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+
+sio = socketio.AsyncServer(async_mode='aiohttp')
+templates = jinja2.Environment(loader=jinja2.FileSystemLoader(TEMPLATE_DIR), autoescape=True)
+
+# Sensors changed since the last commit: {plant: {process: {sensor: entry}}}
+pending_updates = {}
+# Default plant sensors committed but not pushed yet: {process: {sensor: entry}}
+pending_push = {}
+
+
+def on_message(client, userdata, msg):
+    # Runs on the event loop: decode and apply the message in place
+    start = time.perf_counter()
+    dashboard.messages_received.labels(dashboard.topic_label(msg.topic)).inc()
+    topic = dashboard.message_topic(msg)
+    try:
+        epoch = dashboard.handle_message(topic, msg.payload, pending_updates)
+    except Exception as e:
+        logger.error(f"Error processing message on {topic}: {e}")
+        return
+    elapsed = time.perf_counter() - start
+    dashboard.on_message_seconds.observe(elapsed)
+    dashboard.handle_seconds.observe(elapsed)
+    if epoch is not None:
+        dashboard.e2e_latency.observe(time.time() - epoch)
+
+
+def commit_updates():
+    # Messages are applied one at a time, so the changes gathered since the
+    # last push (or API read) form one snapshot version
+    global pending_updates
+    if not pending_updates:
+        return
+    updates, pending_updates = pending_updates, {}
+    dashboard.snapshots.commit(updates)
+    for process, entries in updates.get(dashboard.DEFAULT_PLANT, {}).items():
+        pending_push.setdefault(process, {}).update(entries)
+
+
+async def push_updates():
+    # Push only the sensors that changed since the last frame, at most
+    # PUSH_MAX_RATE times per second
+    global pending_push
+    while True:
+        await asyncio.sleep(1.0 / dashboard.PUSH_MAX_RATE)
+        commit_updates()
+        if not pending_push:
+            continue
+        updates, pending_push = pending_push, {}
+        await sio.emit('sensor_update', updates)
+
+
+@sio.event
+async def connect(sid, environ):
+    # New clients start from a full snapshot, then receive deltas
+    commit_updates()
+    await sio.emit('snapshot', dashboard.snapshots.current(dashboard.DEFAULT_PLANT).data, to=sid)
+
+
+@web.middleware
+async def time_requests(request, handler):
+    start = time.perf_counter()
+    try:
+        return await handler(request)
+    finally:
+        name = request.match_info.route.name
+        if name is not None:
+            dashboard.http_seconds.labels(name).observe(time.perf_counter() - start)
+
+
+def json_response(result):
+    body, status = result
+    return web.json_response(body, status=status)
+
+
+async def index(request):
+    html = templates.get_template('index.html').render(
+        sensor_data=dashboard.sensor_data, processes=dashboard.REGISTRY.dashboard_processes(), live_push=True)
+    return web.Response(text=html, content_type='text/html')
+
+
+async def get_sensor_data(request):
+    commit_updates()
+    body, status, headers = dashboard.sensor_data_response(request.query, request.headers.get('If-None-Match'))
+    return web.Response(body=body, status=status, headers=headers)
+
+
+async def get_alarms(request):
+    return json_response(dashboard.alarms_response())
+
+
+async def get_sensor_analytics(request):
+    return json_response(dashboard.analytics_response(
+        request.query, request.match_info['process'], request.match_info['sensor']))
+
+
+async def get_sensor_history(request):
+    return json_response(dashboard.history_response(
+        request.query, request.match_info['process'], request.match_info['sensor']))
+
+
+async def get_metrics(request):
+    return web.Response(body=dashboard.telemetry.render().encode(), headers={'Content-Type': metrics.CONTENT_TYPE})
+
+
+def build_app():
+    # Route names match the Flask endpoints, so HTTP metrics line up
+    app = web.Application(middlewares=[time_requests])
+    app.router.add_get('/', index, name='index')
+    app.router.add_get('/api/sensor-data', get_sensor_data, name='get_sensor_data')
+    app.router.add_get('/api/alarms', get_alarms, name='get_alarms')
+    app.router.add_get('/api/analytics/{process}/{sensor}', get_sensor_analytics, name='get_sensor_analytics')
+    app.router.add_get('/api/history/{process}/{sensor}', get_sensor_history, name='get_sensor_history')
+    app.router.add_get('/metrics', get_metrics, name='get_metrics')
+    sio.attach(app)
+    return app
+
+
+async def main(port=dashboard.DASHBOARD_PORT):
+    client = mqtt.Client(dashboard.MQTT_CLIENT_ID)
+    client.on_connect = dashboard.on_connect
+    client.on_message = on_message
+    # Alarms are published through the dashboard's client
+    dashboard.client = client
+    connection = AsyncMqttClient(client)
+
+    runner = web.AppRunner(build_app())
+    await runner.setup()
+    await web.TCPSite(runner, port=port).start()
+    logger.info(f"Serving the dashboard on http://localhost:{port}")
+    try:
+        await asyncio.gather(connection.run(dashboard.MQTT_BROKER, dashboard.MQTT_PORT), push_updates())
+    finally:
+        connection.disconnect()
+        await runner.cleanup()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Battery plant web dashboard (asyncio)")
+    dashboard.add_arguments(parser)
+    parser.add_argument('--port', type=int, default=dashboard.DASHBOARD_PORT, help="HTTP port")
+    args = parser.parse_args()
+    dashboard.configure(args)
+    try:
+        asyncio.run(main(args.port))
+    except KeyboardInterrupt:
+        logger.info("Stopping dashboard...")
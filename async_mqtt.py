@@ -0,0 +1,88 @@
+import asyncio
+import logging
+import socket
+import paho.mqtt.client as mqtt
+
+logger = logging.getLogger(__name__)
+
+# Runs a paho client on an asyncio event loop instead of loop_start()'s
+# network thread. paho's external event loop hooks (on_socket_open,
+# on_socket_register_write, ...) register the socket with the loop, so reads,
+# writes and every paho callback (on_connect, on_message, on_publish) run on
+# the loop's thread, next to the rest of the application's coroutines.
+
+MISC_INTERVAL = 1.0
+RECONNECT_MIN_DELAY = 1.0
+RECONNECT_MAX_DELAY = 30.0
+SOCKET_SEND_BUFFER = 2048 * 1024
+# Packets read per readiness callback; paho reads one by default, paying a
+# trip through the event loop per message
+READ_PACKETS = 1000
+
+
+class AsyncMqttClient:
+    # Create after the client's own callbacks are set: on_connect is wrapped
+    # so coroutines can wait for the connection.
+    def __init__(self, client, loop=None):
+        self.client = client
+        self.loop = loop or asyncio.get_running_loop()
+        self.connected = asyncio.Event()
+        self.stopping = False
+        self.user_on_connect = client.on_connect
+        client.on_connect = self.on_connect
+        client.on_socket_open = self.on_socket_open
+        client.on_socket_close = self.on_socket_close
+        client.on_socket_register_write = self.on_socket_register_write
+        client.on_socket_unregister_write = self.on_socket_unregister_write
+
+    def on_connect(self, client, userdata, flags, rc, *args):
+        if rc == 0:
+            self.connected.set()
+        if self.user_on_connect is not None:
+            self.user_on_connect(client, userdata, flags, rc, *args)
+
+    def on_socket_open(self, client, userdata, sock):
+        self.loop.add_reader(sock, client.loop_read, READ_PACKETS)
+        # Let paho queue more outgoing data per write
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_SEND_BUFFER)
+
+    def on_socket_close(self, client, userdata, sock):
+        self.loop.remove_reader(sock)
+        self.loop.remove_writer(sock)
+        self.connected.clear()
+
+    def on_socket_register_write(self, client, userdata, sock):
+        self.loop.add_writer(sock, client.loop_write)
+
+    def on_socket_unregister_write(self, client, userdata, sock):
+        self.loop.remove_writer(sock)
+
+    async def run(self, host, port, keepalive=60):
+        # Connects, then reconnects with backoff until disconnect() is called
+        delay = RECONNECT_MIN_DELAY
+        while not self.stopping:
+            try:
+                # Blocks for the TCP handshake only; CONNACK arrives through the loop
+                self.client.connect(host, port, keepalive)
+            except OSError as e:
+                logger.warning(f"Cannot reach MQTT broker at {host}:{port} ({e}), retrying in {delay:.0f}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, RECONNECT_MAX_DELAY)
+                continue
+            # loop_misc handles keepalive pings and fails once the socket is gone
+            while self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+                await asyncio.sleep(MISC_INTERVAL)
+                if self.connected.is_set():
+                    delay = RECONNECT_MIN_DELAY
+            self.connected.clear()
+            if not self.stopping:
+                logger.warning(f"Connection to MQTT broker lost, reconnecting in {delay:.0f}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, RECONNECT_MAX_DELAY)
+
+    async def wait_connected(self, timeout=None):
+        await asyncio.wait_for(self.connected.wait(), timeout)
+
+    def disconnect(self):
+        self.stopping = True
+        self.client.disconnect()
@@ -0,0 +1,72 @@
+import argparse
+import time
+
+import numpy as np
+
+import analytics
+from sensor_registry import load_registry
+
+# Throughput of the streaming analytics engine on one core, and whether it
+# catches an injected spike and a slow drift. Run from the repository root:
+#   python -m benchmarks.bench_analytics
+
+
+def make_samples(registry, num_rows, seed=0):
+    # Rows of registry-shaped data: base value plus uniform noise
+    rng = np.random.default_rng(seed)
+    base = np.array([sensor.base for sensor in registry.sensors])
+    noise = np.array([sensor.noise for sensor in registry.sensors])
+    return base + rng.uniform(-1.0, 1.0, size=(num_rows, len(base))) * noise
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark streaming analytics")
+    parser.add_argument('--rows', type=int, default=20_000, help="Rows of 30 sensor samples")
+    args = parser.parse_args()
+
+    registry = load_registry()
+    keys = [('1', sensor.process, sensor.sensor) for sensor in registry.sensors]
+    rows = make_samples(registry, args.rows)
+
+    # Spike on drying/temperature, then a slow upward drift on coating/thickness
+    spike_row = args.rows // 3
+    drift_row = args.rows // 2
+    spike_col = keys.index(('1', 'drying', 'temperature'))
+    drift_col = keys.index(('1', 'coating', 'thickness'))
+    rows[spike_row, spike_col] += 8.0
+    noise = registry.sensors[drift_col].noise
+    rows[drift_row:, drift_col] += np.arange(args.rows - drift_row) * noise * 0.02
+
+    engine = analytics.AnalyticsEngine(analytics.limits_from_registry(registry))
+    update = engine.update
+    alarms = []
+    samples = rows.tolist()
+    start = time.perf_counter()
+    for index, row in enumerate(samples):
+        for key, value in zip(keys, row):
+            events = update(key, index, value)
+            if events:
+                alarms.extend(events)
+    elapsed = time.perf_counter() - start
+    total = args.rows * len(keys)
+    print(f"{total} samples over {len(keys)} sensors: {total / elapsed:,.0f} samples/sec "
+          f"({elapsed / total * 1e6:.2f} us/sample)")
+
+    def first(process, sensor, kinds, after):
+        return next((alarm for alarm in alarms if (alarm['process'], alarm['sensor']) == (process, sensor)
+                     and alarm['kind'] in kinds
+                     and alarm['state'] == analytics.STATE_RAISED and alarm['timestamp'] >= after), None)
+
+    spike = first('drying', 'temperature', (analytics.ALARM_ZSCORE, analytics.ALARM_HIGH), spike_row)
+    drift = first('coating', 'thickness', (analytics.ALARM_CUSUM_UP,), drift_row)
+    limit = first('coating', 'thickness', (analytics.ALARM_HIGH,), drift_row)
+    print(f"spike at row {spike_row}: " + (f"{spike['kind']} alarm at row {spike['timestamp']}" if spike else "missed"))
+    print(f"drift from row {drift_row}: " + (f"cusum alarm after {drift['timestamp'] - drift_row} rows" if drift else "missed")
+          + (f", limit alarm after {limit['timestamp'] - drift_row} rows" if limit else ""))
+    false_alarms = sum(1 for alarm in alarms if alarm['state'] == analytics.STATE_RAISED
+                       and ('1', alarm['process'], alarm['sensor']) not in (keys[spike_col], keys[drift_col]))
+    print(f"{engine.raised} alarms raised, {false_alarms} on sensors without injected faults")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+import argparse
+import json
+import time
+from datetime import datetime
+
+import payload_codec
+
+# Encode/decode throughput and wire size of the JSON payloads versus the
+# binary codec. Run from the repository root:
+#   python -m benchmarks.bench_codec
+
+
+def measure(name, func, count, size=None):
+    start = time.perf_counter()
+    for _ in range(count):
+        func()
+    elapsed = time.perf_counter() - start
+    size_text = f"  {size:>4} bytes/msg" if size is not None else ''
+    print(f"{name:<32} {count / elapsed:>14,.0f} ops/sec{size_text}")
+    return count / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sensor payload codecs")
+    parser.add_argument('--count', type=int, default=200_000, help="Operations per measurement")
+    args = parser.parse_args()
+
+    value = 1013.27
+    unit = '°C'
+    timestamp = datetime.now().isoformat()
+    timestamp_ns = time.time_ns()
+
+    json_payload = json.dumps({"timestamp": timestamp, "value": value, "unit": unit}).encode()
+    binary_payload = payload_codec.encode_binary(timestamp_ns, value)
+
+    print("encode")
+    json_encode = measure("json.dumps (publish_sensor_value)",
+                          lambda: json.dumps({"timestamp": datetime.now().isoformat(), "value": value, "unit": unit}),
+                          args.count, len(json_payload))
+    binary_encode = measure("binary pack",
+                            lambda: payload_codec.encode_binary(time.time_ns(), value),
+                            args.count, len(binary_payload))
+    print("decode")
+    json_decode = measure("json.loads (on_message)",
+                          lambda: json.loads(json_payload.decode()),
+                          args.count)
+    binary_decode = measure("binary unpack",
+                            lambda: payload_codec.decode_binary(binary_payload),
+                            args.count)
+    print(f"binary vs json: encode {binary_encode / json_encode:.1f}x, decode {binary_decode / json_decode:.1f}x, "
+          f"size {len(binary_payload) / len(json_payload):.0%}")
+
+
+if __name__ == '__main__':
+    main()
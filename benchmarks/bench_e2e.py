@@ -0,0 +1,320 @@
+import argparse
+import json
+import logging
+import multiprocessing as mp
+import os
+import platform
+import resource
+import socket
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.request
+import paho.mqtt.client as mqtt
+from werkzeug.serving import make_server
+
+import generate_sensor_data
+import metrics
+import payload_codec
+import sensor_simulator
+import web_dashboard as dashboard
+from benchmarks import mqtt_broker
+from ingest_queue import IngestQueue, IngestWorker, INGEST_QUEUE_SIZE
+from sensor_simulator import BatteryPlantSimulator, TickScheduler, TOPIC_MODES, TOPIC_MODE_SENSOR
+
+logger = logging.getLogger(__name__)
+
+# End-to-end benchmark of simulator -> broker -> dashboard -> /api/sensor-data,
+# offline. The embedded broker (benchmarks/mqtt_broker.py) and the dashboard
+# run in their own processes and talk real MQTT over TCP; the simulator
+# publishes from this process at stepped message rates and plant counts
+# while a poller process hits the HTTP API. Each step records:
+#   - publish throughput (target and achieved messages/sec)
+#   - delivery: messages received by the dashboard, dropped by its ingest
+#     queue and processed (delivered), and the payload timestamp ->
+#     on_message latency percentiles
+#   - dashboard CPU (percent of one core) and RSS
+#   - HTTP latency percentiles and throughput of the concurrent pollers
+# Results are written as JSON, for comparing releases. Linux only (fork,
+# /proc). Run from the repository root:
+#   python -m benchmarks.bench_e2e --rates 1000,10000,0 --plants 1,10 --output e2e.json
+# A rate of 0 publishes as fast as possible.
+
+# Delivery latency buckets: 10 us to about 6.5 s, 25% apart
+E2E_BUCKETS = tuple(1e-5 * 1.25 ** i for i in range(60))
+TICK = 0.01
+DRAIN_TIMEOUT = 30.0
+
+
+def percentiles(values):
+    if not values:
+        return {'count': 0}
+    values = sorted(values)
+    pick = lambda q: values[min(len(values) - 1, int(q * len(values)))]
+    return {'count': len(values), 'p50': pick(0.5), 'p90': pick(0.9), 'p99': pick(0.99), 'max': values[-1]}
+
+
+def histogram_percentiles(histogram):
+    # Bucket upper bounds, so at most 25% above the true value
+    if not histogram.count:
+        return {'count': 0}
+    pick = lambda q: min(histogram.quantile(q), histogram.max)
+    return {'count': histogram.count, 'mean': histogram.sum / histogram.count, 'p50': pick(0.5), 'p90': pick(0.9),
+            'p99': pick(0.99), 'max': histogram.max}
+
+
+def rss_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        # Peak instead of current RSS
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def run_dashboard(broker_port, sock, control, args):
+    # Dashboard process: web_dashboard's ingest path and Flask app, plus a
+    # control pipe the harness uses to reset and read the step's counters
+    # Alarms and request logs would flood the harness's output
+    logging.getLogger().setLevel(logging.ERROR)
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    dashboard.MQTT_PORT = broker_port
+    parser = argparse.ArgumentParser()
+    dashboard.add_arguments(parser)
+    options = ['--subscribe', 'battery_plant/+/process/#', '--topic-mode',
+               'bundle' if args.topic_mode == 'bundle' else 'sensor']
+    if args.no_analytics:
+        options.append('--no-analytics')
+    dashboard.configure(parser.parse_args(options))
+    dashboard.e2e_latency = metrics.HistogramValue(E2E_BUCKETS)
+    dashboard.ingest = IngestQueue(args.queue_size)
+    IngestWorker(dashboard.ingest, dashboard.process_batch).start()
+    server = make_server('127.0.0.1', sock.getsockname()[1], dashboard.app, threaded=True, fd=sock.fileno())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    dashboard.start_mqtt_client()
+
+    while True:
+        command = control.recv()
+        if command == 'stop':
+            break
+        if command == 'reset':
+            dashboard.e2e_latency = metrics.HistogramValue(E2E_BUCKETS)
+        cpu = os.times()
+        control.send({
+            'connected': dashboard.client.is_connected(),
+            'received': sum(value.value for value in dashboard.messages_received.series.values()),
+            'dropped': dashboard.ingest.dropped,
+            'processed': dashboard.ingest.processed,
+            'queue_depth': len(dashboard.ingest.items),
+            'e2e_latency': histogram_percentiles(dashboard.e2e_latency),
+            'cpu_seconds': cpu.user + cpu.system,
+            'rss_bytes': rss_bytes()
+        })
+
+
+def poll(url, duration, etag, latencies, errors):
+    deadline = time.perf_counter() + duration
+    tag = None
+    while time.perf_counter() < deadline:
+        request = urllib.request.Request(url)
+        if etag and tag:
+            request.add_header('If-None-Match', tag)
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request) as response:
+                response.read()
+                tag = response.headers.get('ETag')
+        except urllib.error.HTTPError as e:
+            # 304 Not Modified
+            if e.code != 304:
+                errors.append(e.code)
+        except OSError as e:
+            errors.append(str(e))
+            continue
+        latencies.append(time.perf_counter() - start)
+
+
+def run_pollers(url, pollers, duration, etag, results):
+    latencies, errors = [], []
+    threads = [threading.Thread(target=poll, args=(url, duration, etag, latencies, errors))
+               for _ in range(pollers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    results.put((latencies, len(errors)))
+
+
+def make_simulators(plants, client, data, args):
+    simulators = []
+    for plant in range(1, plants + 1):
+        simulator = BatteryPlantSimulator(plant, client=client, encoding=args.encoding, topic_mode=args.topic_mode)
+        if simulators:
+            simulator.share_data(simulators[0])
+        else:
+            simulator.data = data
+            simulator.prepare_fast_path()
+        simulators.append(simulator)
+    return simulators
+
+
+def drive(simulators, rate, duration):
+    # Publish rows round-robin across plants at `rate` messages/sec (0 = as
+    # fast as possible); returns (messages, seconds)
+    per_round = sum(simulator.messages_per_row() for simulator in simulators)
+    rounds_per_tick = rate / per_round * TICK if rate else None
+    scheduler = TickScheduler(TICK)
+    owed = 0.0
+    sent = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        if rounds_per_tick is None:
+            rounds = 1
+        else:
+            owed += rounds_per_tick
+            rounds = int(owed)
+            owed -= rounds
+        for simulator in simulators:
+            sent += simulator.publish_rows(rounds) if rounds else 0
+        if rounds_per_tick is not None:
+            scheduler.wait()
+    return sent, time.perf_counter() - start
+
+
+def request(control, command='stats'):
+    control.send(command)
+    return control.recv()
+
+
+def run_step(plants, rate, args, client, data, control, url):
+    simulators = make_simulators(plants, client, data, args)
+    before = request(control, 'reset')
+    start = time.perf_counter()
+    results = mp.get_context('fork').Queue()
+    pollers = mp.get_context('fork').Process(target=run_pollers,
+                                            args=(url, args.pollers, args.duration, args.etag, results))
+    pollers.start()
+    sent, elapsed = drive(simulators, rate, args.duration)
+    # Wait for paho to flush and the dashboard to receive everything and
+    # empty its queue; CPU is averaged over the whole step including the drain
+    deadline = time.monotonic() + DRAIN_TIMEOUT
+    while True:
+        after = request(control)
+        delta = {name: after[name] - before[name] for name in ('received', 'dropped', 'processed')}
+        caught_up = delta['received'] >= sent and not after['queue_depth'] \
+            and delta['processed'] + delta['dropped'] >= delta['received']
+        if caught_up or time.monotonic() > deadline:
+            break
+        time.sleep(0.1)
+    wall = time.perf_counter() - start
+    latencies, errors = results.get()
+    pollers.join()
+    return {
+        'plants': plants,
+        'topics': sum(simulator.messages_per_row() for simulator in simulators),
+        'target_rate': rate,
+        'published': sent,
+        'publish_rate': sent / elapsed,
+        # Received by on_message; dropped by the ingest queue, or processed
+        'received': delta['received'],
+        'dropped': delta['dropped'],
+        'delivered': delta['processed'],
+        'delivery_latency': after['e2e_latency'],
+        'drain_seconds': wall - elapsed,
+        'dashboard_cpu_percent': 100 * (after['cpu_seconds'] - before['cpu_seconds']) / wall,
+        'dashboard_rss_mb': after['rss_bytes'] / 1e6,
+        'http': dict(percentiles(latencies), errors=errors, rate=len(latencies) / args.duration,
+                     pollers=args.pollers)
+    }
+
+
+def revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end load and latency benchmark")
+    parser.add_argument('--rates', default='1000,10000,0',
+                        help="Comma-separated target messages/sec per step (0 = unthrottled)")
+    parser.add_argument('--plants', default='1,10', help="Comma-separated plant counts (30 topics each)")
+    parser.add_argument('--duration', type=float, default=5.0, help="Seconds per step")
+    parser.add_argument('--pollers', type=int, default=8, help="Concurrent /api/sensor-data pollers")
+    parser.add_argument('--etag', action='store_true', help="Pollers revalidate with If-None-Match")
+    parser.add_argument('--encoding', choices=[payload_codec.ENCODING_JSON, payload_codec.ENCODING_BINARY],
+                        default=payload_codec.ENCODING_JSON, help="Payload encoding")
+    parser.add_argument('--topic-mode', choices=TOPIC_MODES, default=TOPIC_MODE_SENSOR,
+                        help="Per-sensor topics or per-process bundles")
+    parser.add_argument('--queue-size', type=int, default=INGEST_QUEUE_SIZE, help="Dashboard ingest queue size")
+    parser.add_argument('--no-analytics', action='store_true', help="Disable the dashboard's analytics")
+    parser.add_argument('--nodelay', action='store_true',
+                        help="Disable Nagle's algorithm on the simulator's socket (paho leaves it on)")
+    parser.add_argument('--rows', type=int, default=1000, help="Rows of generated data to cycle through")
+    parser.add_argument('--output', default=None, help="Write the JSON results to this file (default: stdout)")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    logger.setLevel(logging.INFO)
+    sensor_simulator.logger.setLevel(logging.WARNING)
+    data = next(generate_sensor_data.generate_chunks(args.rows, seed=0))
+
+    context = mp.get_context('fork')
+    broker, broker_port = mqtt_broker.start()
+    sock = socket.create_server(('127.0.0.1', 0))
+    url = f"http://127.0.0.1:{sock.getsockname()[1]}/api/sensor-data"
+    control, child_control = context.Pipe()
+    dashboard_process = context.Process(target=run_dashboard, args=(broker_port, sock, child_control, args),
+                                        daemon=True)
+    dashboard_process.start()
+    sock.close()
+
+    client = mqtt.Client('bench_e2e')
+    client.connect('127.0.0.1', broker_port)
+    if args.nodelay:
+        client.socket().setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    client.loop_start()
+    steps = []
+    try:
+        deadline = time.monotonic() + DRAIN_TIMEOUT
+        while not request(control)['connected'] and time.monotonic() < deadline:
+            time.sleep(0.1)
+        for plants in (int(value) for value in args.plants.split(',')):
+            for rate in (float(value) for value in args.rates.split(',')):
+                step = run_step(plants, rate, args, client, data, control, url)
+                latency = step['delivery_latency']
+                logger.info(f"{plants} plants, {rate:g} msgs/s: published {step['publish_rate']:,.0f} msgs/s, "
+                            f"delivered {step['delivered']}/{step['published']} ({step['dropped']} dropped), "
+                            f"p99 {latency.get('p99', 0) * 1000:.1f} ms, cpu {step['dashboard_cpu_percent']:.0f}%, "
+                            f"http p99 {step['http'].get('p99', 0) * 1000:.1f} ms")
+                steps.append(step)
+    finally:
+        client.loop_stop()
+        client.disconnect()
+        control.send('stop')
+        dashboard_process.join(5)
+        dashboard_process.terminate()
+        broker.terminate()
+
+    results = {
+        'benchmark': 'e2e',
+        'revision': revision(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(),
+                        'cpus': os.cpu_count()},
+        'config': {key: value for key, value in vars(args).items() if key != 'output'},
+        'steps': steps
+    }
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+import argparse
+import logging
+import time
+import numpy as np
+import pandas as pd
+
+import sensor_simulator
+from sensor_simulator import BatteryPlantSimulator, REGISTRY, TOPIC_MODE_SENSOR, TOPIC_MODE_BUNDLE
+from benchmarks.local_broker import LocalBroker
+
+# Compares the legacy per-message publish path against the high-rate
+# pre-serialized path. Run from the repository root:
+#   python -m benchmarks.bench_publish
+
+
+def make_simulator(num_rows, topic_mode=TOPIC_MODE_SENSOR):
+    rng = np.random.default_rng(0)
+    columns = {column: rng.uniform(0, 1000, num_rows).round(2) for column in REGISTRY.columns()}
+    simulator = BatteryPlantSimulator(topic_mode=topic_mode)
+    simulator.client = LocalBroker().client('bench')
+    simulator.data = pd.DataFrame(columns)
+    simulator.prepare_fast_path()
+    return simulator
+
+
+def measure(name, simulator, publish, duration):
+    broker = simulator.client.broker
+    start_messages = broker.messages
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        publish()
+    elapsed = time.perf_counter() - start
+    messages = broker.messages - start_messages
+    print(f"{name:<28} {messages:>10} msgs  {messages / elapsed:>12,.0f} msgs/sec")
+    return messages / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark simulator publish throughput")
+    parser.add_argument('--rows', type=int, default=1000, help="Rows of synthetic data")
+    parser.add_argument('--duration', type=float, default=2.0, help="Seconds per measurement")
+    parser.add_argument('--block-size', type=int, default=100, help="Rows per high-rate block")
+    args = parser.parse_args()
+
+    sensor_simulator.logger.setLevel(logging.WARNING)
+    simulator = make_simulator(args.rows)
+    legacy = measure("legacy publish_sensor_data", simulator, simulator.publish_sensor_data, args.duration)
+    single = measure("publish_rows(1)", simulator, simulator.publish_rows, args.duration)
+    block = measure(f"publish_rows({args.block_size})", simulator,
+                    lambda: simulator.publish_rows(args.block_size), args.duration)
+    print(f"speedup: row {single / legacy:.1f}x, block {block / legacy:.1f}x")
+
+    # Bundle mode: one message per process per row instead of one per sensor
+    per_sensor = make_simulator(args.rows)
+    bundle_simulator = make_simulator(args.rows, TOPIC_MODE_BUNDLE)
+    per_sensor.publish_rows(args.block_size)
+    bundle_simulator.publish_rows(args.block_size)
+    sensor_messages = per_sensor.client.broker.messages
+    bundle_messages = bundle_simulator.client.broker.messages
+    print(f"bundle mode: {bundle_messages} msgs for {args.block_size} rows vs {sensor_messages} "
+          f"({sensor_messages / bundle_messages:.1f}x fewer)")
+    measure(f"bundle publish_rows({args.block_size})", bundle_simulator,
+            lambda: bundle_simulator.publish_rows(args.block_size), args.duration)
+
+    # Flow control: every publish tracked by mid against a bounded in-flight window
+    controlled = make_simulator(args.rows)
+    controlled.enable_flow_control(max_inflight=1000)
+    flow = measure(f"flow-controlled ({args.block_size})", controlled,
+                   lambda: controlled.publish_rows(args.block_size), args.duration)
+    print(f"flow control overhead: {block / flow:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
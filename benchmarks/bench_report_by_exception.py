@@ -0,0 +1,105 @@
+import argparse
+import logging
+
+import generate_sensor_data
+import sensor_simulator
+from sensor_simulator import BatteryPlantSimulator, REGISTRY
+from report_by_exception import SparkplugState, SPARKPLUG_GROUP, COMMAND, sparkplug_topic, rebirth_payload
+from benchmarks.local_broker import LocalBroker
+
+# Message volume of report by exception against publishing every sensor on
+# every tick, on generated data at one row per second, and a check that a
+# Sparkplug subscriber's reconstructed state stays within each sensor's
+# deadband. Run from the repository root:
+#   python -m benchmarks.bench_report_by_exception
+
+
+def make_simulator(data, **options):
+    simulator = BatteryPlantSimulator(**options)
+    simulator.client = LocalBroker().client('bench')
+    simulator.data = data
+    simulator.prepare_fast_path()
+    return simulator
+
+
+def publish_all(simulator, interval, first=0):
+    # Rows are stamped one interval apart, so heartbeats follow data time
+    for number, row in enumerate(simulator.values.tolist(), first):
+        simulator.publish_row(row, int(number * interval * 1e9))
+
+
+def room_pressure_messages(simulator):
+    topic = simulator.topics['environmental']['pressure']
+    return simulator.published_counts().get((topic,), 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark report-by-exception message volume")
+    parser.add_argument('--rows', type=int, default=3600, help="Rows of generated data")
+    parser.add_argument('--interval', type=float, default=1.0, help="Seconds between rows")
+    parser.add_argument('--deadband', type=float, default=5.0, help="Deadband in percent of the normal range")
+    parser.add_argument('--max-silence', type=float, default=60.0, help="Seconds between heartbeats")
+    args = parser.parse_args()
+
+    sensor_simulator.logger.setLevel(logging.WARNING)
+    data = next(generate_sensor_data.generate_chunks(args.rows, args.interval, seed=0))
+
+    runs = []
+    baseline = make_simulator(data)
+    publish_all(baseline, args.interval)
+    runs.append(("every tick", baseline))
+    for percent in (0.0, args.deadband):
+        simulator = make_simulator(data)
+        simulator.enable_report_by_exception(percent, args.max_silence)
+        publish_all(simulator, args.interval)
+        runs.append((f"by exception, {percent:g}% deadband", simulator))
+
+    print(f"{'mode':<32} {'messages':>10} {'bytes':>12} {'room_pressure':>14}")
+    for name, simulator in runs:
+        broker = simulator.client.broker
+        print(f"{name:<32} {broker.messages:>10,} {broker.bytes:>12,} {room_pressure_messages(simulator):>14,}")
+    full = runs[0][1].client.broker
+    for name, simulator in runs[1:]:
+        broker = simulator.client.broker
+        print(f"{name}: {full.messages / broker.messages:.1f}x fewer messages, "
+              f"{full.bytes / broker.bytes:.1f}x fewer bytes")
+
+    # Sparkplug: one NDATA per row with any change; a subscriber that joins
+    # after the birth rebuilds the state from the retained certificate
+    simulator = make_simulator(data)
+    simulator.enable_report_by_exception(args.deadband, args.max_silence)
+    simulator.enable_sparkplug()
+    simulator.client.on_connect = simulator.on_connect
+    simulator.client.connect()
+    publish_all(simulator, args.interval)
+    broker = simulator.client.broker
+    print(f"{'sparkplug, ' + format(args.deadband, 'g') + '% deadband':<32} {broker.messages:>10,} {broker.bytes:>12,}")
+
+    # A host that was subscribed through a reconnect and a second pass, and
+    # one that joins afterwards and asks for a rebirth
+    node = str(simulator.plant_id)
+    state = SparkplugState()
+    live = broker.client('live')
+    live.on_message = lambda client, userdata, msg: state.apply(msg.topic, msg.payload)
+    live.subscribe(f"spBv1.0/{SPARKPLUG_GROUP}/#")
+    simulator.client.connect()
+    publish_all(simulator, args.interval, args.rows)
+    late = SparkplugState()
+    host = broker.client('late')
+    host.on_message = lambda client, userdata, msg: late.apply(msg.topic, msg.payload)
+    host.subscribe(f"spBv1.0/{SPARKPLUG_GROUP}/#")
+    host.publish(sparkplug_topic(SPARKPLUG_GROUP, COMMAND, node), rebirth_payload())
+
+    last = simulator.values[-1]
+    for name, subscriber in (("subscribed", state), ("late + rebirth", late)):
+        values = subscriber.nodes[(SPARKPLUG_GROUP, node)]['values']
+        worst = max(abs(values[f"{sensor.process}/{sensor.sensor}"] - last[index]) - simulator.exceptions.deadbands[index]
+                    for index, sensor in enumerate(REGISTRY.sensors))
+        print(f"{name}: {len(values)} metrics, all within deadband: {worst <= 1e-9}")
+    print(f"node online: {state.online(SPARKPLUG_GROUP, node)}", end='')
+    simulator.client.drop()
+    print(f", after the connection drops: {state.online(SPARKPLUG_GROUP, node)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+import argparse
+import time
+
+import payload_codec
+from sensor_simulator import REGISTRY
+from topic_router import TopicRouter
+
+# Cost of resolving an incoming topic to the dashboard's state: the old
+# split-and-index parse versus the precompiled routing table, plus the one-off
+# cost of discovering a topic through a wildcard subscription. Run from the
+# repository root:
+#   python -m benchmarks.bench_routing
+
+
+def measure(name, func, topics, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for topic in topics:
+            func(topic)
+    elapsed = time.perf_counter() - start
+    rate = rounds * len(topics) / elapsed
+    print(f"{name:<32} {rate:>14,.0f} topics/sec")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark topic routing")
+    parser.add_argument('--plants', type=int, default=10, help="Plants known to the router")
+    parser.add_argument('--rounds', type=int, default=2000, help="Passes over the topic list")
+    args = parser.parse_args()
+
+    plants = {str(plant): REGISTRY.topics(plant) for plant in range(1, args.plants + 1)}
+    topics = [topic for table in plants.values() for sensors in table.values() for topic in sensors.values()]
+    topics += [payload_codec.binary_topic(topic) for topic in topics]
+
+    # Previous dashboard: split the topic, classify the suffix and walk nested dicts
+    sensor_data = {plant: {process: dict.fromkeys(sensors) for process, sensors in table.items()}
+                   for plant, table in plants.items()}
+
+    def parse(topic):
+        base, encoding = payload_codec.split_topic(topic)
+        parts = base.split('/')
+        return encoding, sensor_data[parts[1]][parts[3]][parts[-1]]
+
+    router = TopicRouter()
+    for plant, table in plants.items():
+        router.register_plant(plant, table)
+
+    print(f"{len(topics)} topics over {args.plants} plants")
+    parsed = measure("split + nested dicts", parse, topics, args.rounds)
+    routed = measure("router.route", router.route, topics, args.rounds)
+    print(f"routing table vs parsing: {routed / parsed:.1f}x")
+
+    # First sight of unknown sensors under a wildcard subscription
+    discovery = TopicRouter()
+    discovery.add_subscription('battery_plant/+/process/#')
+    plain = [topic for topic in topics if payload_codec.split_topic(topic)[1] == payload_codec.ENCODING_JSON]
+    start = time.perf_counter()
+    for topic in plain:
+        discovery.route(topic)
+    elapsed = time.perf_counter() - start
+    print(f"{'discovery (first sight)':<32} {elapsed / len(plain) * 1e6:>14.1f} us/topic")
+
+
+if __name__ == '__main__':
+    main()
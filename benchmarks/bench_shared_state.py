@@ -0,0 +1,78 @@
+import argparse
+import multiprocessing as mp
+import time
+
+from sensor_simulator import REGISTRY
+from shared_state import SharedState, SharedSnapshots
+
+# Read throughput of the multi-process dashboard's shared memory state:
+# snapshot requests (/api/sensor-data) served by 1..N reader processes while
+# one writer process ingests samples, as dashboard_cluster.py runs them.
+# Linux only (fork). Run from the repository root:
+#   python -m benchmarks.bench_shared_state
+
+
+def writer(state, stop, rate):
+    # Writes every sensor once per batch, `rate` batches per second
+    keys = state.keys
+    value = 0.0
+    while not stop.is_set():
+        now = time.time_ns()
+        value += 0.01
+        for key in keys:
+            state.write(key, now, value)
+        state.commit()
+        time.sleep(1.0 / rate)
+
+
+def reader(state, seconds, results):
+    snapshots = SharedSnapshots(state)
+    requests = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        snapshot = snapshots.current('1')
+        snapshots.encode(snapshot)
+        snapshots.encode_delta('1', snapshot, snapshot.version - 1)
+        requests += 1
+    results.put(requests)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark shared memory dashboard state")
+    parser.add_argument('--readers', type=int, default=4, help="Maximum reader processes")
+    parser.add_argument('--seconds', type=float, default=2.0, help="Duration of each run")
+    parser.add_argument('--rate', type=float, default=100, help="Writer batches per second")
+    args = parser.parse_args()
+
+    context = mp.get_context('fork')
+    state = SharedState.create(REGISTRY, ['1'], 10000)
+    try:
+        start = time.perf_counter()
+        writes = 100000
+        for i in range(writes):
+            state.write(state.keys[i % len(state.keys)], i, float(i))
+        print(f"{'writer, single slot writes':<32} {writes / (time.perf_counter() - start):>12,.0f} writes/sec")
+
+        stop = context.Event()
+        ingest = context.Process(target=writer, args=(state, stop, args.rate))
+        ingest.start()
+        readers = 1
+        while readers <= args.readers:
+            results = context.Queue()
+            workers = [context.Process(target=reader, args=(state, args.seconds, results)) for _ in range(readers)]
+            for worker in workers:
+                worker.start()
+            total = sum(results.get() for _ in workers)
+            for worker in workers:
+                worker.join()
+            label = f"{readers} reader processes"
+            print(f"{label:<32} {total / args.seconds:>12,.0f} requests/sec")
+            readers *= 2
+        stop.set()
+        ingest.join()
+    finally:
+        state.close()
+
+
+if __name__ == '__main__':
+    main()
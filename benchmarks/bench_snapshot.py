@@ -0,0 +1,65 @@
+import argparse
+import json
+import time
+
+from sensor_simulator import REGISTRY
+from snapshot import SnapshotStore
+
+# Cost of serving /api/sensor-data to many pollers: serializing the live dict
+# on every request versus the versioned snapshot with its cached encoding,
+# plus the size of a ?since_version= delta after one ingest batch. Run from
+# the repository root:
+#   python -m benchmarks.bench_snapshot
+
+
+def make_plant(version):
+    return {process: {sensor.sensor: {'value': sensor.base + version * 0.01, 'unit': sensor.unit,
+                                      'timestamp': '2024-01-01T00:00:00.000000'} for sensor, _ in sensors}
+            for process, sensors in REGISTRY.process_sensors().items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark snapshot serving")
+    parser.add_argument('--pollers', type=int, default=100, help="Requests per version")
+    parser.add_argument('--versions', type=int, default=200, help="Ingest batches")
+    parser.add_argument('--batch-sensors', type=int, default=5, help="Sensors changed per batch")
+    args = parser.parse_args()
+
+    live = make_plant(0)
+    store = SnapshotStore({'1': live})
+    batches = []
+    for version in range(1, args.versions + 1):
+        # A batch touching the first few sensors, as a slow-changing plant would
+        batch = {}
+        for sensor in REGISTRY.sensors[:args.batch_sensors]:
+            batch.setdefault(sensor.process, {})[sensor.sensor] = {
+                'value': sensor.base + version * 0.01, 'unit': sensor.unit, 'timestamp': '2024-01-01T00:00:01.000000'}
+        batches.append(batch)
+
+    requests = args.pollers * args.versions
+    start = time.perf_counter()
+    for batch in batches:
+        for process, entries in batch.items():
+            live[process].update(entries)
+        for _ in range(args.pollers):
+            json.dumps(live).encode()
+    per_request = time.perf_counter() - start
+    print(f"{'json.dumps per request':<32} {requests / per_request:>12,.0f} requests/sec")
+
+    start = time.perf_counter()
+    for batch in batches:
+        store.commit({'1': batch})
+        for _ in range(args.pollers):
+            store.encode(store.current('1'))
+    cached = time.perf_counter() - start
+    print(f"{'snapshot, cached encoding':<32} {requests / cached:>12,.0f} requests/sec")
+    print(f"cached vs per request: {per_request / cached:.1f}x")
+
+    snapshot = store.current('1')
+    full = len(store.encode(snapshot))
+    delta = len(store.encode_delta('1', snapshot, snapshot.version - 1))
+    print(f"full snapshot {full} bytes, one-batch delta {delta} bytes ({full / delta:.1f}x smaller)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+import threading
+import paho.mqtt.client as mqtt
+
+# In-process stand-in for an MQTT broker, used by the benchmarks so they can
+# run offline. Clients created from the same LocalBroker see each other's
+# messages synchronously, with MQTT wildcard matching and retained messages.
+
+
+class LocalMessage:
+    __slots__ = ('topic', 'payload', 'qos', 'retain', 'properties')
+
+    def __init__(self, topic, payload, qos=0, retain=False, properties=None):
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.retain = retain
+        self.properties = properties
+
+
+class LocalMessageInfo:
+    __slots__ = ('mid', 'rc')
+
+    def __init__(self, mid):
+        self.mid = mid
+        self.rc = mqtt.MQTT_ERR_SUCCESS
+
+    def is_published(self):
+        return True
+
+    def wait_for_publish(self, timeout=None):
+        return True
+
+
+class LocalBroker:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions = []
+        self.retained = {}
+        self.messages = 0
+        self.bytes = 0
+
+    def client(self, client_id=''):
+        return LocalClient(self, client_id)
+
+    def subscribe(self, client, pattern):
+        with self.lock:
+            self.subscriptions.append((pattern, client))
+            retained = [(topic, msg) for topic, msg in self.retained.items()
+                        if mqtt.topic_matches_sub(pattern, topic)]
+        for _, msg in retained:
+            client.deliver(msg)
+
+    def publish(self, topic, payload, qos=0, retain=False, properties=None):
+        if isinstance(payload, str):
+            payload = payload.encode()
+        elif payload is None:
+            payload = b''
+        self.messages += 1
+        self.bytes += len(payload)
+        msg = LocalMessage(topic, payload, qos, retain, properties)
+        if retain:
+            self.retained[topic] = msg
+        for pattern, client in self.subscriptions:
+            if mqtt.topic_matches_sub(pattern, topic):
+                client.deliver(msg)
+
+
+class LocalClient:
+    # Implements the subset of the paho Client interface the simulator and
+    # dashboard use.
+    def __init__(self, broker, client_id=''):
+        self.broker = broker
+        self.client_id = client_id
+        self.on_connect = None
+        self.on_message = None
+        self.on_publish = None
+        self.on_disconnect = None
+        self.mid = 0
+        self.will = None
+        self.next_will = None
+
+    def will_set(self, topic, payload=None, qos=0, retain=False, properties=None):
+        # Like a real broker, the will takes effect with the next connect
+        self.next_will = (topic, payload, qos, retain)
+
+    def connect(self, host=None, port=None, keepalive=60):
+        self.will = self.next_will
+        if self.on_connect:
+            self.on_connect(self, None, {}, 0)
+        return mqtt.MQTT_ERR_SUCCESS
+
+    def disconnect(self):
+        if self.on_disconnect:
+            self.on_disconnect(self, None, 0)
+        return mqtt.MQTT_ERR_SUCCESS
+
+    def loop_start(self):
+        return mqtt.MQTT_ERR_SUCCESS
+
+    def loop_stop(self, force=False):
+        return mqtt.MQTT_ERR_SUCCESS
+
+    def drop(self):
+        # Simulates a lost connection: the broker publishes the will
+        if self.will is not None:
+            self.broker.publish(*self.will)
+
+    def is_connected(self):
+        return True
+
+    def subscribe(self, topic, qos=0):
+        self.broker.subscribe(self, topic)
+        return (mqtt.MQTT_ERR_SUCCESS, self.mid)
+
+    def publish(self, topic, payload=None, qos=0, retain=False, properties=None):
+        self.mid += 1
+        self.broker.publish(topic, payload, qos, retain, properties)
+        if self.on_publish:
+            self.on_publish(self, None, self.mid)
+        return LocalMessageInfo(self.mid)
+
+    def deliver(self, msg):
+        if self.on_message:
+            self.on_message(self, None, msg)
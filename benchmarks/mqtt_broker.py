@@ -0,0 +1,165 @@
+import asyncio
+import multiprocessing as mp
+import socket
+import struct
+import paho.mqtt.client as mqtt
+
+# Embedded MQTT 3.1.1 broker for the end-to-end benchmark. Unlike
+# LocalBroker, clients connect over TCP with a real paho client, so the
+# simulator, broker and dashboard can run in separate processes. It covers
+# what the benchmark needs: CONNECT, SUBSCRIBE/UNSUBSCRIBE with wildcards,
+# PUBLISH at QoS 0/1/2 from publishers, retained messages, PINGREQ and
+# DISCONNECT. Messages are forwarded to subscribers at QoS 0, once per
+# client even when several of its subscriptions match. No persistence, no
+# authentication, no wills.
+
+CONNECT, CONNACK, PUBLISH, PUBACK, PUBREC, PUBREL, PUBCOMP = 1, 2, 3, 4, 5, 6, 7
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK, PINGREQ, PINGRESP, DISCONNECT = 8, 9, 10, 11, 12, 13, 14
+
+LENGTH = struct.Struct('>H')
+
+
+def encode_length(length):
+    encoded = bytearray()
+    while True:
+        byte = length % 128
+        length //= 128
+        if length:
+            byte |= 0x80
+        encoded.append(byte)
+        if not length:
+            return bytes(encoded)
+
+
+def publish_packet(topic, payload, retain=False):
+    topic = topic.encode()
+    header = 0x30 | (1 if retain else 0)
+    return bytes([header]) + encode_length(2 + len(topic) + len(payload)) + LENGTH.pack(len(topic)) + topic + payload
+
+
+async def read_packet(reader):
+    header = (await reader.readexactly(1))[0]
+    length, multiplier = 0, 1
+    while True:
+        byte = (await reader.readexactly(1))[0]
+        length += (byte & 0x7F) * multiplier
+        multiplier *= 128
+        if not byte & 0x80:
+            break
+    return header, await reader.readexactly(length)
+
+
+class Session:
+    __slots__ = ('writer', 'patterns')
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.patterns = []
+
+
+class Broker:
+    def __init__(self):
+        self.sessions = []
+        self.retained = {}
+        self.received = 0
+        self.forwarded = 0
+
+    def matches(self, session, topic):
+        return any(mqtt.topic_matches_sub(pattern, topic) for pattern in session.patterns)
+
+    def route(self, topic, payload, retain):
+        self.received += 1
+        if retain:
+            if payload:
+                self.retained[topic] = payload
+            else:
+                self.retained.pop(topic, None)
+        packet = publish_packet(topic, payload)
+        for session in self.sessions:
+            if self.matches(session, topic):
+                session.writer.write(packet)
+                self.forwarded += 1
+
+    def subscribe(self, session, body):
+        packet_id, position, granted = body[:2], 2, bytearray()
+        patterns = []
+        while position < len(body):
+            (length,) = LENGTH.unpack_from(body, position)
+            patterns.append(body[position + 2:position + 2 + length].decode())
+            position += 2 + length + 1
+            granted.append(0)
+        session.patterns.extend(patterns)
+        session.writer.write(bytes([SUBACK << 4]) + encode_length(2 + len(granted)) + packet_id + bytes(granted))
+        for topic, payload in self.retained.items():
+            if any(mqtt.topic_matches_sub(pattern, topic) for pattern in patterns):
+                session.writer.write(publish_packet(topic, payload, retain=True))
+
+    def unsubscribe(self, session, body):
+        position = 2
+        while position < len(body):
+            (length,) = LENGTH.unpack_from(body, position)
+            pattern = body[position + 2:position + 2 + length].decode()
+            if pattern in session.patterns:
+                session.patterns.remove(pattern)
+            position += 2 + length
+        session.writer.write(bytes([UNSUBACK << 4, 2]) + body[:2])
+
+    async def handle(self, reader, writer):
+        # Forward without waiting for Nagle's algorithm to fill segments
+        writer.get_extra_info('socket').setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        session = Session(writer)
+        self.sessions.append(session)
+        try:
+            while True:
+                header, body = await read_packet(reader)
+                kind = header >> 4
+                if kind == PUBLISH:
+                    qos = (header >> 1) & 3
+                    (length,) = LENGTH.unpack_from(body)
+                    topic = body[2:2 + length].decode()
+                    payload = body[2 + length + (2 if qos else 0):]
+                    if qos == 1:
+                        writer.write(bytes([PUBACK << 4, 2]) + body[2 + length:4 + length])
+                    elif qos == 2:
+                        writer.write(bytes([PUBREC << 4, 2]) + body[2 + length:4 + length])
+                    self.route(topic, payload, bool(header & 1))
+                elif kind == PUBREL:
+                    writer.write(bytes([PUBCOMP << 4, 2]) + body[:2])
+                elif kind == CONNECT:
+                    writer.write(bytes([CONNACK << 4, 2, 0, 0]))
+                elif kind == SUBSCRIBE:
+                    self.subscribe(session, body)
+                elif kind == UNSUBSCRIBE:
+                    self.unsubscribe(session, body)
+                elif kind == PINGREQ:
+                    writer.write(bytes([PINGRESP << 4, 0]))
+                elif kind == DISCONNECT:
+                    break
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.sessions.remove(session)
+            writer.close()
+
+    async def serve(self, sock):
+        server = await asyncio.start_server(self.handle, sock=sock)
+        async with server:
+            await server.serve_forever()
+
+
+def run(sock):
+    try:
+        asyncio.run(Broker().serve(sock))
+    except KeyboardInterrupt:
+        pass
+
+
+def start(host='127.0.0.1'):
+    # Runs the broker in a child process; returns (process, port)
+    sock = socket.create_server((host, 0))
+    process = mp.get_context('fork').Process(target=run, args=(sock,), daemon=True)
+    process.start()
+    port = sock.getsockname()[1]
+    sock.close()
+    return process, port
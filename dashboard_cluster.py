@@ -0,0 +1,113 @@
+import argparse
+import logging
+import multiprocessing as mp
+import os
+import signal
+import socket
+import threading
+from werkzeug.serving import make_server
+
+import web_dashboard as dashboard
+from ingest_queue import IngestQueue, IngestWorker, POLICIES, INGEST_QUEUE_SIZE, INGEST_BATCH_SIZE
+from sensor_registry import load_registry
+from shared_state import SharedState, SharedSnapshots, SharedHistory
+
+logger = logging.getLogger(__name__)
+
+# Multi-process dashboard: one ingest process owns the MQTT subscription,
+# analytics and historian, and writes latest values and history into a
+# shared memory block (shared_state.py). N forked web workers serve
+# web_dashboard's Flask app from a shared listening socket, reading the API
+# data straight from shared memory, so request handling scales past one GIL
+# and never contends with ingest. Linux only (fork).
+#
+# Workers only see the registry's sensors for the plants given with
+# --plants. They have no WebSocket push (the page polls /api/sensor-data
+# with ETags) and no analytics state, ingest queue or metrics, so
+# /api/alarms, /api/analytics, /api/ingest-stats and /metrics return 404
+# there. With --metrics-port the ingest process serves the full app,
+# including those routes, on a port of its own.
+
+HTTP_HOST = '0.0.0.0'
+
+
+def serve_worker(number, sock, state, registry):
+    # Runs in a forked child: swap the dashboard's in-process state for
+    # read-only views of shared memory, then serve HTTP
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    dashboard.REGISTRY = registry
+    dashboard.snapshots = SharedSnapshots(state)
+    dashboard.history = SharedHistory(state)
+    dashboard.engine = None
+    dashboard.LIVE_PUSH = False
+    dashboard.SERVES_INGEST = False
+    server = make_server(HTTP_HOST, sock.getsockname()[1], dashboard.app, threaded=True, fd=sock.fileno())
+    logger.info(f"Web worker {number} (pid {os.getpid()}) serving")
+    server.serve_forever()
+
+
+def seed_state(state):
+    # Copy what configure() reloaded from the historian into shared memory
+    seeded = 0
+    for slot in dashboard.router.sensor_slots():
+        samples = dashboard.history.slice(slot.key)
+        if samples is not None and len(samples[0]):
+            state.load(slot.key, *samples)
+            seeded += 1
+    state.commit()
+    return seeded
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Battery plant web dashboard (multi-process)")
+    dashboard.add_arguments(parser)
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Web worker processes")
+    parser.add_argument('--port', type=int, default=dashboard.DASHBOARD_PORT, help="HTTP port")
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help="Serve /metrics, /api/ingest-stats and the alarms API from the ingest process")
+    parser.add_argument('--plants', default=dashboard.DEFAULT_PLANT,
+                        help="Comma-separated plants kept in shared memory")
+    parser.add_argument('--queue-size', type=int, default=INGEST_QUEUE_SIZE,
+                        help="Maximum raw messages waiting for processing")
+    parser.add_argument('--overload-policy', choices=POLICIES, default=POLICIES[0],
+                        help="Drop the oldest queued message or block the MQTT thread when the queue is full")
+    parser.add_argument('--batch-size', type=int, default=INGEST_BATCH_SIZE,
+                        help="Maximum messages processed per batch")
+    args = parser.parse_args()
+
+    registry = load_registry(args.registry) if args.registry else dashboard.REGISTRY
+    plants = [plant.strip() for plant in args.plants.split(',') if plant.strip()]
+    state = SharedState.create(registry, plants, args.history_capacity)
+    logger.info(f"Shared state {state.name}: {len(state.keys)} sensors, "
+                f"{state.shm.size / 1e6:.1f} MB")
+
+    # Fork the workers before the ingest side starts any threads
+    sock = socket.create_server(('', args.port))
+    context = mp.get_context('fork')
+    workers = [context.Process(target=serve_worker, args=(number, sock, state, registry), daemon=True)
+               for number in range(args.workers)]
+    for worker in workers:
+        worker.start()
+    logger.info(f"Serving the dashboard on http://localhost:{args.port} with {len(workers)} workers")
+
+    try:
+        dashboard.configure(args)
+        dashboard.shared = state
+        logger.info(f"Seeded {seed_state(state)} sensors into shared memory")
+        dashboard.ingest = IngestQueue(args.queue_size, args.overload_policy, args.batch_size)
+        IngestWorker(dashboard.ingest, dashboard.process_batch).start()
+        dashboard.start_mqtt_client()
+        if args.metrics_port:
+            # After forking the workers, like every other ingest-side thread
+            metrics_server = make_server(HTTP_HOST, args.metrics_port, dashboard.app, threaded=True)
+            threading.Thread(target=metrics_server.serve_forever, name='metrics', daemon=True).start()
+            logger.info(f"Serving metrics and ingest stats on http://localhost:{args.metrics_port}")
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        logger.info("Stopping dashboard...")
+    finally:
+        for worker in workers:
+            worker.terminate()
+            worker.join()
+        state.close()
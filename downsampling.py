@@ -0,0 +1,63 @@
+import numpy as np
+
+# Vectorized reductions used to shrink history queries to a target number of
+# points before they are sent to the browser.
+
+METHOD_MINMAX = 'minmax'
+METHOD_LTTB = 'lttb'
+METHODS = (METHOD_MINMAX, METHOD_LTTB)
+
+
+def bucket_aggregate(timestamps, mins, maxs, sums, counts, start, end, num_buckets):
+    # Merge samples (or pre-aggregated rollup buckets) into num_buckets equal
+    # time buckets over [start, end]. Raw samples are passed with
+    # mins = maxs = sums = values and counts = 1. Timestamps must be sorted.
+    # Returns bucket start times, min, max, mean and count of non-empty buckets.
+    if len(timestamps) == 0 or num_buckets <= 0:
+        empty = np.empty(0)
+        return empty, empty, empty, empty, np.empty(0, dtype=np.int64)
+    width = max((end - start) / num_buckets, 1e-9)
+    index = np.floor((timestamps - start) / width).astype(np.int64)
+    np.clip(index, 0, num_buckets - 1, out=index)
+    # Sorted timestamps give sorted bucket indexes, so each bucket is a run
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(index)) + 1))
+    bucket_counts = np.add.reduceat(counts, starts)
+    bucket_sums = np.add.reduceat(sums, starts)
+    return (
+        start + index[starts] * width,
+        np.minimum.reduceat(mins, starts),
+        np.maximum.reduceat(maxs, starts),
+        bucket_sums / bucket_counts,
+        bucket_counts.astype(np.int64)
+    )
+
+
+def lttb(timestamps, values, threshold):
+    # Largest-Triangle-Three-Buckets: keeps the first and last points and, from
+    # each bucket in between, the point forming the largest triangle with the
+    # previously kept point and the average of the next bucket.
+    n = len(timestamps)
+    if threshold >= n or threshold < 3:
+        return timestamps, values
+
+    edges = np.floor(np.linspace(1, n - 1, threshold - 1)).astype(np.int64)
+    # Averages of every bucket up front; the next-bucket average of the last
+    # bucket is the final point
+    avg_t = np.add.reduceat(timestamps[1:n - 1], edges[:-1] - 1) / np.diff(edges)
+    avg_v = np.add.reduceat(values[1:n - 1], edges[:-1] - 1) / np.diff(edges)
+    avg_t = np.append(avg_t[1:], timestamps[n - 1])
+    avg_v = np.append(avg_v[1:], values[n - 1])
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for bucket in range(threshold - 2):
+        lo, hi = edges[bucket], edges[bucket + 1]
+        t = timestamps[lo:hi]
+        v = values[lo:hi]
+        area = np.abs((timestamps[a] - avg_t[bucket]) * (v - values[a])
+                      - (timestamps[a] - t) * (avg_v[bucket] - values[a]))
+        a = lo + int(np.argmax(area))
+        selected[bucket + 1] = a
+    return timestamps[selected], values[selected]
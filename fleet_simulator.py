@@ -0,0 +1,158 @@
+import paho.mqtt.client as mqtt
+import argparse
+import multiprocessing as mp
+import queue
+import time
+import pandas as pd
+import logging
+
+import payload_codec
+from sensor_simulator import (
+    BatteryPlantSimulator, TickScheduler, TOPIC_MODES, TOPIC_MODE_SENSOR,
+    MQTT_BROKER, MQTT_PORT, MQTT_CLIENT_ID
+)
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Fleet mode: N plants x M lines spread over worker processes. Each worker
+# owns one MQTT client and publishes a disjoint slice of
+# battery_plant/{plant_id}/... topics, where plant_id is "{plant}-{line}"
+# when more than one line per plant is simulated.
+
+
+def fleet_plant_ids(num_plants, num_lines=1):
+    if num_lines == 1:
+        return [str(plant) for plant in range(1, num_plants + 1)]
+    return [f"{plant}-{line}" for plant in range(1, num_plants + 1)
+            for line in range(1, num_lines + 1)]
+
+
+def split_plants(plant_ids, num_workers):
+    # Round-robin so workers get slices of equal size (+/- one plant)
+    slices = [plant_ids[i::num_workers] for i in range(num_workers)]
+    return [plant_slice for plant_slice in slices if plant_slice]
+
+
+def run_worker(worker_id, plant_ids, csv_file, rate, duration, report_interval, report_queue, stop_event,
+               encoding=payload_codec.ENCODING_JSON, topic_mode=TOPIC_MODE_SENSOR):
+    client = mqtt.Client(f"{MQTT_CLIENT_ID}_fleet_{worker_id}")
+    try:
+        data = pd.read_csv(csv_file)
+        simulators = []
+        for i, plant_id in enumerate(plant_ids):
+            simulator = BatteryPlantSimulator(plant_id, client=client, encoding=encoding, topic_mode=topic_mode)
+            if simulators:
+                simulator.share_data(simulators[0])
+            else:
+                simulator.data = data
+                simulator.prepare_fast_path()
+            # Stagger plants so they do not publish identical rows
+            simulator.current_index = (i * 97) % len(data)
+            simulators.append(simulator)
+
+        def on_connect(client, userdata, flags, rc):
+            if rc == 0:
+                logger.info(f"Worker {worker_id} connected to MQTT broker")
+                for simulator in simulators:
+                    simulator.publish_metadata()
+            else:
+                logger.error(f"Worker {worker_id} failed to connect to MQTT broker with code: {rc}")
+
+        client.on_connect = on_connect
+        client.connect(MQTT_BROKER, MQTT_PORT)
+        client.loop_start()
+
+        # One tick publishes one row for every plant in this worker
+        messages_per_tick = sum(simulator.messages_per_row() for simulator in simulators)
+        scheduler = TickScheduler(messages_per_tick / rate if rate > 0 else 0)
+        start = last_report = time.monotonic()
+        sent = reported = 0
+        while not stop_event.is_set():
+            for simulator in simulators:
+                sent += simulator.publish_rows(1)
+            now = time.monotonic()
+            if now - last_report >= report_interval:
+                report_queue.put((worker_id, len(simulators), sent - reported, now - last_report, scheduler.skipped))
+                reported, last_report = sent, now
+            if duration and now - start >= duration:
+                break
+            scheduler.wait()
+        now = time.monotonic()
+        if sent > reported:
+            report_queue.put((worker_id, len(simulators), sent - reported, now - last_report, scheduler.skipped))
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        logger.error(f"Error in fleet worker {worker_id}: {e}")
+    finally:
+        client.loop_stop()
+        client.disconnect()
+
+
+def run_fleet(num_plants, num_lines, num_workers, rate, csv_file='battery_plant_data.csv',
+              duration=None, report_interval=5.0, encoding=payload_codec.ENCODING_JSON,
+              topic_mode=TOPIC_MODE_SENSOR):
+    plant_slices = split_plants(fleet_plant_ids(num_plants, num_lines), num_workers)
+    total_plants = sum(len(plant_slice) for plant_slice in plant_slices)
+    report_queue = mp.Queue()
+    stop_event = mp.Event()
+    workers = []
+    for worker_id, plant_slice in enumerate(plant_slices):
+        # Split the aggregate target rate in proportion to each worker's plants
+        worker_rate = rate * len(plant_slice) / total_plants if rate > 0 else 0
+        worker = mp.Process(
+            target=run_worker,
+            args=(worker_id, plant_slice, csv_file, worker_rate, duration,
+                  report_interval, report_queue, stop_event, encoding, topic_mode),
+            daemon=True
+        )
+        worker.start()
+        workers.append(worker)
+    logger.info(f"Started {len(workers)} workers for {total_plants} plants, target {rate:.0f} msgs/sec")
+
+    totals = {}
+    start = time.monotonic()
+    try:
+        while any(worker.is_alive() for worker in workers) or not report_queue.empty():
+            try:
+                worker_id, plants, sent, elapsed, skipped = report_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            totals[worker_id] = totals.get(worker_id, 0) + sent
+            logger.info(f"Worker {worker_id} ({plants} plants): {sent / elapsed:.0f} msgs/sec, "
+                        f"{skipped} ticks skipped")
+    except KeyboardInterrupt:
+        logger.info("Stopping fleet simulator...")
+        stop_event.set()
+    for worker in workers:
+        worker.join()
+
+    elapsed = time.monotonic() - start
+    total_sent = sum(totals.values())
+    logger.info(f"Fleet published {total_sent} messages in {elapsed:.1f}s "
+                f"({total_sent / elapsed:.0f} msgs/sec aggregate)")
+    return totals
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Battery plant fleet simulator")
+    parser.add_argument('--plants', type=int, default=4, help="Number of plants")
+    parser.add_argument('--lines', type=int, default=1, help="Production lines per plant")
+    parser.add_argument('--workers', type=int, default=mp.cpu_count(), help="Worker processes")
+    parser.add_argument('--rate', type=float, default=1000, help="Target aggregate msgs/sec (0 = unthrottled)")
+    parser.add_argument('--duration', type=float, default=None, help="Stop after this many seconds")
+    parser.add_argument('--report-interval', type=float, default=5.0, help="Seconds between rate reports")
+    parser.add_argument('--csv', default='battery_plant_data.csv', help="CSV file with sensor data")
+    parser.add_argument('--encoding', choices=[payload_codec.ENCODING_JSON, payload_codec.ENCODING_BINARY],
+                        default=payload_codec.ENCODING_JSON, help="Payload encoding")
+    parser.add_argument('--topic-mode', choices=TOPIC_MODES, default=TOPIC_MODE_SENSOR,
+                        help="Publish per-sensor topics, per-process bundles, or both")
+    args = parser.parse_args()
+
+    run_fleet(args.plants, args.lines, args.workers, args.rate, args.csv, args.duration, args.report_interval,
+              args.encoding, args.topic_mode)
@@ -0,0 +1,244 @@
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Append-only on-disk historian. Samples are stored per sensor in hourly
+# segment files of fixed-width records (payload_codec.BINARY_STRUCT, i.e.
+# int64 epoch nanoseconds + float64 value):
+#
+#   {root}/{plant}/{process}/{sensor}/{YYYYMMDDHH}.seg   (UTC hour)
+#   {root}/{plant}/{process}/{sensor}/meta.json          {"unit": ...}
+#
+# Writes are buffered and flushed by a background thread with one fsync per
+# touched segment per flush. Reads memory-map segments, so range scans do not
+# copy data until the caller asks for it.
+#
+# Samples arrive in arrival order, not time order (replay, fleets, reconnect
+# bursts). Each write is sorted; a write that starts before the end of its
+# segment leaves a {YYYYMMDDHH}.seg.unsorted marker, and scans of marked
+# segments select records with a mask instead of a binary search.
+
+HISTORIAN_DIR = 'historian_data'
+FLUSH_INTERVAL = 1.0
+
+RECORD_DTYPE = np.dtype([('timestamp_ns', '<i8'), ('value', '<f8')])
+NS_PER_HOUR = 3600 * 10**9
+
+SEGMENT_SUFFIX = '.seg'
+UNSORTED_SUFFIX = '.unsorted'
+META_FILE = 'meta.json'
+
+
+def segment_name(hour):
+    return datetime.fromtimestamp(hour * 3600, timezone.utc).strftime('%Y%m%d%H') + SEGMENT_SUFFIX
+
+
+def segment_hour(name):
+    stamp = datetime.strptime(name[:-len(SEGMENT_SUFFIX)], '%Y%m%d%H').replace(tzinfo=timezone.utc)
+    return int(stamp.timestamp()) // 3600
+
+
+class Historian:
+    def __init__(self, root=HISTORIAN_DIR, flush_interval=FLUSH_INTERVAL):
+        self.root = root
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.pending = []
+        self.units = {}
+        self.pending_units = {}
+        # Open segment per sensor: key -> [hour, file, last timestamp written]
+        self.files = {}
+        self.running = False
+        self.thread = None
+
+    def sensor_dir(self, key):
+        directory = os.path.join(self.root, *key)
+        # Keys come from topics; topic_router refuses names that would escape the root
+        root = os.path.abspath(self.root)
+        assert os.path.commonpath([root, os.path.abspath(directory)]) == root and \
+            os.path.abspath(directory) != root, f"Historian key {key!r} escapes {self.root}"
+        return directory
+
+    def append(self, key, timestamp_ns, value, unit=None):
+        # key is a tuple of path parts, e.g. (plant, process, sensor)
+        with self.lock:
+            self.pending.append((key, timestamp_ns, value))
+            if unit is not None and self.units.get(key) != unit:
+                self.units[key] = unit
+                self.pending_units[key] = unit
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, []
+            units, self.pending_units = self.pending_units, {}
+        if not pending and not units:
+            return 0
+
+        # Group records per sensor and hour, then write each group in one call
+        groups = {}
+        for key, timestamp_ns, value in pending:
+            groups.setdefault((key, timestamp_ns // NS_PER_HOUR), []).append((timestamp_ns, value))
+        # In hour order, so a batch across an hour boundary rotates forward;
+        # segment_file syncs the segments it closes, the rest are synced here
+        touched = {}
+        for (key, hour), records in sorted(groups.items(), key=lambda item: item[0][1]):
+            records = np.array(records, dtype=RECORD_DTYPE)
+            records.sort(order='timestamp_ns', kind='stable')
+            current = self.segment_file(key, hour)
+            _, segment, last_ns = current
+            first_ns, end_ns = int(records['timestamp_ns'][0]), int(records['timestamp_ns'][-1])
+            if last_ns is not None and first_ns < last_ns:
+                # Marked before writing, so a crash cannot leave an unmarked unsorted segment
+                open(self.segment_path(key, hour) + UNSORTED_SUFFIX, 'a').close()
+            segment.write(records.tobytes())
+            current[2] = end_ns if last_ns is None else max(last_ns, end_ns)
+            touched[key] = segment
+        for segment in touched.values():
+            self.sync(segment)
+
+        for key, unit in units.items():
+            os.makedirs(self.sensor_dir(key), exist_ok=True)
+            with open(os.path.join(self.sensor_dir(key), META_FILE), 'w') as f:
+                json.dump({"unit": unit}, f)
+        return len(pending)
+
+    def segment_path(self, key, hour):
+        return os.path.join(self.sensor_dir(key), segment_name(hour))
+
+    def segment_file(self, key, hour):
+        current = self.files.get(key)
+        if current is not None and current[0] == hour:
+            return current
+        if current is not None:
+            self.sync(current[1])
+            current[1].close()
+        os.makedirs(self.sensor_dir(key), exist_ok=True)
+        path = self.segment_path(key, hour)
+        segment = open(path, 'ab')
+        # Drop a partially written trailing record, so appends stay aligned,
+        # and pick up the last timestamp of a reopened segment
+        num_records = os.path.getsize(path) // RECORD_DTYPE.itemsize
+        segment.truncate(num_records * RECORD_DTYPE.itemsize)
+        last_ns = None
+        if num_records:
+            last_ns = int(np.fromfile(path, dtype=RECORD_DTYPE, count=1,
+                                      offset=(num_records - 1) * RECORD_DTYPE.itemsize)['timestamp_ns'][0])
+        self.files[key] = current = [hour, segment, last_ns]
+        return current
+
+    def sync(self, segment):
+        segment.flush()
+        os.fsync(segment.fileno())
+
+    def run(self):
+        while self.running:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error flushing historian: {e}")
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name='historian', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+        self.flush()
+        for _, segment, _ in self.files.values():
+            segment.close()
+        self.files = {}
+
+    def segments(self, key, start_ns=None, end_ns=None):
+        # (memory-mapped record array, sorted) of the segments overlapping [start_ns, end_ns]
+        directory = self.sensor_dir(key)
+        if not os.path.isdir(directory):
+            return []
+        start_hour = None if start_ns is None else start_ns // NS_PER_HOUR
+        end_hour = None if end_ns is None else end_ns // NS_PER_HOUR
+        mapped = []
+        for name in sorted(os.listdir(directory)):
+            if not name.endswith(SEGMENT_SUFFIX):
+                continue
+            hour = segment_hour(name)
+            if (start_hour is not None and hour < start_hour) or (end_hour is not None and hour > end_hour):
+                continue
+            path = os.path.join(directory, name)
+            # Ignore a partially written trailing record
+            num_records = os.path.getsize(path) // RECORD_DTYPE.itemsize
+            if num_records:
+                mapped.append((np.memmap(path, dtype=RECORD_DTYPE, mode='r', shape=(num_records,)),
+                               not os.path.exists(path + UNSORTED_SUFFIX)))
+        return mapped
+
+    def scan(self, key, start_ns=None, end_ns=None):
+        # Yields zero-copy memory-mapped views of the records in range; copies
+        # for unsorted segments, in time order
+        for records, in_order in self.segments(key, start_ns, end_ns):
+            timestamps = records['timestamp_ns']
+            if not in_order:
+                selected = np.ones(len(records), dtype=bool)
+                if start_ns is not None:
+                    selected &= timestamps >= start_ns
+                if end_ns is not None:
+                    selected &= timestamps <= end_ns
+                records = records[selected]
+                if len(records):
+                    yield records[np.argsort(records['timestamp_ns'], kind='stable')]
+                continue
+            i = 0 if start_ns is None else np.searchsorted(timestamps, start_ns, 'left')
+            j = len(records) if end_ns is None else np.searchsorted(timestamps, end_ns, 'right')
+            if i < j:
+                yield records[i:j]
+
+    def read(self, key, start_ns=None, end_ns=None):
+        # Records in range as (timestamps_ns, values) arrays
+        views = list(self.scan(key, start_ns, end_ns))
+        if not views:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        records = np.concatenate(views)
+        return records['timestamp_ns'], records['value']
+
+    def unit(self, key):
+        try:
+            with open(os.path.join(self.sensor_dir(key), META_FILE)) as f:
+                return json.load(f).get('unit', '')
+        except (OSError, ValueError):
+            return ''
+
+    def keys(self, depth=3):
+        # Sensor keys with data on disk, e.g. (plant, process, sensor)
+        found = []
+        if not os.path.isdir(self.root):
+            return found
+        for dirpath, dirnames, _ in os.walk(self.root):
+            relative = os.path.relpath(dirpath, self.root)
+            parts = () if relative == '.' else tuple(relative.split(os.sep))
+            if len(parts) == depth:
+                found.append(parts)
+                dirnames.clear()
+        return sorted(found)
+
+    def load_recent(self, history, seconds, keys=None):
+        # Refill history from disk for `keys` (default: everything on disk).
+        # Returns {key: (timestamp_ns, value, unit)} with each sensor's latest sample.
+        start_ns = time.time_ns() - int(seconds * 1e9)
+        latest = {}
+        for key in (self.keys() if keys is None else keys):
+            timestamps_ns, values = self.read(key, start_ns)
+            if not len(values):
+                continue
+            history.register(key)
+            history.load(key, timestamps_ns / 1e9, values)
+            self.units[key] = unit = self.unit(key)
+            latest[key] = (int(timestamps_ns[-1]), float(values[-1]), unit)
+        return latest
@@ -0,0 +1,346 @@
+import threading
+import numpy as np
+
+import downsampling
+
+# Samples kept per sensor (one hour of 1-second data)
+HISTORY_CAPACITY = 3600
+
+# Rollup resolution in seconds -> number of buckets kept
+# (1 minute buckets for a week, 1 hour buckets for a year)
+ROLLUP_RESOLUTIONS = {
+    60: 7 * 24 * 60,
+    3600: 365 * 24
+}
+# Buckets allocated when a rollup is created; the arrays double as buckets
+# close, up to the rollup's capacity
+ROLLUP_INITIAL_BUCKETS = 64
+
+
+class RingBuffer:
+    # Fixed-capacity history of one sensor in two preallocated arrays.
+    # Timestamps are epoch seconds and kept in order so that time slices can
+    # be found by binary search; a late sample (QoS 1 redelivery, a spool
+    # replay, a second publisher) is inserted in order.
+    __slots__ = ('timestamps', 'values', 'capacity', 'head', 'count')
+    ARRAYS = ('timestamps', 'values')
+
+    def __init__(self, capacity=HISTORY_CAPACITY, allocate=None):
+        # `allocate` entries up front (default: all), see reserve()
+        size = capacity if allocate is None else min(capacity, allocate)
+        self.timestamps = np.zeros(size, dtype=np.float64)
+        self.values = np.zeros(size, dtype=np.float64)
+        self.capacity = capacity
+        self.head = 0
+        self.count = 0
+
+    def append(self, timestamp, value):
+        head = self.head
+        if self.count and timestamp < self.timestamps[head - 1]:
+            self.insert_entry({'timestamps': timestamp, 'values': value})
+            return
+        self.timestamps[head] = timestamp
+        self.values[head] = value
+        head += 1
+        self.head = 0 if head == self.capacity else head
+        if self.count < self.capacity:
+            self.count += 1
+
+    def clear(self):
+        self.head = 0
+        self.count = 0
+
+    def insert_entry(self, fields):
+        # Insert an entry older than the newest in time order, rewriting the
+        # contents in O(capacity) (late samples are rare); when the buffer is
+        # full, one older than everything kept is dropped
+        entries = {name: gather(getattr(self, name), self.segments()) for name in self.ARRAYS}
+        i = np.searchsorted(entries['timestamps'], fields['timestamps'], 'right')
+        if i == 0 and self.count == self.capacity:
+            return
+        self.store_entries({name: np.insert(array, i, fields[name]) for name, array in entries.items()})
+
+    def store_entries(self, entries):
+        # Replace the contents with sorted entries, keeping the newest
+        n = min(len(entries['timestamps']), self.capacity)
+        self.reserve(n)
+        for name, array in entries.items():
+            getattr(self, name)[:n] = array[len(array) - n:]
+        self.count = n
+        self.head = 0 if n == self.capacity else n
+
+    def reserve(self, size):
+        # Grow the arrays to hold at least `size` entries, up to capacity.
+        # Only needed before the buffer first wraps, while entries are [0, count)
+        allocated = len(self.timestamps)
+        if size <= allocated:
+            return
+        size = min(self.capacity, max(size, 2 * allocated))
+        for name in self.ARRAYS:
+            array = getattr(self, name)
+            grown = np.zeros(size, dtype=array.dtype)
+            grown[:allocated] = array
+            setattr(self, name, grown)
+
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in self.ARRAYS)
+
+    def load(self, timestamps, values):
+        # Replace the contents with sorted arrays, keeping the newest samples
+        self.store_entries({'timestamps': timestamps, 'values': values})
+
+    def segments(self):
+        # Contents in chronological order as at most two contiguous index ranges
+        if self.count < self.capacity:
+            return [(0, self.count)]
+        return [(self.head, self.capacity), (0, self.head)]
+
+    def latest(self):
+        if not self.count:
+            return None
+        return self.timestamps[self.head - 1], self.values[self.head - 1]
+
+    def slice_ranges(self, start=None, end=None):
+        # Index ranges holding start <= timestamp <= end, in chronological order
+        ranges = []
+        for lo, hi in self.segments():
+            segment = self.timestamps[lo:hi]
+            i = 0 if start is None else np.searchsorted(segment, start, 'left')
+            j = hi - lo if end is None else np.searchsorted(segment, end, 'right')
+            if i < j:
+                ranges.append((lo + i, lo + j))
+        return ranges
+
+    def slice(self, start=None, end=None):
+        # Samples with start <= timestamp <= end, as copies of the stored arrays
+        return tuple(gather(array, self.slice_ranges(start, end)) for array in (self.timestamps, self.values))
+
+
+class RollupBuffer(RingBuffer):
+    # Ring of fixed-width time buckets (min, max, mean, count), filled
+    # incrementally: each sample updates the open bucket in O(1), and the
+    # bucket is stored once a sample for a later bucket arrives. The arrays
+    # start small and grow as buckets close (see reserve()).
+    __slots__ = ('resolution', 'mins', 'maxs', 'counts',
+                 'open_start', 'open_min', 'open_max', 'open_sum', 'open_count')
+    ARRAYS = RingBuffer.ARRAYS + ('mins', 'maxs', 'counts')
+
+    def __init__(self, resolution, capacity, allocate=ROLLUP_INITIAL_BUCKETS):
+        super().__init__(capacity, allocate)
+        size = len(self.timestamps)
+        self.resolution = resolution
+        self.mins = np.zeros(size, dtype=np.float64)
+        self.maxs = np.zeros(size, dtype=np.float64)
+        self.counts = np.zeros(size, dtype=np.int64)
+        self.open_start = None
+
+    def add(self, timestamp, value):
+        bucket_start = timestamp - timestamp % self.resolution
+        if bucket_start == self.open_start:
+            if value < self.open_min:
+                self.open_min = value
+            if value > self.open_max:
+                self.open_max = value
+            self.open_sum += value
+            self.open_count += 1
+            return
+        if self.open_start is not None:
+            if bucket_start < self.open_start:
+                self.add_late(bucket_start, value)
+                return
+            self.close_bucket()
+        self.open_start = bucket_start
+        self.open_min = self.open_max = self.open_sum = value
+        self.open_count = 1
+
+    def add_late(self, bucket_start, value):
+        # A sample for a bucket that is already closed: update it, or insert
+        # a new bucket if none was stored for that time
+        ranges = self.slice_ranges(bucket_start, bucket_start)
+        if not ranges:
+            self.insert_entry({'timestamps': bucket_start, 'values': value, 'mins': value, 'maxs': value,
+                               'counts': 1})
+            return
+        i = ranges[0][0]
+        count = self.counts[i]
+        self.values[i] = (self.values[i] * count + value) / (count + 1)
+        self.counts[i] = count + 1
+        if value < self.mins[i]:
+            self.mins[i] = value
+        if value > self.maxs[i]:
+            self.maxs[i] = value
+
+    def close_bucket(self):
+        head = self.head
+        if head == len(self.timestamps):
+            # Not wrapped yet (head wraps to 0 at capacity) and out of room
+            self.reserve(head + 1)
+        self.mins[head] = self.open_min
+        self.maxs[head] = self.open_max
+        self.counts[head] = self.open_count
+        self.append(self.open_start, self.open_sum / self.open_count)
+
+    def clear(self):
+        super().clear()
+        self.open_start = None
+
+    def load(self, timestamps, values):
+        # Rebuild the buckets from sorted samples in one vectorized pass; the
+        # newest bucket stays open for further samples
+        self.clear()
+        if not len(timestamps):
+            return
+        bucket_starts = timestamps - timestamps % self.resolution
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(bucket_starts)) + 1))
+        mins = np.minimum.reduceat(values, starts)
+        maxs = np.maximum.reduceat(values, starts)
+        sums = np.add.reduceat(values, starts)
+        counts = np.diff(np.append(starts, len(values)))
+        closed = len(starts) - 1
+        n = min(closed, self.capacity)
+        self.reserve(n)
+        keep = slice(closed - n, closed)
+        self.timestamps[:n] = bucket_starts[starts][keep]
+        self.values[:n] = (sums / counts)[keep]
+        self.mins[:n] = mins[keep]
+        self.maxs[:n] = maxs[keep]
+        self.counts[:n] = counts[keep]
+        self.count = n
+        self.head = 0 if n == self.capacity else n
+        self.open_start = bucket_starts[starts[-1]]
+        self.open_min = mins[-1]
+        self.open_max = maxs[-1]
+        self.open_sum = sums[-1]
+        self.open_count = int(counts[-1])
+
+    def slice_stats(self, start=None, end=None):
+        # (bucket starts, mins, maxs, sums, counts), including the open bucket
+        # Buckets are keyed by start time, so include the one straddling `start`
+        ranges = self.slice_ranges(None if start is None else start - self.resolution + 1e-6, end)
+        timestamps = gather(self.timestamps, ranges)
+        counts = gather(self.counts, ranges)
+        stats = [timestamps, gather(self.mins, ranges), gather(self.maxs, ranges),
+                 gather(self.values, ranges) * counts, counts]
+        if self.open_start is not None and (start is None or self.open_start + self.resolution > start) \
+                and (end is None or self.open_start <= end):
+            extra = (self.open_start, self.open_min, self.open_max, self.open_sum, self.open_count)
+            stats = [np.append(array, value) for array, value in zip(stats, extra)]
+        return tuple(stats)
+
+
+def gather(array, ranges):
+    if not ranges:
+        return np.empty(0, dtype=array.dtype)
+    return np.concatenate([array[lo:hi] for lo, hi in ranges])
+
+
+class HistoryStore:
+    # Ring buffers and rollups per sensor key (e.g. (plant, process, sensor)).
+    # Each sensor's raw buffer is allocated in full when it is registered; its
+    # rollups grow with the time covered, up to a fixed size per sensor
+    # (see sensor_bytes()).
+    def __init__(self, keys=(), capacity=HISTORY_CAPACITY, rollup_resolutions=ROLLUP_RESOLUTIONS):
+        self.capacity = capacity
+        self.rollup_resolutions = dict(sorted(rollup_resolutions.items()))
+        self.lock = threading.Lock()
+        self.buffers = {}
+        self.rollups = {}
+        for key in keys:
+            self.register(key)
+
+    def register(self, key):
+        if key in self.buffers:
+            return
+        # Coarsest resolution first, the order downsample() searches them in
+        rollups = [RollupBuffer(resolution, buckets)
+                   for resolution, buckets in reversed(self.rollup_resolutions.items())]
+        with self.lock:
+            self.rollups[key] = rollups
+            self.buffers[key] = RingBuffer(self.capacity)
+
+    def append(self, key, timestamp, value):
+        buffer = self.buffers.get(key)
+        if buffer is None:
+            return
+        with self.lock:
+            buffer.append(timestamp, value)
+            for rollup in self.rollups[key]:
+                rollup.add(timestamp, value)
+
+    def load(self, key, timestamps, values):
+        # Bulk-load sorted samples for one sensor, e.g. from the historian at startup
+        buffer = self.buffers.get(key)
+        if buffer is None:
+            return
+        with self.lock:
+            buffer.load(timestamps, values)
+            for rollup in self.rollups[key]:
+                rollup.load(timestamps, values)
+
+    def slice(self, key, start=None, end=None):
+        buffer = self.buffers.get(key)
+        if buffer is None:
+            return None
+        with self.lock:
+            return buffer.slice(start, end)
+
+    def downsample(self, key, start=None, end=None, points=500, method=downsampling.METHOD_MINMAX):
+        # Reduce [start, end] to about `points` points. Uses the coarsest
+        # rollup whose buckets still fit the requested resolution, so long
+        # ranges never scan raw samples.
+        buffer = self.buffers.get(key)
+        if buffer is None:
+            return None
+        with self.lock:
+            span_start, span_end = start, end
+            if span_start is None or span_end is None:
+                first, last = self.bounds(key)
+                span_start = first if span_start is None else span_start
+                span_end = last if span_end is None else span_end
+            width = (span_end - span_start) / points if span_start is not None and span_end is not None else 0
+            source = next((rollup for rollup in self.rollups[key] if rollup.resolution <= width), None)
+            if source is None:
+                timestamps, values = buffer.slice(start, end)
+                mins = maxs = sums = values
+                counts = np.ones(len(values), dtype=np.int64)
+                resolution = 0
+            else:
+                timestamps, mins, maxs, sums, counts = source.slice_stats(start, end)
+                values = sums / counts if len(counts) else sums
+                resolution = source.resolution
+
+        result = {'method': method, 'resolution': resolution}
+        if method == downsampling.METHOD_LTTB:
+            timestamps, values = downsampling.lttb(timestamps, values, points)
+            result.update(timestamps=timestamps.tolist(), values=values.tolist())
+            return result
+        if span_start is None:
+            span_start = span_end = 0
+        timestamps, mins, maxs, means, counts = downsampling.bucket_aggregate(
+            timestamps, mins, maxs, sums, counts, span_start, span_end, points)
+        result.update(timestamps=timestamps.tolist(), min=mins.tolist(), max=maxs.tolist(),
+                      mean=means.tolist(), count=counts.tolist())
+        return result
+
+    def bounds(self, key):
+        # Oldest and newest timestamp held for a sensor, across raw samples and rollups
+        candidates = [self.buffers[key]] + self.rollups[key]
+        first = last = None
+        for buffer in candidates:
+            if not buffer.count:
+                continue
+            lo, _ = buffer.segments()[0]
+            oldest, newest = buffer.timestamps[lo], buffer.latest()[0]
+            first = oldest if first is None else min(first, oldest)
+            last = newest if last is None else max(last, newest)
+        return first, last
+
+    def sensor_bytes(self):
+        # Upper bound per sensor: 16 bytes per raw sample, 40 bytes per rollup bucket
+        return self.capacity * 16 + sum(self.rollup_resolutions.values()) * 40
+
+    def memory_bytes(self):
+        # Currently allocated
+        with self.lock:
+            return sum(buffer.nbytes() for buffer in self.buffers.values()) + \
+                sum(rollup.nbytes() for rollups in self.rollups.values() for rollup in rollups)
@@ -0,0 +1,121 @@
+import collections
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Bounded hand-off between paho's network thread and message processing.
+# The MQTT callback only enqueues raw (topic, payload, recv_ts) tuples; a
+# worker thread drains them in batches so slow processing never stalls
+# socket reads.
+
+POLICY_DROP_OLDEST = 'drop-oldest'
+POLICY_BLOCK = 'block'
+POLICIES = (POLICY_DROP_OLDEST, POLICY_BLOCK)
+
+INGEST_QUEUE_SIZE = 10000
+INGEST_BATCH_SIZE = 500
+
+
+class IngestQueue:
+    def __init__(self, maxsize=INGEST_QUEUE_SIZE, policy=POLICY_DROP_OLDEST, batch_size=INGEST_BATCH_SIZE):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown overload policy: {policy}")
+        self.maxsize = maxsize
+        self.policy = policy
+        self.batch_size = batch_size
+        self.items = collections.deque()
+        self.lock = threading.Lock()
+        self.not_empty = threading.Condition(self.lock)
+        self.not_full = threading.Condition(self.lock)
+        # Counters
+        self.enqueued = 0
+        self.dropped = 0
+        self.blocked = 0
+        self.batches = 0
+        self.processed = 0
+        self.max_depth = 0
+        self.max_batch = 0
+        self.max_wait = 0.0
+
+    def put(self, item):
+        with self.lock:
+            if len(self.items) >= self.maxsize:
+                if self.policy == POLICY_BLOCK:
+                    self.blocked += 1
+                    while len(self.items) >= self.maxsize:
+                        self.not_full.wait()
+                else:
+                    self.items.popleft()
+                    self.dropped += 1
+            self.items.append(item)
+            self.enqueued += 1
+            if len(self.items) > self.max_depth:
+                self.max_depth = len(self.items)
+            self.not_empty.notify()
+
+    def get_batch(self, timeout=None):
+        # Up to batch_size items, waiting at most `timeout` for the first one
+        with self.lock:
+            if not self.items:
+                self.not_empty.wait(timeout)
+            count = min(len(self.items), self.batch_size)
+            batch = [self.items.popleft() for _ in range(count)]
+            if batch:
+                self.batches += 1
+                self.processed += count
+                if count > self.max_batch:
+                    self.max_batch = count
+                self.not_full.notify_all()
+            return batch
+
+    def stats(self):
+        with self.lock:
+            return {
+                'depth': len(self.items),
+                'capacity': self.maxsize,
+                'policy': self.policy,
+                'enqueued': self.enqueued,
+                'dropped': self.dropped,
+                'blocked': self.blocked,
+                'processed': self.processed,
+                'batches': self.batches,
+                'avg_batch': self.processed / self.batches if self.batches else 0.0,
+                'max_batch': self.max_batch,
+                'max_depth': self.max_depth,
+                'max_wait': self.max_wait
+            }
+
+
+class IngestWorker:
+    # Drains an IngestQueue into handler(batch) on a background thread
+    def __init__(self, ingest, handler):
+        self.ingest = ingest
+        self.handler = handler
+        self.running = False
+        self.thread = None
+
+    def run(self):
+        while self.running:
+            batch = self.ingest.get_batch(timeout=0.5)
+            if not batch:
+                continue
+            # Time the oldest message of the batch spent queued
+            wait = time.time() - batch[0][2]
+            if wait > self.ingest.max_wait:
+                self.ingest.max_wait = wait
+            try:
+                self.handler(batch)
+            except Exception as e:
+                logger.error(f"Error processing ingest batch: {e}")
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name='ingest', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
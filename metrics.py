@@ -0,0 +1,235 @@
+import bisect
+import logging
+import math
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Low-overhead runtime metrics in the Prometheus text format. Counters and
+# histograms are plain attribute updates with no locks: every series is
+# written by a single thread (paho's network thread, the ingest worker, the
+# publishing loop), and a scrape reads whatever values are current. Callback
+# metrics read counters that other components already keep (queue depth,
+# in-flight messages) only when scraped, so they cost nothing in between.
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+METRICS_PORT = 9108
+
+# Default histogram bucket upper bounds, in seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0)
+FAST_BUCKETS = (1e-6, 2e-6, 5e-6, 1e-5, 2e-5, 5e-5, 1e-4, 2e-4, 5e-4, 1e-3, 5e-3, 0.01)
+
+
+class CounterValue:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class HistogramValue:
+    __slots__ = ('buckets', 'counts', 'count', 'sum', 'max')
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        # One extra bucket for values above the last bound
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-th quantile
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return self.max
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'mean': self.sum / self.count if self.count else 0.0,
+            'p50': self.quantile(0.5),
+            'p99': self.quantile(0.99),
+            'max': self.max,
+            'buckets': dict(zip([str(bound) for bound in self.buckets] + ['+Inf'], self.counts))
+        }
+
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        # label values tuple -> series
+        self.series = {}
+
+    def new_series(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        series = self.series.get(values)
+        if series is None:
+            # setdefault keeps the first series if two threads race here
+            series = self.series.setdefault(values, self.new_series())
+        return series
+
+    def samples(self):
+        # [(name suffix, {label: value}, value)]
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, name, help, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self.value = None if labelnames else self.labels()
+
+    def new_series(self):
+        return CounterValue()
+
+    def inc(self, amount=1):
+        self.value.value += amount
+
+    def samples(self):
+        return [('', dict(zip(self.labelnames, values)), series.value) for values, series in list(self.series.items())]
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, buckets=LATENCY_BUCKETS, labelnames=(), value=None):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+        if value is not None:
+            # Expose a histogram another component already keeps
+            self.series[()] = value
+        self.value = None if labelnames else self.labels()
+
+    def new_series(self):
+        return HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self.value.observe(value)
+
+    def samples(self):
+        samples = []
+        for values, series in list(self.series.items()):
+            labels = dict(zip(self.labelnames, values))
+            cumulative = 0
+            for bound, count in zip(series.buckets + (math.inf,), list(series.counts)):
+                cumulative += count
+                samples.append(('_bucket', dict(labels, le=format_value(bound)), cumulative))
+            samples.append(('_sum', labels, series.sum))
+            samples.append(('_count', labels, cumulative))
+        return samples
+
+
+class Callback(Metric):
+    # Values read from fn() at scrape time: a number, or {label values: number}
+    def __init__(self, name, help, fn, kind='gauge', labelnames=()):
+        super().__init__(name, help, labelnames)
+        self.fn = fn
+        self.kind = kind
+
+    def samples(self):
+        result = self.fn()
+        if not isinstance(result, dict):
+            result = {(): result}
+        return [('', dict(zip(self.labelnames, values)), value) for values, value in result.items()]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = {}
+
+    def add(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Duplicate metric: {metric.name}")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self.add(Counter(name, help, labelnames))
+
+    def histogram(self, name, help, buckets=LATENCY_BUCKETS, labelnames=(), value=None):
+        return self.add(Histogram(name, help, buckets, labelnames, value))
+
+    def gauge(self, name, help, fn, labelnames=()):
+        return self.add(Callback(name, help, fn, 'gauge', labelnames))
+
+    def counter_func(self, name, help, fn, labelnames=()):
+        return self.add(Callback(name, help, fn, 'counter', labelnames))
+
+    def render(self):
+        lines = []
+        for metric in list(self.metrics.values()):
+            try:
+                samples = metric.samples()
+            except Exception as e:
+                logger.error(f"Error collecting metric {metric.name}: {e}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for suffix, labels, value in samples:
+                if labels:
+                    label_text = ','.join(f'{key}="{escape_label(label)}"' for key, label in labels.items())
+                    lines.append(f"{metric.name}{suffix}{{{label_text}}} {format_value(value)}")
+                else:
+                    lines.append(f"{metric.name}{suffix} {format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+
+def start_exporter(registry, port=METRICS_PORT, host='0.0.0.0'):
+    # Serves registry.render() at /metrics from a daemon thread
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+    return server
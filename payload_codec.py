@@ -0,0 +1,147 @@
+import json
+import struct
+from datetime import datetime
+
+# Sensor payload encodings.
+#
+# JSON (default, legacy):
+#   {sensor topic}        {"timestamp": "<ISO 8601>", "value": <float>, "unit": "<unit>"}
+# Binary (opt-in):
+#   {sensor topic}/bin    16 bytes, little-endian int64 epoch nanoseconds + float64 value
+#   {sensor topic}/meta   retained JSON {"unit": ..., "encoding": ..., "layout": ...}
+#
+# Bundles carry all sensors of one process for one tick:
+#   {process topic}/bundle       {"timestamp": ..., "values": {sensor: value}, "units": {sensor: unit}}
+#   {process topic}/bundle/bin   int64 epoch nanoseconds + one float64 per sensor
+#   {process topic}/bundle/meta  retained JSON {"sensors": [...], "units": [...], ...}
+#
+# Subscribers pick the encoding from the topic suffix. Publishers using MQTT v5
+# also set the content type, so v5 subscribers can negotiate it without
+# relying on the topic path.
+
+BINARY_STRUCT = struct.Struct('<qd')
+BINARY_SUFFIX = 'bin'
+META_SUFFIX = 'meta'
+BUNDLE_SUFFIX = 'bundle'
+
+CONTENT_TYPE_JSON = 'application/json'
+CONTENT_TYPE_BINARY = 'application/x-uns-sample'
+
+ENCODING_JSON = 'json'
+ENCODING_BINARY = 'binary'
+ENCODING_META = 'meta'
+
+
+def binary_topic(topic):
+    return f"{topic}/{BINARY_SUFFIX}"
+
+
+def meta_topic(topic):
+    return f"{topic}/{META_SUFFIX}"
+
+
+def bundle_topic(topic_base, process):
+    return f"{topic_base}/process/{process}/{BUNDLE_SUFFIX}"
+
+
+def is_bundle_topic(topic):
+    return topic.endswith('/' + BUNDLE_SUFFIX)
+
+
+def split_topic(topic, content_type=None):
+    # Returns the sensor topic and the encoding of the payload published on `topic`
+    base, _, suffix = topic.rpartition('/')
+    if suffix == BINARY_SUFFIX:
+        return base, ENCODING_BINARY
+    if suffix == META_SUFFIX:
+        return base, ENCODING_META
+    if content_type == CONTENT_TYPE_BINARY:
+        return topic, ENCODING_BINARY
+    return topic, ENCODING_JSON
+
+
+def encode_json(timestamp, value, unit):
+    return json.dumps({
+        "timestamp": timestamp,
+        "value": value,
+        "unit": unit
+    })
+
+
+def decode_json(payload):
+    return json.loads(payload)
+
+
+def encode_binary(timestamp_ns, value):
+    return BINARY_STRUCT.pack(timestamp_ns, value)
+
+
+def decode_binary(payload):
+    # Returns (timestamp_ns, value)
+    return BINARY_STRUCT.unpack(payload)
+
+
+def encode_meta(unit):
+    return json.dumps({
+        "unit": unit,
+        "encoding": ENCODING_BINARY,
+        "layout": BINARY_STRUCT.format
+    })
+
+
+def decode_meta(payload):
+    return json.loads(payload)
+
+
+def bundle_struct(num_sensors):
+    return struct.Struct(f'<q{num_sensors}d')
+
+
+def encode_bundle_json(timestamp, sensors, values, units):
+    return json.dumps({
+        "timestamp": timestamp,
+        "values": dict(zip(sensors, values)),
+        "units": dict(zip(sensors, units))
+    })
+
+
+def encode_bundle_binary(timestamp_ns, values):
+    return bundle_struct(len(values)).pack(timestamp_ns, *values)
+
+
+def decode_bundle_binary(payload, bundle_layout):
+    # Returns (timestamp_ns, values) using the layout from the bundle metadata
+    timestamp_ns, *values = bundle_layout.unpack(payload)
+    return timestamp_ns, values
+
+
+def encode_bundle_meta(sensors, units):
+    return json.dumps({
+        "sensors": list(sensors),
+        "units": list(units),
+        "encoding": ENCODING_BINARY,
+        "layout": bundle_struct(len(sensors)).format
+    })
+
+
+def ns_to_iso(timestamp_ns):
+    return datetime.fromtimestamp(timestamp_ns / 1e9).isoformat()
+
+
+def iso_to_ns(timestamp):
+    return int(datetime.fromisoformat(timestamp).timestamp() * 1e9)
+
+
+def publish_properties(content_type):
+    # MQTT v5 PUBLISH properties carrying the payload content type
+    from paho.mqtt.properties import Properties
+    from paho.mqtt.packettypes import PacketTypes
+    properties = Properties(PacketTypes.PUBLISH)
+    properties.ContentType = content_type
+    return properties
+
+
+def message_content_type(msg):
+    # Content type of a received paho message, or None for MQTT 3.1.1
+    properties = getattr(msg, 'properties', None)
+    return getattr(properties, 'ContentType', None)
@@ -0,0 +1,301 @@
+import logging
+import os
+import struct
+import threading
+import time
+import paho.mqtt.client as mqtt
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Flow control between the simulator and paho. Every publish is tracked by
+# its mid until paho's on_publish fires (written to the socket for QoS 0,
+# acknowledged for QoS 1/2). At most max_inflight messages may be pending,
+# so a slow broker throttles the producer instead of growing paho's queue
+# without bound. Ack latencies go into a histogram. While the broker is
+# unreachable, messages are appended to an on-disk spool, which is drained
+# in order at a limited rate after reconnecting.
+
+MAX_INFLIGHT = 1000
+DRAIN_RATE = 5000
+SPOOL_MAX_BYTES = 512 * 1024 * 1024
+# Bytes read from the spool per batch (more if a single record is larger)
+SPOOL_READ_BYTES = 1024 * 1024
+# Longest the producer waits for a free in-flight slot before logging a stall
+STALL_TIMEOUT = 5.0
+
+
+class DiskSpool:
+    # Append-only file of (topic, payload, qos, retain) records, read back in order
+    RECORD = struct.Struct('<HIBB')
+
+    def __init__(self, path, max_bytes=SPOOL_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.file = open(path, 'a+b')
+        self.size = self.complete_size()
+        if self.size < os.path.getsize(path):
+            # The process died mid-append; later records must start at a record boundary
+            logger.warning(f"Truncating {os.path.getsize(path) - self.size} bytes of incomplete data from {path}")
+            self.file.truncate(self.size)
+        self.read_offset = 0
+        self.dropped = 0
+
+    def complete_size(self):
+        # Length of the file up to the end of its last complete, valid record
+        header = self.RECORD.size
+        self.file.seek(0)
+        data, start, offset = b'', 0, 0
+        while True:
+            chunk = self.file.read(SPOOL_READ_BYTES)
+            if not chunk:
+                return start + offset
+            # data holds the file from offset `start`, parsed up to `offset`
+            data = data[offset:] + chunk
+            start += offset
+            offset = 0
+            while offset + header <= len(data):
+                topic_len, payload_len, qos, retain = self.RECORD.unpack_from(data, offset)
+                end = offset + header + topic_len + payload_len
+                if end > len(data):
+                    break
+                if qos > 2 or retain > 1:
+                    return start + offset
+                try:
+                    data[offset + header:offset + header + topic_len].decode()
+                except UnicodeDecodeError:
+                    return start + offset
+                offset = end
+
+    def pending(self):
+        return self.size - self.read_offset
+
+    def append(self, topic, payload, qos=0, retain=False):
+        if isinstance(payload, str):
+            payload = payload.encode()
+        topic = topic.encode()
+        record = self.RECORD.pack(len(topic), len(payload), qos, retain) + topic + payload
+        with self.lock:
+            if self.size + len(record) > self.max_bytes:
+                self.dropped += 1
+                return False
+            self.file.write(record)
+            self.size += len(record)
+        return True
+
+    def record_size(self, topic, payload):
+        # Bytes a record read back as (topic, payload) takes in the file
+        return self.RECORD.size + len(topic.encode()) + len(payload)
+
+    def read(self, max_records):
+        # Up to max_records records from the read position; an empty list once drained
+        header = self.RECORD.size
+        with self.lock:
+            self.file.flush()
+            self.file.seek(self.read_offset)
+            data = self.file.read(min(self.pending(), SPOOL_READ_BYTES))
+            if len(data) >= header:
+                # At least the whole first record, however large
+                topic_len, payload_len, _, _ = self.RECORD.unpack_from(data)
+                first = min(self.pending(), header + topic_len + payload_len)
+                if first > len(data):
+                    data += self.file.read(first - len(data))
+        records = []
+        offset = 0
+        while len(records) < max_records and offset + header <= len(data):
+            topic_len, payload_len, qos, retain = self.RECORD.unpack_from(data, offset)
+            end = offset + header + topic_len + payload_len
+            if end > len(data):
+                break
+            topic = data[offset + header:offset + header + topic_len].decode()
+            records.append((topic, data[offset + header + topic_len:end], qos, bool(retain)))
+            offset = end
+        return records, offset
+
+    def consume(self, nbytes):
+        # Mark records as sent; returns True when the spool is empty and was reset
+        with self.lock:
+            self.read_offset += nbytes
+            if self.read_offset < self.size:
+                return False
+            self.file.truncate(0)
+            self.size = self.read_offset = 0
+            return True
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+class PublishController:
+    def __init__(self, client, max_inflight=MAX_INFLIGHT, spool=None, drain_rate=DRAIN_RATE, properties=None):
+        self.client = client
+        self.max_inflight = max_inflight
+        self.spool = spool
+        self.drain_rate = drain_rate
+        # Default MQTT v5 properties for spooled messages
+        self.properties = properties
+        self.lock = threading.Lock()
+        self.window = threading.Condition(self.lock)
+        # mid -> (send time, qos) of messages paho has not confirmed yet
+        self.pending = {}
+        # Confirmations that arrived before publish() returned the mid
+        self.early = set()
+        self.spooling = spool is not None and spool.pending() > 0
+        self.drain_thread = None
+        self.latency = metrics.HistogramValue(metrics.LATENCY_BUCKETS)
+        self.published = 0
+        self.acked = 0
+        self.spooled = 0
+        self.drained = 0
+        self.lost = 0
+        self.stalls = 0
+        self.max_pending = 0
+        client.on_publish = self.on_publish
+        client.on_disconnect = self.on_disconnect
+
+    def publish(self, topic, payload, qos=0, retain=False, properties=None, block=True):
+        with self.lock:
+            # While a backlog exists new messages queue behind it, keeping order
+            if self.spooling:
+                return self.to_spool(topic, payload, qos, retain)
+            if block and len(self.pending) >= self.max_inflight:
+                self.wait_for_window()
+            if not self.client.is_connected():
+                return self.to_spool(topic, payload, qos, retain)
+        info = self.client.publish(topic, payload, qos, retain, properties=properties)
+        # A QoS 1/2 message that lost the race with a disconnect stays queued in
+        # paho and is resent on reconnect, so only QoS 0 needs spooling here
+        if info.rc == mqtt.MQTT_ERR_NO_CONN and qos == 0:
+            with self.lock:
+                return self.to_spool(topic, payload, qos, retain)
+        if info.rc not in (mqtt.MQTT_ERR_SUCCESS, mqtt.MQTT_ERR_NO_CONN):
+            self.lost += 1
+            return False
+        self.track(info.mid, qos)
+        return True
+
+    def publish_nowait(self, topic, payload, qos=0, retain=False, properties=None):
+        # For paho's callbacks (on_connect, on_message): waiting for a window
+        # slot there would block the network thread that processes the acks,
+        # so these messages may exceed max_inflight
+        return self.publish(topic, payload, qos, retain, properties, block=False)
+
+    def track(self, mid, qos):
+        with self.lock:
+            self.published += 1
+            if mid in self.early:
+                self.early.discard(mid)
+                self.acked += 1
+                self.latency.observe(0.0)
+                return
+            self.pending[mid] = (time.perf_counter(), qos)
+            if len(self.pending) > self.max_pending:
+                self.max_pending = len(self.pending)
+
+    def wait_for_window(self):
+        # Called with the lock held; blocks the producer until acks free a slot
+        while len(self.pending) >= self.max_inflight:
+            if not self.window.wait(STALL_TIMEOUT):
+                self.stalls += 1
+                logger.warning(f"Publisher stalled: {len(self.pending)} messages waiting for acknowledgement")
+                if not self.client.is_connected():
+                    return
+
+    def to_spool(self, topic, payload, qos, retain):
+        # Called with the lock held
+        if self.spool is None:
+            self.lost += 1
+            return False
+        if not self.spooling:
+            self.spooling = True
+            logger.warning(f"Broker unavailable, spooling messages to {self.spool.path}")
+        if self.spool.append(topic, payload, qos, retain):
+            self.spooled += 1
+            return True
+        self.lost += 1
+        return False
+
+    def on_publish(self, client, userdata, mid):
+        now = time.perf_counter()
+        with self.lock:
+            sent = self.pending.pop(mid, None)
+            if sent is None:
+                self.early.add(mid)
+                return
+            self.acked += 1
+            self.latency.observe(now - sent[0])
+            self.window.notify()
+
+    def on_disconnect(self, client, userdata, rc):
+        # paho drops unsent QoS 0 messages on disconnect; QoS 1/2 are resent
+        with self.lock:
+            dropped = [mid for mid, (_, qos) in self.pending.items() if qos == 0]
+            for mid in dropped:
+                del self.pending[mid]
+            self.lost += len(dropped)
+            self.window.notify_all()
+        if rc != 0:
+            logger.warning(f"Disconnected from MQTT broker (rc={rc}), {len(dropped)} QoS 0 messages lost")
+
+    def on_connect(self):
+        # Called from the client's on_connect: drain anything spooled while offline
+        if self.spooling and (self.drain_thread is None or not self.drain_thread.is_alive()):
+            self.drain_thread = threading.Thread(target=self.drain, name='spool-drain', daemon=True)
+            self.drain_thread.start()
+
+    def drain(self):
+        batch_size = max(1, int(self.drain_rate / 10)) if self.drain_rate > 0 else 1000
+        logger.info(f"Draining {self.spool.pending()} spooled bytes at up to {self.drain_rate} msgs/sec")
+        while self.client.is_connected():
+            start = time.monotonic()
+            records, nbytes = self.spool.read(batch_size)
+            if not records:
+                # The last record ends past the end of the file (spool files are
+                # truncated to complete records when opened, so this is unexpected)
+                nbytes = self.spool.pending()
+                logger.warning(f"Discarding {nbytes} bytes of incomplete spool data")
+            sent_bytes = 0
+            for number, (topic, payload, qos, retain) in enumerate(records):
+                with self.lock:
+                    if len(self.pending) >= self.max_inflight:
+                        self.wait_for_window()
+                info = self.client.publish(topic, payload, qos, retain, properties=self.properties)
+                if info.rc != mqtt.MQTT_ERR_SUCCESS:
+                    # Lost the connection again; consume what was sent, so the
+                    # next drain resumes at this record instead of resending
+                    self.drained += number
+                    with self.lock:
+                        self.spool.consume(sent_bytes)
+                    return
+                self.track(info.mid, qos)
+                sent_bytes += self.spool.record_size(topic, payload)
+            self.drained += len(records)
+            # Switch back to direct publishing once the spool is empty
+            with self.lock:
+                if self.spool.consume(nbytes):
+                    self.spooling = False
+                    logger.info(f"Spool drained ({self.drained} messages)")
+                    return
+            if self.drain_rate > 0:
+                delay = len(records) / self.drain_rate - (time.monotonic() - start)
+                if delay > 0:
+                    time.sleep(delay)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'published': self.published,
+                'acked': self.acked,
+                'inflight': len(self.pending),
+                'max_inflight': self.max_inflight,
+                'max_pending': self.max_pending,
+                'stalls': self.stalls,
+                'lost': self.lost,
+                'spooled': self.spooled,
+                'drained': self.drained,
+                'spool_bytes': self.spool.pending() if self.spool is not None else 0,
+                'ack_latency': self.latency.as_dict()
+            }
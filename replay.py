@@ -0,0 +1,186 @@
+import argparse
+import time
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+import logging
+
+import payload_codec
+from sensor_simulator import (
+    BatteryPlantSimulator, REGISTRY, TOPIC_MODES, TOPIC_MODE_SENSOR, MQTT_BROKER, MQTT_PORT
+)
+from sensor_registry import load_registry
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Replay mode: publish a recorded CSV (or Parquet) file with its original
+# timestamps, keeping the original spacing between rows divided by a speed
+# factor (0 = as fast as possible). The file is streamed in chunks, so its
+# size is not limited by memory. Lag is how late each row went out compared
+# with its scheduled time.
+
+REPLAY_CHUNK_SIZE = 10_000
+REPORT_INTERVAL = 5.0
+
+NS_PER_MINUTE = 60 * 10**9
+EPOCH = datetime(1970, 1, 1)
+
+
+def local_to_epoch_ns(local_ns):
+    # Naive local wall-clock times (as ns since 1970-01-01) to epoch ns the way
+    # datetime.timestamp() converts them, so they round-trip with the
+    # simulator's ns_to_iso across DST changes: the local zone's rules at each
+    # time, the first occurrence of an ambiguous time, as payload_codec.iso_to_ns.
+    # UTC offsets change on whole minutes, so one lookup per distinct minute.
+    minutes, inverse = np.unique(local_ns // NS_PER_MINUTE, return_inverse=True)
+    offsets = np.array([int((EPOCH + timedelta(minutes=int(minute))).timestamp()) * 10**9
+                        - int(minute) * NS_PER_MINUTE for minute in minutes], dtype=np.int64)
+    return local_ns + offsets[inverse.reshape(-1)]
+
+
+def to_epoch_ns(column):
+    # Naive timestamps are local time, like the ISO timestamps the simulator publishes
+    stamps = pd.to_datetime(column)
+    if stamps.dt.tz is None:
+        return local_to_epoch_ns(stamps.to_numpy().astype('datetime64[ns]').astype(np.int64))
+    return stamps.dt.tz_convert(None).to_numpy().astype('datetime64[ns]').astype(np.int64)
+
+
+def read_chunks(path, columns, chunk_size=REPLAY_CHUNK_SIZE):
+    # Yields (timestamps_ns, values) arrays of at most chunk_size rows
+    if path.endswith('.parquet'):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Parquet replay requires pyarrow: pip install pyarrow")
+        batches = (batch.to_pandas() for batch in
+                   pq.ParquetFile(path).iter_batches(batch_size=chunk_size, columns=['timestamp'] + columns))
+    else:
+        batches = pd.read_csv(path, usecols=['timestamp'] + columns, chunksize=chunk_size)
+    for chunk in batches:
+        yield to_epoch_ns(chunk['timestamp']), np.ascontiguousarray(chunk[columns].to_numpy(dtype=np.float64))
+
+
+class ReplayStats:
+    __slots__ = ('rows', 'messages', 'late_rows', 'lag_sum', 'max_lag', 'last_lag', 'position_ns')
+
+    def __init__(self):
+        self.rows = 0
+        self.messages = 0
+        self.late_rows = 0
+        self.lag_sum = 0.0
+        self.max_lag = 0.0
+        self.last_lag = 0.0
+        self.position_ns = None
+
+    def as_dict(self):
+        return {
+            'rows': self.rows,
+            'messages': self.messages,
+            'late_rows': self.late_rows,
+            'mean_lag': self.lag_sum / self.rows if self.rows else 0.0,
+            'max_lag': self.max_lag,
+            'position': payload_codec.ns_to_iso(self.position_ns) if self.position_ns is not None else None
+        }
+
+
+class Replayer:
+    def __init__(self, simulator, path, speed=1.0, chunk_size=REPLAY_CHUNK_SIZE, restamp=False,
+                 report_interval=REPORT_INTERVAL):
+        self.simulator = simulator
+        self.path = path
+        self.speed = speed
+        self.chunk_size = chunk_size
+        # Publish with the replay wall-clock time instead of the recorded timestamps
+        self.restamp = restamp
+        self.report_interval = report_interval
+        self.stats = ReplayStats()
+
+    def run(self, max_rows=None):
+        simulator = self.simulator
+        if simulator.topic_table is None:
+            simulator.build_topic_table()
+        messages_per_row = simulator.messages_per_row()
+        stats = self.stats
+        speed = self.speed
+        start_wall = time.monotonic()
+        last_report = start_wall
+        first_ns = None
+        for timestamps_ns, values in read_chunks(self.path, simulator.registry.columns(), self.chunk_size):
+            for timestamp_ns, row in zip(timestamps_ns.tolist(), values.tolist()):
+                if first_ns is None:
+                    # The schedule starts when the first row is ready to go out
+                    first_ns = timestamp_ns
+                    start_wall = last_report = time.monotonic()
+                now = time.monotonic()
+                if speed > 0:
+                    due = start_wall + (timestamp_ns - first_ns) / 1e9 / speed
+                    if due > now:
+                        time.sleep(due - now)
+                        now = time.monotonic()
+                    else:
+                        stats.late_rows += 1
+                    lag = max(0.0, now - due)
+                    stats.lag_sum += lag
+                    stats.last_lag = lag
+                    if lag > stats.max_lag:
+                        stats.max_lag = lag
+                simulator.publish_row(row, time.time_ns() if self.restamp else timestamp_ns)
+                stats.rows += 1
+                stats.messages += messages_per_row
+                stats.position_ns = timestamp_ns
+                if now - last_report >= self.report_interval:
+                    self.report(now - start_wall)
+                    last_report = now
+                if max_rows is not None and stats.rows >= max_rows:
+                    return stats.as_dict()
+        self.report(time.monotonic() - start_wall)
+        return stats.as_dict()
+
+    def report(self, elapsed):
+        stats = self.stats
+        summary = stats.as_dict()
+        logger.info(f"Replayed {stats.rows} rows ({stats.messages / elapsed if elapsed else 0:.0f} msgs/sec), "
+                    f"at {summary['position']}, lag {stats.last_lag * 1000:.1f} ms "
+                    f"(mean {summary['mean_lag'] * 1000:.1f} ms, max {stats.max_lag * 1000:.1f} ms, "
+                    f"{stats.late_rows} rows late)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay recorded battery plant data over MQTT")
+    parser.add_argument('--file', default='battery_plant_data.csv', help="CSV or Parquet file to replay")
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help="Replay speed factor (60 = one recorded minute per second, 0 = as fast as possible)")
+    parser.add_argument('--chunk-size', type=int, default=REPLAY_CHUNK_SIZE, help="Rows read per chunk")
+    parser.add_argument('--restamp', action='store_true', help="Publish with the current time instead of the recorded timestamps")
+    parser.add_argument('--max-rows', type=int, default=None, help="Stop after this many rows")
+    parser.add_argument('--report-interval', type=float, default=REPORT_INTERVAL, help="Seconds between lag reports")
+    parser.add_argument('--plant-id', default='1', help="Plant id used in the published topics")
+    parser.add_argument('--encoding', choices=[payload_codec.ENCODING_JSON, payload_codec.ENCODING_BINARY],
+                        default=payload_codec.ENCODING_JSON, help="Payload encoding")
+    parser.add_argument('--topic-mode', choices=TOPIC_MODES, default=TOPIC_MODE_SENSOR,
+                        help="Publish per-sensor topics, per-process bundles, or both")
+    parser.add_argument('--registry', default=None, help="Sensor registry file (default: sensors.json)")
+    args = parser.parse_args()
+
+    registry = load_registry(args.registry) if args.registry else REGISTRY
+    simulator = BatteryPlantSimulator(args.plant_id, encoding=args.encoding, topic_mode=args.topic_mode,
+                                      registry=registry)
+    replayer = Replayer(simulator, args.file, args.speed, args.chunk_size, args.restamp, args.report_interval)
+    try:
+        simulator.client.connect(MQTT_BROKER, MQTT_PORT)
+        simulator.client.loop_start()
+        logger.info(f"Replaying {args.file} at {args.speed or 'maximum'}x speed...")
+        replayer.run(args.max_rows)
+    except KeyboardInterrupt:
+        logger.info("Stopping replay...")
+    except Exception as e:
+        logger.error(f"Error in replay: {e}")
+    finally:
+        simulator.client.loop_stop()
+        simulator.client.disconnect()
@@ -0,0 +1,202 @@
+import json
+import math
+import threading
+import numpy as np
+
+# Report by exception for the simulator. A sensor's value is published only
+# when it moved more than its deadband away from the last reported value, or
+# when it has been silent for max_silence seconds (a heartbeat, so
+# subscribers can tell a steady signal from a dead one). Deadbands come from
+# the registry's optional "deadband" (absolute, in the sensor's unit) and
+# "max_silence" fields, falling back to a percentage of the sensor's normal
+# range and a global silence limit.
+#
+# SparkplugNode publishes the same filtered rows in a Sparkplug-B-style
+# scheme, with JSON instead of protobuf payloads:
+#   spBv1.0/{group}/NBIRTH/{node}  retained; every metric's name, alias, unit and last value
+#   spBv1.0/{group}/NDATA/{node}   changed metrics only, by alias, with a 0-255 sequence number
+#   spBv1.0/{group}/NDEATH/{node}  retained; registered as the MQTT will, also sent on clean shutdown
+#   spBv1.0/{group}/NCMD/{node}    subscribed; a "Node Control/Rebirth" metric requests a new birth
+# Birth and death carry the session's bdSeq. A subscriber that joins late
+# gets the retained birth (and death, if the node is down): names, units and
+# the values as of that birth, each within max_silence of being refreshed by
+# NDATA. Subscribers that need current values at once, or that see a gap in
+# seq, request a rebirth. The node is online while the birth's bdSeq
+# differs from the last death's.
+
+MAX_SILENCE = 60.0
+SPARKPLUG_NAMESPACE = 'spBv1.0'
+SPARKPLUG_GROUP = 'battery_plant'
+SPARKPLUG_QOS = 1
+BIRTH, DATA, DEATH, COMMAND = 'NBIRTH', 'NDATA', 'NDEATH', 'NCMD'
+REBIRTH_METRIC = 'Node Control/Rebirth'
+
+
+def deadbands(registry, percent=0.0):
+    # Absolute deadband per sensor, in registry order
+    bands = []
+    for sensor in registry.sensors:
+        if sensor.deadband is not None:
+            bands.append(sensor.deadband)
+        elif sensor.low is not None and sensor.high is not None:
+            bands.append((sensor.high - sensor.low) * percent / 100)
+        else:
+            bands.append(abs(sensor.base) * percent / 100)
+    return bands
+
+
+def silence_limits(registry, max_silence=MAX_SILENCE):
+    return [sensor.max_silence if sensor.max_silence is not None else max_silence for sensor in registry.sensors]
+
+
+class ExceptionFilter:
+    def __init__(self, deadbands, max_silence):
+        self.deadbands = np.asarray(deadbands, dtype=np.float64)
+        self.max_silence = np.asarray(max_silence, dtype=np.float64)
+        # Last reported value and time per sensor; NaN reports the first sample
+        self.last_values = np.full(len(self.deadbands), np.nan)
+        self.last_sent = np.full(len(self.deadbands), -np.inf)
+        self.reported = np.zeros(len(self.deadbands), dtype=np.int64)
+        self.heartbeats = np.zeros(len(self.deadbands), dtype=np.int64)
+        self.suppressed = 0
+
+    def filter(self, row, now):
+        # Boolean mask of the row's sensors to report at time `now` (seconds)
+        values = np.asarray(row, dtype=np.float64)
+        changed = ~(np.abs(values - self.last_values) <= self.deadbands)
+        silent = now - self.last_sent >= self.max_silence
+        report = changed | silent
+        self.last_values[report] = values[report]
+        self.last_sent[report] = now
+        self.reported += report
+        self.heartbeats += silent & ~changed
+        self.suppressed += len(report) - int(np.count_nonzero(report))
+        return report
+
+
+def metric_value(value):
+    # NaN and infinities as null: JSON has no literal for them, and hosts
+    # with strict parsers reject Python's NaN/Infinity
+    return value if math.isfinite(value) else None
+
+
+def sparkplug_topic(group, kind, node):
+    return f"{SPARKPLUG_NAMESPACE}/{group}/{kind}/{node}"
+
+
+def rebirth_payload(timestamp_ms=0):
+    return json.dumps({'timestamp': timestamp_ms, 'metrics': [{'name': REBIRTH_METRIC, 'value': True}]})
+
+
+def is_rebirth_request(payload):
+    try:
+        metrics = json.loads(payload)['metrics']
+    except (ValueError, KeyError, TypeError):
+        return False
+    return any(metric.get('name') == REBIRTH_METRIC and metric.get('value') is True for metric in metrics)
+
+
+class SparkplugNode:
+    def __init__(self, registry, group=SPARKPLUG_GROUP, node='1'):
+        self.group = group
+        self.node = node
+        self.names = [f"{sensor.process}/{sensor.sensor}" for sensor in registry.sensors]
+        self.units = [sensor.unit for sensor in registry.sensors]
+        self.topics = {kind: sparkplug_topic(group, kind, node) for kind in (BIRTH, DATA, DEATH, COMMAND)}
+        # bdSeq of the will registered for the next connect, and of the
+        # current session once born
+        self.bd_seq = 0
+        self.session = None
+        self.seq = 0
+        # Births run on paho's thread, data on the publishing thread
+        self.lock = threading.Lock()
+        self.births = 0
+        self.data_published = 0
+
+    def death_payload(self, bd_seq, timestamp_ms=0):
+        return json.dumps({'timestamp': timestamp_ms, 'metrics': [{'name': 'bdSeq', 'value': bd_seq}]})
+
+    def set_will(self, client):
+        # Must be called before connecting; the broker publishes it if the node drops
+        client.will_set(self.topics[DEATH], self.death_payload(self.bd_seq), SPARKPLUG_QOS, retain=True)
+
+    def publish_birth(self, client, publish, values, timestamp_ms, rebirth=False):
+        # Full state on every (re)connect, or again within the session on a
+        # rebirth request
+        with self.lock:
+            if not rebirth or self.session is None:
+                # A new session takes the bdSeq of the will sent with CONNECT
+                # and arms the next one
+                self.session = self.bd_seq
+                self.bd_seq = (self.bd_seq + 1) % 256
+                self.set_will(client)
+            self.seq = 0
+            metrics = [{'name': 'bdSeq', 'value': self.session}]
+            for alias, (name, unit, value) in enumerate(zip(self.names, self.units, values.tolist())):
+                metrics.append({'name': name, 'alias': alias, 'datatype': 'Double', 'unit': unit,
+                                'value': metric_value(value)})
+            payload = json.dumps({'timestamp': timestamp_ms, 'seq': self.seq, 'metrics': metrics})
+            publish(self.topics[BIRTH], payload, SPARKPLUG_QOS, retain=True)
+            self.births += 1
+
+    def publish_data(self, publish, row, report, timestamp_ms):
+        with self.lock:
+            self.seq = (self.seq + 1) % 256
+            metrics = [{'alias': int(alias), 'value': metric_value(row[alias])} for alias in np.flatnonzero(report)]
+            payload = json.dumps({'timestamp': timestamp_ms, 'seq': self.seq, 'metrics': metrics})
+            publish(self.topics[DATA], payload, SPARKPLUG_QOS)
+            self.data_published += 1
+
+    def publish_death(self, client, timestamp_ms):
+        if self.session is None:
+            return None
+        return client.publish(self.topics[DEATH], self.death_payload(self.session, timestamp_ms),
+                              SPARKPLUG_QOS, retain=True)
+
+
+class SparkplugState:
+    # Subscriber side: rebuilds each node's metrics from NBIRTH/NDATA/NDEATH
+    # messages (subscribe to spBv1.0/{group}/#)
+    def __init__(self):
+        # (group, node) -> {'bd_seq', 'death_bd_seq', 'seq', 'names', 'units', 'values', 'gaps'}
+        self.nodes = {}
+
+    def node(self, group, node):
+        return self.nodes.setdefault((group, node), {'bd_seq': None, 'death_bd_seq': None, 'seq': None,
+                                                     'names': {}, 'units': {}, 'values': {}, 'gaps': 0})
+
+    def apply(self, topic, payload):
+        parts = topic.split('/')
+        if len(parts) != 4 or parts[0] != SPARKPLUG_NAMESPACE:
+            return
+        _, group, kind, node_id = parts
+        message = json.loads(payload)
+        state = self.node(group, node_id)
+        if kind == BIRTH:
+            state['seq'] = message['seq']
+            for metric in message['metrics']:
+                if metric['name'] == 'bdSeq':
+                    state['bd_seq'] = metric['value']
+                    continue
+                state['names'][metric['alias']] = metric['name']
+                state['units'][metric['name']] = metric.get('unit')
+                if metric['value'] is not None:
+                    state['values'][metric['name']] = metric['value']
+        elif kind == DATA:
+            if state['seq'] is None:
+                # Data before any birth cannot be mapped to names
+                return
+            if message['seq'] != (state['seq'] + 1) % 256:
+                # Lost messages; a real host would request a rebirth
+                state['gaps'] += 1
+            state['seq'] = message['seq']
+            for metric in message['metrics']:
+                name = state['names'].get(metric['alias'])
+                if name is not None:
+                    state['values'][name] = metric['value']
+        elif kind == DEATH:
+            state['death_bd_seq'] = message['metrics'][0]['value']
+
+    def online(self, group, node):
+        state = self.nodes.get((group, node))
+        return state is not None and state['bd_seq'] is not None and state['bd_seq'] != state['death_bd_seq']
@@ -0,0 +1,124 @@
+import json
+import os
+
+# Single source of truth for the plant's sensors (sensors.json). The
+# simulator, the data generator and the dashboard load it once at startup and
+# build their hot-path tables (topic strings, payload templates, CSV columns,
+# units, generator parameters) from it, so adding sensors needs no code changes.
+#
+#   {"topic": "battery_plant/{plant}/process/{process}/sensor/{sensor}",
+#    "processes": {"mixing": {"title": "Mixing Process"}, ...},
+#    "sensors": [{"process": "mixing", "sensor": "temperature",
+#                 "column": "mixing_temperature", "unit": "°C", "base": 25.0,
+#                 "noise": 0.5, "decimals": 2, "range": [18.0, 32.0]}, ...]}
+#
+# Optional per-sensor fields: daily_cycle (generator), qos, and deadband and
+# max_silence (report by exception). A process entry may set a qos for all
+# of its sensors.
+#
+# Sensors are kept in file order, which is also the CSV column order and the
+# order values appear in a published row.
+
+REGISTRY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sensors.json')
+
+REQUIRED_FIELDS = ('process', 'sensor', 'column', 'unit', 'base', 'noise')
+
+
+class Sensor:
+    __slots__ = ('process', 'sensor', 'column', 'unit', 'base', 'noise', 'decimals',
+                 'low', 'high', 'daily_cycle', 'qos', 'deadband', 'max_silence')
+
+    def __init__(self, process, sensor, column, unit, base, noise, decimals=2, range=None, daily_cycle=False,
+                 qos=None, deadband=None, max_silence=None):
+        self.process = process
+        self.sensor = sensor
+        self.column = column
+        self.unit = unit
+        self.base = float(base)
+        # Uniform noise amplitude (+/-) and rounding of generated values
+        self.noise = float(noise)
+        self.decimals = int(decimals)
+        # Normal operating range, (None, None) when not specified
+        self.low, self.high = range if range is not None else (None, None)
+        self.daily_cycle = bool(daily_cycle)
+        # MQTT QoS; falls back to the process's qos, then the publisher default
+        self.qos = qos
+        # Report by exception: smallest change reported (in the sensor's unit)
+        # and longest time without a report, None for the publisher defaults
+        self.deadband = None if deadband is None else float(deadband)
+        self.max_silence = None if max_silence is None else float(max_silence)
+
+
+class SensorRegistry:
+    def __init__(self, topic, sensors, processes=None):
+        self.topic_template = topic
+        self.sensors = sensors
+        self.processes = processes or {}
+        self.index = {}
+        columns = set()
+        for position, sensor in enumerate(sensors):
+            key = (sensor.process, sensor.sensor)
+            if key in self.index:
+                raise ValueError(f"Duplicate sensor in registry: {sensor.process}/{sensor.sensor}")
+            if sensor.column in columns:
+                raise ValueError(f"Duplicate CSV column in registry: {sensor.column}")
+            self.index[key] = position
+            columns.add(sensor.column)
+            self.processes.setdefault(sensor.process, {})
+
+    def __len__(self):
+        return len(self.sensors)
+
+    def get(self, process, sensor):
+        position = self.index.get((process, sensor))
+        return None if position is None else self.sensors[position]
+
+    def columns(self):
+        return [sensor.column for sensor in self.sensors]
+
+    def topic(self, plant, process, sensor):
+        return self.topic_template.format(plant=plant, process=process, sensor=sensor)
+
+    def topics(self, plant):
+        # {process: {sensor: topic}}
+        topics = {}
+        for sensor in self.sensors:
+            topics.setdefault(sensor.process, {})[sensor.sensor] = self.topic(plant, sensor.process, sensor.sensor)
+        return topics
+
+    def process_sensors(self):
+        # {process: [(Sensor, index into a row), ...]}
+        processes = {}
+        for index, sensor in enumerate(self.sensors):
+            processes.setdefault(sensor.process, []).append((sensor, index))
+        return processes
+
+    def unit(self, process, sensor):
+        entry = self.get(process, sensor)
+        return '' if entry is None else entry.unit
+
+    def qos(self, sensor, default=0):
+        if sensor.qos is not None:
+            return sensor.qos
+        return self.processes.get(sensor.process, {}).get('qos', default)
+
+    def title(self, process):
+        return self.processes.get(process, {}).get('title', process.replace('_', ' ').title())
+
+    def dashboard_processes(self):
+        # [(process, title, [Sensor, ...])] of the processes shown on the dashboard
+        return [(process, self.title(process), [sensor for sensor, _ in sensors])
+                for process, sensors in self.process_sensors().items()
+                if self.processes.get(process, {}).get('dashboard', True)]
+
+
+def load_registry(path=REGISTRY_FILE):
+    with open(path, encoding='utf-8') as f:
+        spec = json.load(f)
+    sensors = []
+    for entry in spec['sensors']:
+        missing = [field for field in REQUIRED_FIELDS if field not in entry]
+        if missing:
+            raise ValueError(f"Sensor entry {entry} in {path} is missing {', '.join(missing)}")
+        sensors.append(Sensor(**entry))
+    return SensorRegistry(spec['topic'], sensors, spec.get('processes'))
@@ -1,9 +1,22 @@
 import paho.mqtt.client as mqtt
+import argparse
+import asyncio
 import json
+import math
 import time
 import pandas as pd
+import numpy as np
 from datetime import datetime
 import logging
+from collections import Counter
+from itertools import compress
+
+import payload_codec
+import publish_control
+import metrics
+import report_by_exception
+from sensor_registry import load_registry
+from async_mqtt import AsyncMqttClient
 
 # Configure logging
 logging.basicConfig(
@@ -20,72 +33,187 @@ MQTT_CLIENT_ID = "battery_plant_simulator"
 # Standardized MQTT Topic Structure
 # Format: battery_plant/{plant_id}/process/{process_id}/sensor/{sensor_type}
 TOPIC_BASE = "battery_plant/1"
-TOPICS = {
-    'mixing': {
-        'temperature': f"{TOPIC_BASE}/process/mixing/sensor/temperature",
-        'humidity': f"{TOPIC_BASE}/process/mixing/sensor/humidity",
-        'pressure': f"{TOPIC_BASE}/process/mixing/sensor/pressure",
-        'viscosity': f"{TOPIC_BASE}/process/mixing/sensor/viscosity",
-        'density': f"{TOPIC_BASE}/process/mixing/sensor/density"
-    },
-    'coating': {
-        'thickness': f"{TOPIC_BASE}/process/coating/sensor/thickness",
-        'speed': f"{TOPIC_BASE}/process/coating/sensor/speed",
-        'temperature': f"{TOPIC_BASE}/process/coating/sensor/temperature",
-        'humidity': f"{TOPIC_BASE}/process/coating/sensor/humidity",
-        'web_tension': f"{TOPIC_BASE}/process/coating/sensor/web_tension"
-    },
-    'drying': {
-        'temperature': f"{TOPIC_BASE}/process/drying/sensor/temperature",
-        'humidity': f"{TOPIC_BASE}/process/drying/sensor/humidity",
-        'air_flow': f"{TOPIC_BASE}/process/drying/sensor/air_flow",
-        'drying_time': f"{TOPIC_BASE}/process/drying/sensor/drying_time"
-    },
-    'calendering': {
-        'pressure': f"{TOPIC_BASE}/process/calendering/sensor/pressure",
-        'temperature': f"{TOPIC_BASE}/process/calendering/sensor/temperature",
-        'speed': f"{TOPIC_BASE}/process/calendering/sensor/speed",
-        'thickness': f"{TOPIC_BASE}/process/calendering/sensor/thickness"
-    },
-    'slitting': {
-        'speed': f"{TOPIC_BASE}/process/slitting/sensor/speed",
-        'tension': f"{TOPIC_BASE}/process/slitting/sensor/tension",
-        'width': f"{TOPIC_BASE}/process/slitting/sensor/width"
-    },
-    'environmental': {
-        'temperature': f"{TOPIC_BASE}/process/environmental/sensor/temperature",
-        'humidity': f"{TOPIC_BASE}/process/environmental/sensor/humidity",
-        'pressure': f"{TOPIC_BASE}/process/environmental/sensor/pressure"
-    },
-    'quality': {
-        'resistance': f"{TOPIC_BASE}/process/quality/sensor/resistance",
-        'porosity': f"{TOPIC_BASE}/process/quality/sensor/porosity",
-        'density': f"{TOPIC_BASE}/process/quality/sensor/density"
-    },
-    'energy': {
-        'power': f"{TOPIC_BASE}/process/energy/sensor/power",
-        'air_pressure': f"{TOPIC_BASE}/process/energy/sensor/air_pressure",
-        'water_temperature': f"{TOPIC_BASE}/process/energy/sensor/water_temperature"
-    }
-}
+
+# Sensors, units and CSV columns come from the shared registry (sensors.json)
+REGISTRY = load_registry()
+
+TOPICS = REGISTRY.topics(1)
+
+# QoS for sensors without one in the registry, and for retained metadata
+DEFAULT_QOS = 0
+META_QOS = 1
+
+# Seconds between publisher flow-control reports
+STATS_INTERVAL = 10
+
+# Seconds to wait for the Sparkplug death certificate on shutdown
+SHUTDOWN_TIMEOUT = 2.0
+
+def topic_base_for_plant(plant_id):
+    return f"battery_plant/{plant_id}"
+
+# Topic modes: one message per sensor (legacy UNS topics), one bundle
+# message per process, or both for mixed legacy/bundle subscribers
+TOPIC_MODE_SENSOR = 'sensor'
+TOPIC_MODE_BUNDLE = 'bundle'
+TOPIC_MODE_BOTH = 'both'
+TOPIC_MODES = (TOPIC_MODE_SENSOR, TOPIC_MODE_BUNDLE, TOPIC_MODE_BOTH)
+
+class TickScheduler:
+    # Fixed-rate scheduler: deadlines advance by whole periods from the start
+    # time, so the time spent publishing does not accumulate as drift.
+    def __init__(self, period, max_lag=1.0):
+        self.period = period
+        self.max_lag = max_lag
+        self.next_tick = time.monotonic()
+        self.skipped = 0
+
+    def next_delay(self):
+        # Seconds until the next tick (0 when it is already due)
+        if self.period <= 0:
+            return 0.0
+        self.next_tick += self.period
+        delay = self.next_tick - time.monotonic()
+        if -delay > self.max_lag:
+            # Too far behind to catch up: resynchronise instead of bursting
+            self.skipped += int(-delay / self.period)
+            self.next_tick = time.monotonic()
+        return max(0.0, delay)
+
+    def wait(self):
+        delay = self.next_delay()
+        if delay > 0:
+            time.sleep(delay)
+
+class JsonLiteral(str):
+    # Rendered as is by the payload templates' %r
+    __repr__ = str.__str__
+
+def json_values(row):
+    # The templates render floats with %r, which gives nan/inf; use the
+    # literals json.dumps writes (NaN, Infinity, -Infinity) instead. A finite
+    # sum means every value is finite, so most rows pass through untouched.
+    if math.isfinite(sum(row)):
+        return row
+    return [value if math.isfinite(value) else JsonLiteral(json.dumps(value)) for value in row]
 
 class BatteryPlantSimulator:
-    def __init__(self):
-        self.client = mqtt.Client(MQTT_CLIENT_ID)
-        self.client.on_connect = self.on_connect
-        self.client.on_publish = self.on_publish
+    def __init__(self, plant_id=1, client=None, encoding=payload_codec.ENCODING_JSON, mqtt_v5=False,
+                 topic_mode=TOPIC_MODE_SENSOR, registry=None, qos=DEFAULT_QOS):
+        self.plant_id = plant_id
+        self.registry = registry or REGISTRY
+        self.topic_base = topic_base_for_plant(plant_id)
+        self.topics = self.registry.topics(plant_id)
+        # topic -> unit, for the legacy per-message path
+        self.units = {self.topics[sensor.process][sensor.sensor]: sensor.unit for sensor in self.registry.sensors}
+        self.qos = qos
+        self.topic_qos = {self.topics[sensor.process][sensor.sensor]: self.registry.qos(sensor, qos)
+                          for sensor in self.registry.sensors}
+        self.encoding = encoding
+        self.topic_mode = topic_mode
+        if client is None:
+            client = mqtt.Client(MQTT_CLIENT_ID, protocol=mqtt.MQTTv5 if mqtt_v5 else mqtt.MQTTv311)
+            client.on_connect = self.on_connect
+            client.on_publish = self.on_publish
+        self.client = client
+        # Publishing goes through a PublishController once flow control is enabled
+        self.controller = None
+        # MQTT v5 clients also announce the payload encoding as content type
+        self.properties = None
+        if mqtt_v5:
+            content_type = (payload_codec.CONTENT_TYPE_BINARY if encoding == payload_codec.ENCODING_BINARY
+                            else payload_codec.CONTENT_TYPE_JSON)
+            self.properties = payload_codec.publish_properties(content_type)
         self.data = None
         self.current_index = 0
+        # High-rate mode state, filled by prepare_fast_path()
+        self.values = None
+        self.topic_table = None
+        self.bundle_table = None
+        # Report by exception and Sparkplug publishing, off unless enabled
+        self.exceptions = None
+        self.sparkplug = None
+        self.bundles_reported = Counter()
+        # Always-on publish counters, exposed by register_metrics()
+        self.rows_published = 0
+        self.row_latency = metrics.HistogramValue(metrics.FAST_BUCKETS)
         
-    def on_connect(self, client, userdata, flags, rc):
+    def on_connect(self, client, userdata, flags, rc, properties=None):
         if rc == 0:
             logger.info("Connected to MQTT broker")
+            self.publish_metadata()
+            if self.sparkplug is not None:
+                client.subscribe(self.sparkplug.topics[report_by_exception.COMMAND], report_by_exception.SPARKPLUG_QOS)
+                self.sparkplug.publish_birth(self.client, self.callback_publisher(), self.exceptions.last_values,
+                                             int(time.time() * 1000))
+            if self.controller is not None:
+                self.controller.on_connect()
         else:
             logger.error(f"Failed to connect to MQTT broker with code: {rc}")
 
     def on_publish(self, client, userdata, mid):
         logger.debug(f"Message {mid} published successfully")
 
+    def on_message(self, client, userdata, msg):
+        # Sparkplug commands (NCMD) addressed to this node
+        if self.sparkplug is not None and report_by_exception.is_rebirth_request(msg.payload):
+            logger.info("Rebirth requested")
+            self.sparkplug.publish_birth(self.client, self.callback_publisher(), self.exceptions.last_values,
+                                         int(time.time() * 1000), rebirth=True)
+
+    def enable_flow_control(self, max_inflight=publish_control.MAX_INFLIGHT, spool_path=None,
+                            drain_rate=publish_control.DRAIN_RATE, spool_max_bytes=publish_control.SPOOL_MAX_BYTES):
+        spool = publish_control.DiskSpool(spool_path, spool_max_bytes) if spool_path else None
+        self.controller = publish_control.PublishController(self.client, max_inflight, spool, drain_rate,
+                                                            self.properties)
+
+    def enable_report_by_exception(self, deadband_percent=0.0, max_silence=report_by_exception.MAX_SILENCE):
+        # Deadband percent (of each sensor's normal range) and max_silence
+        # apply to sensors without their own in the registry
+        self.exceptions = report_by_exception.ExceptionFilter(
+            report_by_exception.deadbands(self.registry, deadband_percent),
+            report_by_exception.silence_limits(self.registry, max_silence))
+
+    def enable_sparkplug(self, group=report_by_exception.SPARKPLUG_GROUP):
+        # Replaces the UNS topics with NBIRTH/NDATA/NDEATH for this plant;
+        # call before connecting so the death certificate is the client's will
+        if self.exceptions is None:
+            self.enable_report_by_exception()
+        self.sparkplug = report_by_exception.SparkplugNode(self.registry, group, str(self.plant_id))
+        self.sparkplug.set_will(self.client)
+        self.client.on_message = self.on_message
+
+    def stop_sparkplug(self):
+        # A clean shutdown sends the death certificate itself; the will only
+        # covers connections that drop
+        if self.sparkplug is None or not self.client.is_connected():
+            return None
+        return self.sparkplug.publish_death(self.client, int(time.time() * 1000))
+
+    def publisher(self):
+        return self.controller.publish if self.controller is not None else self.client.publish
+
+    def callback_publisher(self):
+        # For publishing from paho's callbacks, which must never wait for flow control
+        return self.controller.publish_nowait if self.controller is not None else self.client.publish
+
+    def publish_metadata(self):
+        # Binary payloads carry no unit, so units go out once as retained
+        # metadata next to each sensor topic (usually from on_connect)
+        if self.encoding != payload_codec.ENCODING_BINARY or self.sparkplug is not None:
+            return
+        publish = self.callback_publisher()
+        if self.topic_mode != TOPIC_MODE_BUNDLE:
+            for topic, unit in self.units.items():
+                meta = payload_codec.encode_meta(unit)
+                publish(payload_codec.meta_topic(topic), meta, META_QOS, retain=True)
+        if self.topic_mode != TOPIC_MODE_SENSOR:
+            for process, sensors in self.registry.process_sensors().items():
+                meta = payload_codec.encode_bundle_meta([sensor.sensor for sensor, _ in sensors],
+                                                        [sensor.unit for sensor, _ in sensors])
+                topic = payload_codec.bundle_topic(self.topic_base, process)
+                publish(payload_codec.meta_topic(topic), meta, META_QOS, retain=True)
+
     def load_data(self, csv_file='battery_plant_data.csv'):
         try:
             self.data = pd.read_csv(csv_file)
@@ -93,6 +221,138 @@ class BatteryPlantSimulator:
         except Exception as e:
             logger.error(f"Error loading CSV file: {e}")
             raise
+        self.prepare_fast_path()
+
+    def prepare_fast_path(self):
+        # Convert the sensor columns to one contiguous float array and render
+        # each topic's payload template once, so that publishing a row only
+        # has to fill in the timestamp and the value.
+        columns = self.registry.columns()
+        self.values = np.ascontiguousarray(self.data[columns].to_numpy(dtype=np.float64))
+        self.build_topic_table()
+
+    def share_data(self, other):
+        # Reuse another simulator's loaded data (e.g. plants in one fleet worker)
+        self.data = other.data
+        self.values = other.values
+        self.build_topic_table()
+
+    def build_topic_table(self):
+        binary = self.encoding == payload_codec.ENCODING_BINARY
+        self.topic_table = []
+        if self.topic_mode != TOPIC_MODE_BUNDLE:
+            for topic, unit in self.units.items():
+                qos = self.topic_qos[topic]
+                if binary:
+                    self.topic_table.append((payload_codec.binary_topic(topic), None, qos))
+                    continue
+                unit = json.dumps(unit).replace('%', '%%')
+                template = '{"timestamp": "%s", "value": %r, "unit": ' + unit + '}'
+                self.topic_table.append((topic, template, qos))
+
+        # Bundles: (topic, row indexes, JSON template or binary struct, QoS)
+        self.bundle_table = []
+        if self.topic_mode != TOPIC_MODE_SENSOR:
+            for process, sensors in self.registry.process_sensors().items():
+                topic = payload_codec.bundle_topic(self.topic_base, process)
+                indexes = [index for _, index in sensors]
+                # A bundle is sent with the highest QoS of its sensors
+                qos = max(self.registry.qos(sensor, self.qos) for sensor, _ in sensors)
+                if binary:
+                    self.bundle_table.append((payload_codec.binary_topic(topic), indexes,
+                                              payload_codec.bundle_struct(len(sensors)), qos))
+                    continue
+                values = ', '.join(f'{json.dumps(sensor.sensor)}: %r' for sensor, _ in sensors)
+                units = ', '.join(f'{json.dumps(sensor.sensor)}: {json.dumps(sensor.unit)}'
+                                  for sensor, _ in sensors).replace('%', '%%')
+                template = '{"timestamp": "%s", "values": {' + values + '}, "units": {' + units + '}}'
+                self.bundle_table.append((topic, indexes, template, qos))
+
+    def messages_per_row(self):
+        return len(self.topic_table) + len(self.bundle_table)
+
+    def publish_rows(self, count=1):
+        # High-rate path: publish `count` consecutive rows from the NumPy
+        # columns, one timestamp per row and no pandas or dict work per message
+        if self.values is None:
+            logger.error("No data loaded. Please load data first.")
+            return 0
+
+        num_rows = len(self.values)
+        remaining = count
+        sent = 0
+        while remaining > 0:
+            if self.current_index >= num_rows:
+                logger.info("Reached end of data, restarting from beginning")
+                self.current_index = 0
+            end = min(num_rows, self.current_index + remaining)
+            for row in self.values[self.current_index:end].tolist():
+                sent += self.publish_row(row)
+            remaining -= end - self.current_index
+            self.current_index = end
+        return sent
+
+    def publish_row(self, row, timestamp_ns=None):
+        # Publish one row of values in registry order; returns the number of
+        # messages sent
+        start = time.perf_counter()
+        if timestamp_ns is None:
+            timestamp_ns = time.time_ns()
+        report = None
+        if self.exceptions is not None:
+            report = self.exceptions.filter(row, timestamp_ns / 1e9)
+        sent = 0
+        if self.sparkplug is not None:
+            if report.any():
+                self.sparkplug.publish_data(self.publisher(), row, report, timestamp_ns // 1000000)
+                sent = 1
+        else:
+            if self.topic_table:
+                sent += self.publish_sensors(row, timestamp_ns, report)
+            if self.bundle_table:
+                sent += self.publish_bundles(row, timestamp_ns, report)
+        self.rows_published += 1
+        self.row_latency.observe(time.perf_counter() - start)
+        return sent
+
+    def publish_sensors(self, row, timestamp_ns, report=None):
+        publish = self.publisher()
+        properties = self.properties
+        table = self.topic_table
+        if report is not None:
+            # Only the sensors the exception filter reports
+            table = list(compress(table, report))
+            row = list(compress(row, report))
+        if self.encoding == payload_codec.ENCODING_BINARY:
+            pack = payload_codec.BINARY_STRUCT.pack
+            for (topic, _, qos), value in zip(table, row):
+                publish(topic, pack(timestamp_ns, value), qos, properties=properties)
+        else:
+            timestamp = payload_codec.ns_to_iso(timestamp_ns)
+            row = json_values(row)
+            for (topic, template, qos), value in zip(table, row):
+                publish(topic, template % (timestamp, value), qos, properties=properties)
+        return len(table)
+
+    def publish_bundles(self, row, timestamp_ns, report=None):
+        # One message per process carrying all of its sensors for this row
+        publish = self.publisher()
+        properties = self.properties
+        table = self.bundle_table
+        if report is not None:
+            # A process is sent whole when any of its sensors is reported
+            table = [entry for entry in table if report[entry[1]].any()]
+            self.bundles_reported.update(entry[0] for entry in table)
+        if self.encoding == payload_codec.ENCODING_BINARY:
+            for topic, indexes, bundle_layout, qos in table:
+                publish(topic, bundle_layout.pack(timestamp_ns, *[row[i] for i in indexes]), qos,
+                        properties=properties)
+        else:
+            timestamp = payload_codec.ns_to_iso(timestamp_ns)
+            row = json_values(row)
+            for topic, indexes, template, qos in table:
+                publish(topic, template % (timestamp, *[row[i] for i in indexes]), qos, properties=properties)
+        return len(table)
 
     def publish_sensor_data(self):
         if self.data is None:
@@ -103,117 +363,214 @@ class BatteryPlantSimulator:
             logger.info("Reached end of data, restarting from beginning")
             self.current_index = 0
 
+        if self.exceptions is not None:
+            # Report by exception filters whole rows, so it uses the row path
+            self.publish_row(self.values[self.current_index].tolist())
+            self.current_index += 1
+            return
+
+        start = time.perf_counter()
         row = self.data.iloc[self.current_index]
-        
-        # Publish mixing room data
-        self.publish_sensor_value(TOPICS['mixing']['temperature'], row['mixing_temperature'])
-        self.publish_sensor_value(TOPICS['mixing']['humidity'], row['mixing_humidity'])
-        self.publish_sensor_value(TOPICS['mixing']['pressure'], row['mixing_pressure'])
-        self.publish_sensor_value(TOPICS['mixing']['viscosity'], row['slurry_viscosity'])
-        self.publish_sensor_value(TOPICS['mixing']['density'], row['slurry_density'])
-        
-        # Publish coating line data
-        self.publish_sensor_value(TOPICS['coating']['thickness'], row['coating_thickness'])
-        self.publish_sensor_value(TOPICS['coating']['speed'], row['coating_speed'])
-        self.publish_sensor_value(TOPICS['coating']['temperature'], row['coating_temperature'])
-        self.publish_sensor_value(TOPICS['coating']['humidity'], row['coating_humidity'])
-        self.publish_sensor_value(TOPICS['coating']['web_tension'], row['web_tension'])
-        
-        # Publish drying oven data
-        self.publish_sensor_value(TOPICS['drying']['temperature'], row['oven_temperature'])
-        self.publish_sensor_value(TOPICS['drying']['humidity'], row['oven_humidity'])
-        self.publish_sensor_value(TOPICS['drying']['air_flow'], row['air_flow_rate'])
-        self.publish_sensor_value(TOPICS['drying']['drying_time'], row['drying_time'])
-        
-        # Publish calendering data
-        self.publish_sensor_value(TOPICS['calendering']['pressure'], row['calender_pressure'])
-        self.publish_sensor_value(TOPICS['calendering']['temperature'], row['calender_temperature'])
-        self.publish_sensor_value(TOPICS['calendering']['speed'], row['calender_speed'])
-        self.publish_sensor_value(TOPICS['calendering']['thickness'], row['electrode_thickness'])
-        
-        # Publish slitting data
-        self.publish_sensor_value(TOPICS['slitting']['speed'], row['slitting_speed'])
-        self.publish_sensor_value(TOPICS['slitting']['tension'], row['slitting_tension'])
-        self.publish_sensor_value(TOPICS['slitting']['width'], row['electrode_width'])
-        
-        # Publish environmental data
-        self.publish_sensor_value(TOPICS['environmental']['temperature'], row['room_temperature'])
-        self.publish_sensor_value(TOPICS['environmental']['humidity'], row['room_humidity'])
-        self.publish_sensor_value(TOPICS['environmental']['pressure'], row['room_pressure'])
-        
-        # Publish quality control data
-        self.publish_sensor_value(TOPICS['quality']['resistance'], row['electrode_resistance'])
-        self.publish_sensor_value(TOPICS['quality']['porosity'], row['electrode_porosity'])
-        self.publish_sensor_value(TOPICS['quality']['density'], row['electrode_density'])
-        
-        # Publish energy monitoring data
-        self.publish_sensor_value(TOPICS['energy']['power'], row['power_consumption'])
-        self.publish_sensor_value(TOPICS['energy']['air_pressure'], row['compressed_air_pressure'])
-        self.publish_sensor_value(TOPICS['energy']['water_temperature'], row['cooling_water_temperature'])
+
+        if self.topic_mode != TOPIC_MODE_SENSOR:
+            self.publish_bundles([float(row[column]) for column in self.registry.columns()], time.time_ns())
+        if self.topic_mode != TOPIC_MODE_BUNDLE:
+            for sensor in self.registry.sensors:
+                self.publish_sensor_value(self.topics[sensor.process][sensor.sensor], row[sensor.column])
 
         self.current_index += 1
+        self.rows_published += 1
+        self.row_latency.observe(time.perf_counter() - start)
 
     def publish_sensor_value(self, topic, value):
+        publish = self.publisher()
+        qos = self.topic_qos.get(topic, self.qos)
+        if self.encoding == payload_codec.ENCODING_BINARY:
+            payload = payload_codec.encode_binary(time.time_ns(), value)
+            publish(payload_codec.binary_topic(topic), payload, qos, properties=self.properties)
+            logger.debug(f"Published to {topic}: {value}")
+            return
         timestamp = datetime.now().isoformat()
         payload = {
                 "timestamp": timestamp,
             "value": value,
             "unit": self.get_unit_for_topic(topic)
         }
-        self.client.publish(topic, json.dumps(payload))
+        publish(topic, json.dumps(payload), qos, properties=self.properties)
         logger.debug(f"Published to {topic}: {payload}")
 
+    def log_flow_stats(self):
+        stats = self.controller.stats()
+        latency = stats['ack_latency']
+        logger.info(f"Published {stats['published']}, acked {stats['acked']}, in flight {stats['inflight']}"
+                    f"/{stats['max_inflight']}, ack p50 {latency['p50'] * 1000:.1f} ms p99 {latency['p99'] * 1000:.1f} ms, "
+                    f"{stats['stalls']} stalls, {stats['lost']} lost, {stats['spool_bytes']} bytes spooled")
+
+    def published_counts(self):
+        # Without report by exception every row publishes each topic of the
+        # topic and bundle tables once, so per-topic counts come from the row
+        # counter at scrape time
+        if self.sparkplug is not None:
+            return {(self.sparkplug.topics[report_by_exception.BIRTH],): self.sparkplug.births,
+                    (self.sparkplug.topics[report_by_exception.DATA],): self.sparkplug.data_published}
+        if self.exceptions is None:
+            return {(entry[0],): self.rows_published for entry in (self.topic_table or []) + (self.bundle_table or [])}
+        counts = {(entry[0],): int(count) for entry, count in zip(self.topic_table or [], self.exceptions.reported)}
+        counts.update(((topic,), count) for topic, count in self.bundles_reported.items())
+        return counts
+
+    def register_metrics(self, telemetry):
+        telemetry.counter_func('uns_messages_published_total', "Messages published per topic",
+                               self.published_counts, labelnames=('topic',))
+        telemetry.counter_func('uns_rows_published_total', "Data rows published", lambda: self.rows_published)
+        telemetry.histogram('uns_publish_row_seconds', "Time to serialize and publish one row",
+                            metrics.FAST_BUCKETS, value=self.row_latency)
+        exceptions = self.exceptions
+        if exceptions is not None:
+            telemetry.counter_func('uns_rbe_reported_total', "Sensor values reported by exception",
+                                   lambda: int(exceptions.reported.sum()))
+            telemetry.counter_func('uns_rbe_heartbeats_total', "Unchanged values reported after max silence",
+                                   lambda: int(exceptions.heartbeats.sum()))
+            telemetry.counter_func('uns_rbe_suppressed_total', "Sensor values within their deadband, not sent",
+                                   lambda: exceptions.suppressed)
+        controller = self.controller
+        if controller is None:
+            return
+        telemetry.histogram('uns_publish_ack_seconds', "Time from publish to paho's confirmation",
+                            metrics.LATENCY_BUCKETS, value=controller.latency)
+        telemetry.gauge('uns_publish_inflight', "Messages waiting for confirmation", lambda: len(controller.pending))
+        telemetry.counter_func('uns_publish_acked_total', "Messages confirmed by paho", lambda: controller.acked)
+        telemetry.counter_func('uns_publish_lost_total', "Messages dropped without delivery", lambda: controller.lost)
+        telemetry.counter_func('uns_publish_stalls_total', "Waits for a free in-flight slot that timed out",
+                               lambda: controller.stalls)
+        if controller.spool is not None:
+            telemetry.counter_func('uns_spool_appended_total', "Messages written to the spool", lambda: controller.spooled)
+            telemetry.counter_func('uns_spool_drained_total', "Messages replayed from the spool", lambda: controller.drained)
+            telemetry.gauge('uns_spool_bytes', "Bytes waiting in the spool", controller.spool.pending)
+
     def get_unit_for_topic(self, topic):
-        if 'temperature' in topic:
-            return '°C'
-        elif 'humidity' in topic:
-            return '%'
-        elif 'pressure' in topic:
-            return 'hPa'
-        elif 'viscosity' in topic:
-            return 'cP'
-        elif 'density' in topic:
-            return 'g/cm³'
-        elif 'thickness' in topic:
-            return 'μm'
-        elif 'speed' in topic:
-            return 'm/min'
-        elif 'tension' in topic:
-            return 'N'
-        elif 'air_flow' in topic:
-            return 'm³/h'
-        elif 'drying_time' in topic:
-            return 'min'
-        elif 'resistance' in topic:
-            return 'Ω'
-        elif 'porosity' in topic:
-            return '%'
-        elif 'width' in topic:
-            return 'mm'
-        elif 'power' in topic:
-            return 'kW'
-        elif 'air_pressure' in topic:
-            return 'bar'
-        return ''
-
-    def run(self, interval=1):
+        return self.units.get(topic, '')
+
+    def run(self, interval=1, high_rate=False, block_size=1):
         try:
-            self.client.connect(MQTT_BROKER, MQTT_PORT)
+            if self.controller is not None and self.controller.spool is not None:
+                # Keep publishing into the spool until the broker is reachable
+                self.client.connect_async(MQTT_BROKER, MQTT_PORT)
+            else:
+                self.client.connect(MQTT_BROKER, MQTT_PORT)
             self.client.loop_start()
             
             logger.info("Starting battery plant sensor data publishing...")
+            scheduler = TickScheduler(interval)
+            last_stats = time.monotonic()
             while True:
-                self.publish_sensor_data()
-                time.sleep(interval)
+                if high_rate:
+                    self.publish_rows(block_size)
+                else:
+                    self.publish_sensor_data()
+                scheduler.wait()
+                if self.controller is not None and time.monotonic() - last_stats >= STATS_INTERVAL:
+                    self.log_flow_stats()
+                    last_stats = time.monotonic()
         except KeyboardInterrupt:
             logger.info("Stopping battery plant simulator...")
         except Exception as e:
             logger.error(f"Error in battery plant simulator: {e}")
         finally:
+            info = self.stop_sparkplug()
+            if info is not None:
+                info.wait_for_publish(SHUTDOWN_TIMEOUT)
             self.client.loop_stop()
             self.client.disconnect()
 
+    async def run_async(self, interval=1, high_rate=False, block_size=1):
+        # Single event loop: publishing and paho's socket I/O share one
+        # thread, and ticks wait with asyncio.sleep instead of time.sleep
+        connection = AsyncMqttClient(self.client)
+        task = asyncio.create_task(connection.run(MQTT_BROKER, MQTT_PORT))
+        try:
+            await connection.wait_connected()
+            logger.info("Starting battery plant sensor data publishing (asyncio)...")
+            scheduler = TickScheduler(interval)
+            while True:
+                if not connection.connected.is_set():
+                    # QoS 0 messages published now would be dropped
+                    await connection.wait_connected()
+                if high_rate:
+                    self.publish_rows(block_size)
+                else:
+                    self.publish_sensor_data()
+                # Also yields to the loop when no wait is due, so paho can write
+                await asyncio.sleep(scheduler.next_delay())
+        finally:
+            info = self.stop_sparkplug()
+            deadline = time.monotonic() + SHUTDOWN_TIMEOUT
+            while info is not None and not info.is_published() and time.monotonic() < deadline:
+                # The loop has to keep running for paho to send it
+                await asyncio.sleep(0.01)
+            connection.disconnect()
+            task.cancel()
+
 if __name__ == "__main__":
-    simulator = BatteryPlantSimulator()
-    simulator.load_data()
-    simulator.run() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Battery plant MQTT sensor simulator")
+    parser.add_argument('--csv', default='battery_plant_data.csv', help="CSV file with sensor data")
+    parser.add_argument('--interval', type=float, default=1, help="Seconds to wait between ticks")
+    parser.add_argument('--high-rate', action='store_true', help="Publish from pre-serialized NumPy columns")
+    parser.add_argument('--block-size', type=int, default=1, help="Rows published per tick in high-rate mode")
+    parser.add_argument('--encoding', choices=[payload_codec.ENCODING_JSON, payload_codec.ENCODING_BINARY],
+                        default=payload_codec.ENCODING_JSON, help="Payload encoding")
+    parser.add_argument('--mqtt-v5', action='store_true', help="Use MQTT v5 and set the payload content type")
+    parser.add_argument('--topic-mode', choices=TOPIC_MODES, default=TOPIC_MODE_SENSOR,
+                        help="Publish per-sensor topics, per-process bundles, or both")
+    parser.add_argument('--registry', default=None, help="Sensor registry file (default: sensors.json)")
+    parser.add_argument('--qos', type=int, choices=[0, 1, 2], default=DEFAULT_QOS,
+                        help="QoS for sensors without a qos in the registry")
+    parser.add_argument('--max-inflight', type=int, default=0,
+                        help="Bound on unacknowledged messages; enables flow control (0 = off)")
+    parser.add_argument('--spool', default=None, help="Spool file for messages published while the broker is down")
+    parser.add_argument('--drain-rate', type=float, default=publish_control.DRAIN_RATE,
+                        help="Messages per second replayed from the spool after reconnecting")
+    parser.add_argument('--spool-max-mb', type=float, default=publish_control.SPOOL_MAX_BYTES / 1e6,
+                        help="Maximum spool size in MB")
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help="Run the MQTT client on an asyncio event loop instead of a network thread")
+    parser.add_argument('--report-by-exception', action='store_true',
+                        help="Publish a sensor only when it leaves its deadband or after --max-silence")
+    parser.add_argument('--deadband', type=float, default=0.0,
+                        help="Deadband in percent of the sensor's normal range, for sensors without one in "
+                             "the registry (0 = any change)")
+    parser.add_argument('--max-silence', type=float, default=report_by_exception.MAX_SILENCE,
+                        help="Seconds after which an unchanged sensor is reported again")
+    parser.add_argument('--sparkplug', action='store_true',
+                        help="Publish Sparkplug-style NBIRTH/NDATA/NDEATH (JSON) instead of the UNS topics")
+    parser.add_argument('--group-id', default=report_by_exception.SPARKPLUG_GROUP, help="Sparkplug group ID")
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help=f"Serve Prometheus metrics on this port (e.g. {metrics.METRICS_PORT})")
+    args = parser.parse_args()
+
+    if args.use_async and (args.max_inflight or args.spool):
+        parser.error("--max-inflight and --spool are not supported with --async")
+
+    registry = load_registry(args.registry) if args.registry else REGISTRY
+    simulator = BatteryPlantSimulator(encoding=args.encoding, mqtt_v5=args.mqtt_v5, topic_mode=args.topic_mode,
+                                      registry=registry, qos=args.qos)
+    if args.max_inflight or args.spool:
+        simulator.enable_flow_control(args.max_inflight or publish_control.MAX_INFLIGHT, args.spool,
+                                      args.drain_rate, int(args.spool_max_mb * 1e6))
+    if args.report_by_exception or args.sparkplug:
+        simulator.enable_report_by_exception(args.deadband, args.max_silence)
+    if args.sparkplug:
+        simulator.enable_sparkplug(args.group_id)
+    if args.metrics_port:
+        telemetry = metrics.MetricsRegistry()
+        simulator.register_metrics(telemetry)
+        metrics.start_exporter(telemetry, args.metrics_port)
+    simulator.load_data(args.csv)
+    if args.use_async:
+        try:
+            asyncio.run(simulator.run_async(interval=args.interval, high_rate=args.high_rate,
+                                            block_size=args.block_size))
+        except KeyboardInterrupt:
+            logger.info("Stopping battery plant simulator...")
+    else:
+        simulator.run(interval=args.interval, high_rate=args.high_rate, block_size=args.block_size) 
\ No newline at end of file
@@ -0,0 +1,306 @@
+import json
+import platform
+import time
+from multiprocessing import shared_memory
+import numpy as np
+
+import downsampling
+import payload_codec
+from snapshot import DELTA_HISTORY, Snapshot
+
+# Dashboard state in a multiprocessing.shared_memory block, written by the
+# ingest process and read by web worker processes (dashboard_cluster.py).
+# The layout is fixed at creation from the sensor registry and the plant
+# list, so every process computes the same slot index for a
+# (plant, process, sensor) key and no per-request IPC is needed:
+#
+#   header   magic, slots, capacity, version, epoch           (uint64 x 8)
+#   per slot seq, version, latest ts_ns, latest value, count  (8 bytes each)
+#   per slot history timestamps, history values               (float64 x capacity each)
+#
+# There is a single writer, the ingest worker. Latest values use a per-slot
+# seqlock: the writer makes seq odd, writes, then makes it even again, and a
+# reader retries any slot whose seq was odd or changed while it copied.
+# History rings are append-only: a reader copies the ring and keeps only the
+# samples the count says were written before and not overwritten after the
+# copy. Every write stamps the slot with the version of the batch being
+# ingested; commit() publishes that version in the header, so readers can
+# answer ?since_version= from the slot stamps. This relies on stores
+# becoming visible in program order, which holds on x86 (TSO). Python has no
+# memory barriers, so on other architectures readers could see torn values
+# with a matching seq; create() and attach() refuse to run there.
+
+MAGIC = 0x554E535F53484D31
+HEADER_WORDS = 8
+HEADER_MAGIC, HEADER_SLOTS, HEADER_CAPACITY, HEADER_VERSION, HEADER_EPOCH = range(5)
+SLOT_ARRAYS = 5
+SEQLOCK_RETRIES = 100
+# platform.machine() values with x86 store ordering
+TSO_MACHINES = ('x86_64', 'amd64', 'x86', 'i386', 'i486', 'i586', 'i686')
+
+
+def check_memory_model():
+    machine = platform.machine()
+    if machine.lower() not in TSO_MACHINES:
+        raise RuntimeError(f"Shared memory dashboard state needs x86 memory ordering, not supported on "
+                           f"{machine or 'this machine'}")
+
+
+def sensor_keys(registry, plants):
+    return [(plant, sensor.process, sensor.sensor) for plant in plants for sensor in registry.sensors]
+
+
+def state_size(num_slots, capacity):
+    return HEADER_WORDS * 8 + num_slots * (SLOT_ARRAYS * 8 + capacity * 16)
+
+
+class SharedState:
+    def __init__(self, shm, registry, plants, capacity, owner=False):
+        self.shm = shm
+        self.owner = owner
+        self.plants = list(plants)
+        self.keys = sensor_keys(registry, self.plants)
+        self.index = {key: i for i, key in enumerate(self.keys)}
+        self.units = [registry.unit(process, sensor) for _, process, sensor in self.keys]
+        self.capacity = capacity
+        num_slots = len(self.keys)
+        # Slot range of each plant
+        per_plant = len(registry.sensors)
+        self.plant_ranges = {plant: (i * per_plant, (i + 1) * per_plant) for i, plant in enumerate(self.plants)}
+
+        buf = shm.buf
+        self.header = np.ndarray(HEADER_WORDS, np.uint64, buf, 0)
+        offset = HEADER_WORDS * 8
+        arrays = []
+        for dtype in (np.uint64, np.uint64, np.int64, np.float64, np.uint64):
+            arrays.append(np.ndarray(num_slots, dtype, buf, offset))
+            offset += num_slots * 8
+        self.seq, self.slot_version, self.latest_ts, self.latest_value, self.count = arrays
+        self.history_ts = np.ndarray((num_slots, capacity), np.float64, buf, offset)
+        offset += num_slots * capacity * 8
+        self.history_values = np.ndarray((num_slots, capacity), np.float64, buf, offset)
+        # Version stamped on writes until the next commit (writer only)
+        self.pending_version = int(self.header[HEADER_VERSION]) + 1
+        self.dirty = False
+
+    @classmethod
+    def create(cls, registry, plants, capacity):
+        check_memory_model()
+        num_slots = len(registry) * len(plants)
+        shm = shared_memory.SharedMemory(create=True, size=state_size(num_slots, capacity))
+        state = cls(shm, registry, plants, capacity, owner=True)
+        state.header[:5] = (MAGIC, num_slots, capacity, 0, time.time_ns())
+        return state
+
+    @classmethod
+    def attach(cls, name, registry, plants):
+        check_memory_model()
+        shm = shared_memory.SharedMemory(name=name)
+        header = np.ndarray(HEADER_WORDS, np.uint64, shm.buf, 0)
+        magic, num_slots, capacity = (int(value) for value in header[:3])
+        del header
+        if magic != MAGIC or num_slots != len(registry) * len(plants):
+            shm.close()
+            raise ValueError(f"Shared memory block {name} does not match the registry and plants")
+        return cls(shm, registry, plants, capacity)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    # Writer side (ingest worker)
+
+    def write(self, key, timestamp_ns, value):
+        i = self.index.get(key)
+        if i is None:
+            return
+        self.seq[i] += 1
+        self.latest_ts[i] = timestamp_ns
+        self.latest_value[i] = value
+        self.slot_version[i] = self.pending_version
+        count = int(self.count[i])
+        position = count % self.capacity
+        self.history_ts[i, position] = timestamp_ns / 1e9
+        self.history_values[i, position] = value
+        self.count[i] = count + 1
+        self.seq[i] += 1
+        self.dirty = True
+
+    def load(self, key, timestamps, values):
+        # Seed a slot's history, e.g. from the historian at startup
+        i = self.index.get(key)
+        if i is None or not len(timestamps):
+            return
+        n = min(len(timestamps), self.capacity)
+        self.seq[i] += 1
+        self.history_ts[i, :n] = timestamps[len(timestamps) - n:]
+        self.history_values[i, :n] = values[len(values) - n:]
+        self.latest_ts[i] = int(timestamps[-1] * 1e9)
+        self.latest_value[i] = values[-1]
+        self.slot_version[i] = self.pending_version
+        self.count[i] = n
+        self.seq[i] += 1
+        self.dirty = True
+
+    def commit(self):
+        # Publish everything written since the last commit as one version
+        if not self.dirty:
+            return
+        self.header[HEADER_VERSION] = self.pending_version
+        self.pending_version += 1
+        self.dirty = False
+
+    # Reader side (web workers)
+
+    def version(self):
+        return int(self.header[HEADER_VERSION])
+
+    def epoch(self):
+        return int(self.header[HEADER_EPOCH])
+
+    def read_latest(self, lo, hi):
+        # Consistent (ts_ns, value, version, count) arrays for slots lo..hi
+        seq = self.seq[lo:hi].copy()
+        values = [array[lo:hi].copy() for array in (self.latest_ts, self.latest_value, self.slot_version, self.count)]
+        for _ in range(SEQLOCK_RETRIES):
+            torn = (seq & 1).astype(bool) | (self.seq[lo:hi] != seq)
+            if not torn.any():
+                return values
+            # Re-read only the slots that were being written
+            retry = np.flatnonzero(torn)
+            seq[retry] = self.seq[lo:hi][retry]
+            for value, array in zip(values, (self.latest_ts, self.latest_value, self.slot_version, self.count)):
+                value[retry] = array[lo:hi][retry]
+        # The writer stalled mid-update; report those slots as empty
+        values[3][torn] = 0
+        return values
+
+    def plant_data(self, plant, since_version=None):
+        # {process: {sensor: entry}} of a plant, optionally only the slots
+        # written after since_version
+        lo, hi = self.plant_ranges[plant]
+        timestamps, values, versions, counts = self.read_latest(lo, hi)
+        data = {}
+        for i in np.flatnonzero(counts > 0):
+            if since_version is not None and versions[i] <= since_version:
+                continue
+            _, process, sensor = self.keys[lo + i]
+            data.setdefault(process, {})[sensor] = {
+                'value': float(values[i]),
+                'unit': self.units[lo + i],
+                'timestamp': payload_codec.ns_to_iso(int(timestamps[i]))
+            }
+        return data
+
+    def history(self, key, start=None, end=None):
+        # (timestamps, values) with start <= timestamp <= end, oldest first
+        i = self.index.get(key)
+        if i is None:
+            return None
+        before = int(self.count[i])
+        timestamps = self.history_ts[i].copy()
+        values = self.history_values[i].copy()
+        after = int(self.count[i])
+        # Samples [first, before) were complete before the copy; the writer may
+        # have been overwriting the oldest ones while it ran
+        first = max(0, before - self.capacity, after - self.capacity + 1)
+        order = np.arange(first, before) % self.capacity
+        timestamps, values = timestamps[order], values[order]
+        mask = np.ones(len(timestamps), dtype=bool)
+        if start is not None:
+            mask &= timestamps >= start
+        if end is not None:
+            mask &= timestamps <= end
+        return timestamps[mask], values[mask]
+
+    def close(self):
+        # Views must go before the mapping can be closed
+        del self.header, self.seq, self.slot_version, self.latest_ts, self.latest_value, self.count
+        del self.history_ts, self.history_values
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class SharedSnapshots:
+    # The SnapshotStore interface web_dashboard's API handlers use, read
+    # from shared memory. Snapshots are rebuilt when the header version
+    # moves, so each worker serializes a version once. Encoded deltas are
+    # cached only for the last `history` versions, like SnapshotStore.
+    def __init__(self, state, history=DELTA_HISTORY):
+        self.state = state
+        self.history = history
+        self.epoch = format(state.epoch(), 'x')
+        self.snapshots = {}
+
+    def current(self, plant):
+        if plant not in self.state.plant_ranges:
+            return None
+        version = self.state.version()
+        snapshot = self.snapshots.get(plant)
+        if snapshot is None or snapshot.version != version:
+            snapshot = self.snapshots[plant] = Snapshot(version, self.state.plant_data(plant))
+        return snapshot
+
+    def etag(self, snapshot):
+        # Same epoch and version in every worker, so any worker can answer a revalidation
+        return f'"{self.epoch}-{snapshot.version}"'
+
+    def encode(self, snapshot):
+        body = snapshot.body
+        if body is None:
+            with snapshot.lock:
+                if snapshot.body is None:
+                    snapshot.body = json.dumps(snapshot.data).encode()
+                body = snapshot.body
+        return body
+
+    def encode_delta(self, plant, snapshot, since_version):
+        body = snapshot.deltas.get(since_version)
+        if body is not None:
+            return body
+        with snapshot.lock:
+            body = snapshot.deltas.get(since_version)
+            if body is None:
+                # Slot stamps make any since_version answerable within this run
+                full = since_version < 0 or since_version > snapshot.version
+                delta = {
+                    'version': snapshot.version,
+                    'since_version': since_version,
+                    'full': full,
+                    'changes': snapshot.data if full else self.state.plant_data(plant, since_version)
+                }
+                body = json.dumps(delta).encode()
+                if snapshot.version - self.history <= since_version <= snapshot.version:
+                    snapshot.deltas[since_version] = body
+        return body
+
+
+class SharedHistory:
+    # The HistoryStore interface web_dashboard's history handler uses.
+    # Only raw samples are shared, so downsampling always buckets them.
+    def __init__(self, state):
+        self.state = state
+        self.buffers = dict.fromkeys(state.keys)
+
+    def slice(self, key, start=None, end=None):
+        return self.state.history(key, start, end)
+
+    def downsample(self, key, start=None, end=None, points=500, method=downsampling.METHOD_MINMAX):
+        samples = self.state.history(key, start, end)
+        if samples is None:
+            return None
+        timestamps, values = samples
+        result = {'method': method, 'resolution': 0}
+        if method == downsampling.METHOD_LTTB:
+            timestamps, values = downsampling.lttb(timestamps, values, points)
+            result.update(timestamps=timestamps.tolist(), values=values.tolist())
+            return result
+        span_start = start if start is not None else (timestamps[0] if len(timestamps) else 0)
+        span_end = end if end is not None else (timestamps[-1] if len(timestamps) else 0)
+        counts = np.ones(len(values), dtype=np.int64)
+        timestamps, mins, maxs, means, counts = downsampling.bucket_aggregate(
+            timestamps, values, values, values, counts, span_start, span_end, points)
+        result.update(timestamps=timestamps.tolist(), min=mins.tolist(), max=maxs.tolist(),
+                      mean=means.tolist(), count=counts.tolist())
+        return result
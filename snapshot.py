@@ -0,0 +1,143 @@
+import collections
+import json
+import threading
+import time
+
+# Versioned, immutable snapshots of the dashboard's sensor state for the
+# HTTP API. The ingest side commits each batch of updates
+# ({plant: {process: {sensor: entry}}}) as a new version: changed process
+# dicts are copied and unchanged ones are shared with the previous snapshot,
+# so readers never see a dict that is being written. Encoded JSON is cached
+# per snapshot, so any number of pollers at the same version cost one
+# serialization, and a short log of recent changes answers
+# ?since_version= with only the sensors that changed.
+#
+# Versions come from one counter shared by all plants and only increase;
+# the ETag adds a per-process epoch so versions from before a restart never
+# match.
+
+# Committed batches kept per plant for delta queries
+DELTA_HISTORY = 256
+
+
+class Snapshot:
+    __slots__ = ('version', 'data', 'lock', 'body', 'deltas')
+
+    def __init__(self, version, data):
+        self.version = version
+        # {process: {sensor: entry}}; never mutated once published
+        self.data = data
+        self.lock = threading.Lock()
+        self.body = None
+        # since_version -> encoded delta
+        self.deltas = {}
+
+
+class PlantHistory:
+    __slots__ = ('snapshot', 'changes', 'floor')
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        # (version, {process: {sensor: entry}}) of recent commits
+        self.changes = collections.deque()
+        # Deltas can only be built for since_version >= floor
+        self.floor = snapshot.version
+
+
+class SnapshotStore:
+    def __init__(self, plants=None, history=DELTA_HISTORY):
+        self.history = history
+        self.lock = threading.Lock()
+        self.epoch = format(time.time_ns(), 'x')
+        self.version = 0
+        self.plants = {}
+        for plant, data in (plants or {}).items():
+            self.plants[plant] = PlantHistory(Snapshot(0, {process: dict(entries)
+                                                           for process, entries in data.items()}))
+
+    def commit(self, updates):
+        # One new version covering every plant in the batch
+        if not updates:
+            return self.version
+        with self.lock:
+            self.version += 1
+            version = self.version
+            for plant, processes in updates.items():
+                state = self.plants.get(plant)
+                if state is None:
+                    state = self.plants[plant] = PlantHistory(Snapshot(0, {}))
+                data = dict(state.snapshot.data)
+                changes = {}
+                for process, entries in processes.items():
+                    merged = dict(data.get(process, ()))
+                    merged.update(entries)
+                    data[process] = merged
+                    changes[process] = dict(entries)
+                state.changes.append((version, changes))
+                if len(state.changes) > self.history:
+                    state.floor = state.changes.popleft()[0]
+                # Readers pick up the new snapshot with a single reference read
+                state.snapshot = Snapshot(version, data)
+        return version
+
+    def current(self, plant):
+        state = self.plants.get(plant)
+        return None if state is None else state.snapshot
+
+    def etag(self, snapshot):
+        return f'"{self.epoch}-{snapshot.version}"'
+
+    def encode(self, snapshot):
+        # Serialized once per version; concurrent callers wait for the first
+        body = snapshot.body
+        if body is None:
+            with snapshot.lock:
+                if snapshot.body is None:
+                    snapshot.body = json.dumps(snapshot.data).encode()
+                body = snapshot.body
+        return body
+
+    def encode_delta(self, plant, snapshot, since_version):
+        # {"version", "since_version", "full", "changes"}: the sensors that
+        # changed after since_version, or everything if that is too old
+        body = snapshot.deltas.get(since_version)
+        if body is not None:
+            return body
+        with snapshot.lock:
+            body = snapshot.deltas.get(since_version)
+            if body is None:
+                changes = self.changes_since(plant, snapshot, since_version)
+                full = changes is None
+                delta = {
+                    'version': snapshot.version,
+                    'since_version': since_version,
+                    'full': full,
+                    'changes': snapshot.data if full else changes
+                }
+                body = json.dumps(delta).encode()
+                if len(snapshot.deltas) < self.history:
+                    snapshot.deltas[since_version] = body
+        return body
+
+    def changes_since(self, plant, snapshot, since_version):
+        state = self.plants[plant]
+        with self.lock:
+            if since_version < state.floor or since_version > snapshot.version:
+                return None
+            log = [entry for entry in state.changes if since_version < entry[0] <= snapshot.version]
+        changes = {}
+        for _, processes in log:
+            for process, entries in processes.items():
+                changes.setdefault(process, {}).update(entries)
+        return changes
+
+
+def etag_matches(header, etag):
+    # If-None-Match: "*", or a comma-separated list of (possibly weak) tags
+    if not header:
+        return False
+    for tag in header.split(','):
+        tag = tag.strip()
+        if tag == '*' or (tag[2:] if tag.startswith('W/') else tag) == etag:
+            return True
+    return False
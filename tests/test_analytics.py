@@ -0,0 +1,28 @@
+import math
+
+from analytics import AnalyticsEngine, SensorAnalytics, ALARM_ZSCORE, STATE_RAISED
+
+KEY = ('1', 'drying', 'temperature')
+
+
+def test_non_finite_samples_are_skipped():
+    analytics = SensorAnalytics(window=10)
+    for i in range(20):
+        analytics.update(20.0 + (i % 2) * 0.1)
+    for value in (math.nan, math.inf, -math.inf):
+        assert analytics.update(value) == []
+    assert analytics.skipped == 3
+    assert math.isfinite(analytics.ewma) and math.isfinite(analytics.mean)
+    assert analytics.std() > 0 and math.isfinite(analytics.ref_mean)
+    # Detection still works after the gap
+    events = analytics.update(30.0)
+    assert (ALARM_ZSCORE, STATE_RAISED) in [(kind, state) for kind, state, _ in events]
+
+
+def test_engine_skips_nan():
+    engine = AnalyticsEngine(window=10)
+    for i in range(10):
+        engine.update(KEY, i, 20.0 + (i % 2) * 0.1)
+    assert engine.update(KEY, 10, math.nan) == []
+    stats = engine.stats(KEY)
+    assert stats['skipped'] == 1 and math.isfinite(stats['mean'])
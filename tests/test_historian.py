@@ -0,0 +1,59 @@
+from historian import Historian, NS_PER_HOUR
+
+KEY = ('1', 'formation', 'voltage')
+
+
+def test_flush_across_hour_boundary(tmp_path):
+    historian = Historian(str(tmp_path))
+    hour = 480000
+    historian.append(KEY, hour * NS_PER_HOUR - 1000, 1.0, unit='V')
+    historian.append(KEY, hour * NS_PER_HOUR + 1000, 2.0)
+    assert historian.flush() == 2
+    assert historian.unit(KEY) == 'V'
+    # The next flush writes to the open segment of the new hour
+    historian.append(KEY, hour * NS_PER_HOUR + 2000, 3.0)
+    assert historian.flush() == 1
+    historian.stop()
+
+    timestamps, values = historian.read(KEY)
+    assert list(timestamps) == [hour * NS_PER_HOUR - 1000, hour * NS_PER_HOUR + 1000, hour * NS_PER_HOUR + 2000]
+    assert list(values) == [1.0, 2.0, 3.0]
+    assert len(historian.segments(KEY)) == 2
+
+
+def test_scan_out_of_order_appends(tmp_path):
+    historian = Historian(str(tmp_path))
+    base = 480000 * NS_PER_HOUR
+    # Sorted within a flush, out of order across flushes (e.g. a replay)
+    for offset in (30, 10, 20):
+        historian.append(KEY, base + offset, float(offset))
+    historian.flush()
+    for offset in (5, 25, 15):
+        historian.append(KEY, base + offset, float(offset))
+    historian.flush()
+
+    timestamps, values = historian.read(KEY, base + 10, base + 25)
+    assert list(timestamps - base) == [10, 15, 20, 25]
+    assert list(values) == [10.0, 15.0, 20.0, 25.0]
+    historian.stop()
+
+    # A reopened segment remembers its last timestamp
+    reopened = Historian(str(tmp_path))
+    reopened.append(KEY, base + 40, 40.0)
+    reopened.flush()
+    reopened.stop()
+    timestamps, _ = reopened.read(KEY, base + 26)
+    assert list(timestamps - base) == [30, 40]
+
+
+def test_sorted_segments_stay_unmarked(tmp_path):
+    historian = Historian(str(tmp_path))
+    base = 480000 * NS_PER_HOUR
+    historian.append(KEY, base + 2, 2.0)
+    historian.append(KEY, base + 1, 1.0)
+    historian.flush()
+    historian.append(KEY, base + 3, 3.0)
+    historian.stop()
+    [(records, in_order)] = historian.segments(KEY)
+    assert in_order
+    assert list(records['timestamp_ns'] - base) == [1, 2, 3]
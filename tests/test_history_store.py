@@ -0,0 +1,76 @@
+import numpy as np
+
+from history_store import HistoryStore, RollupBuffer, ROLLUP_INITIAL_BUCKETS
+from topic_router import TopicRouter
+
+KEY = ('1', 'drying', 'temperature')
+
+
+def test_rollups_grow_with_closed_buckets():
+    rollup = RollupBuffer(60, 200)
+    assert len(rollup.timestamps) == ROLLUP_INITIAL_BUCKETS
+    for minute in range(300):
+        rollup.add(minute * 60.0, float(minute))
+    assert len(rollup.timestamps) == 200
+    timestamps, mins, _, _, counts = rollup.slice_stats()
+    # 200 stored buckets plus the open one
+    assert list(timestamps[[0, -1]]) == [99 * 60.0, 299 * 60.0]
+    assert list(mins[[0, -1]]) == [99.0, 299.0]
+    assert counts.sum() == 201
+
+
+def test_rollup_load_grows():
+    rollup = RollupBuffer(60, 10000)
+    timestamps = np.arange(0, 600 * 60.0, 30.0)
+    rollup.load(timestamps, timestamps)
+    assert rollup.count == 599
+    assert rollup.latest()[0] == 598 * 60.0
+
+
+def test_memory_grows_lazily():
+    store = HistoryStore([KEY], capacity=3600)
+    assert store.memory_bytes() < store.sensor_bytes() / 5
+    for second in range(0, 4 * 3600, 10):
+        store.append(KEY, float(second), 1.0)
+    assert store.memory_bytes() < store.sensor_bytes() / 5
+
+
+def test_discovered_sensor_limit():
+    router = TopicRouter(max_discovered=2)
+    router.add_subscription('battery_plant/+/process/#')
+    for sensor in 'abc':
+        router.route(f'battery_plant/2/process/p/sensor/{sensor}')
+    assert [slot.sensor for slot in router.sensor_slots()] == ['a', 'b']
+    assert router.refused == 1
+    # Known sensors still route
+    assert router.route('battery_plant/2/process/p/sensor/a/bin')
+
+
+def test_late_sample_keeps_history():
+    store = HistoryStore([KEY], capacity=5)
+    for second in (10, 20, 30, 40):
+        store.append(KEY, float(second), float(second))
+    # e.g. a QoS 1 redelivery
+    store.append(KEY, 25.0, 25.0)
+    assert list(store.slice(KEY)[0]) == [10.0, 20.0, 25.0, 30.0, 40.0]
+    # Full: a late sample pushes out the oldest, one older than everything is dropped
+    store.append(KEY, 15.0, 15.0)
+    store.append(KEY, 5.0, 5.0)
+    timestamps, values = store.slice(KEY)
+    assert list(timestamps) == [15.0, 20.0, 25.0, 30.0, 40.0]
+    assert list(values) == list(timestamps)
+    store.append(KEY, 50.0, 50.0)
+    assert list(store.slice(KEY)[0]) == [20.0, 25.0, 30.0, 40.0, 50.0]
+
+
+def test_late_sample_updates_closed_rollup_bucket():
+    rollup = RollupBuffer(60, 100)
+    for second, value in ((0, 1.0), (30, 3.0), (60, 5.0), (180, 7.0), (240, 9.0)):
+        rollup.add(float(second), value)
+    rollup.add(10.0, 8.0)
+    rollup.add(130.0, 4.0)
+    timestamps, mins, maxs, sums, counts = rollup.slice_stats()
+    assert list(timestamps) == [0.0, 60.0, 120.0, 180.0, 240.0]
+    assert list(counts) == [3, 1, 1, 1, 1]
+    assert (mins[0], maxs[0], sums[0]) == (1.0, 8.0, 12.0)
+    assert list(sums[1:]) == [5.0, 4.0, 7.0, 9.0]
@@ -0,0 +1,98 @@
+import paho.mqtt.client as mqtt
+
+from publish_control import DiskSpool, PublishController, SPOOL_READ_BYTES
+
+
+def records(spool):
+    found = []
+    while spool.pending():
+        batch, nbytes = spool.read(100)
+        assert batch
+        found.extend(batch)
+        spool.consume(nbytes)
+    return found
+
+
+def test_torn_record_truncated_on_open(tmp_path):
+    path = str(tmp_path / 'spool.bin')
+    spool = DiskSpool(path)
+    for i in range(3):
+        spool.append('a/b', f'{i}')
+    spool.close()
+    # A crash in the middle of writing a fourth record
+    with open(path, 'ab') as f:
+        f.write(DiskSpool.RECORD.pack(3, 100, 0, 0) + b'a/b' + b'x' * 10)
+
+    spool = DiskSpool(path)
+    for i in range(3, 7):
+        spool.append('a/b', f'{i}')
+    assert [(topic, payload) for topic, payload, _, _ in records(spool)] == \
+        [('a/b', f'{i}'.encode()) for i in range(7)]
+    spool.close()
+
+
+def test_read_record_larger_than_read_size(tmp_path):
+    spool = DiskSpool(str(tmp_path / 'spool.bin'))
+    large = b'x' * (SPOOL_READ_BYTES + 10)
+    spool.append('a/large', large, qos=1)
+    spool.append('a/small', b'1')
+    assert records(spool) == [('a/large', large, 1, False), ('a/small', b'1', 0, False)]
+    spool.close()
+
+
+class FakeInfo:
+    def __init__(self, rc, mid):
+        self.rc = rc
+        self.mid = mid
+
+
+class FlakyClient:
+    # Connected paho stand-in whose publish fails once, on call number `fail_at`
+    def __init__(self, fail_at):
+        self.fail_at = fail_at
+        self.calls = 0
+        self.sent = []
+        self.on_publish = self.on_disconnect = None
+
+    def is_connected(self):
+        return True
+
+    def publish(self, topic, payload, qos=0, retain=False, properties=None):
+        self.calls += 1
+        if self.calls == self.fail_at:
+            return FakeInfo(mqtt.MQTT_ERR_NO_CONN, None)
+        self.sent.append(payload)
+        return FakeInfo(mqtt.MQTT_ERR_SUCCESS, self.calls)
+
+
+def test_drain_failure_does_not_resend(tmp_path):
+    spool = DiskSpool(str(tmp_path / 'spool.bin'))
+    for i in range(6):
+        spool.append('a/b', f'{i}')
+    client = FlakyClient(fail_at=4)
+    controller = PublishController(client, spool=spool, drain_rate=0)
+    controller.drain()
+    assert client.sent == [b'0', b'1', b'2']
+    controller.drain()
+    assert client.sent == [f'{i}'.encode() for i in range(6)]
+    assert controller.drained == 6
+    assert not controller.spooling and not spool.pending()
+    spool.close()
+
+
+class SilentClient(FlakyClient):
+    # Never acknowledges anything
+    def __init__(self):
+        super().__init__(fail_at=None)
+
+
+def test_publish_nowait_ignores_full_window(monkeypatch):
+    monkeypatch.setattr('publish_control.STALL_TIMEOUT', 0.01)
+    client = SilentClient()
+    controller = PublishController(client, max_inflight=2)
+    for i in range(2):
+        controller.publish('a/b', b'x', qos=1)
+    # As from on_connect on paho's thread, with the window full and no acks coming
+    assert controller.publish_nowait('a/meta', b'unit', qos=1, retain=True)
+    assert controller.stalls == 0
+    assert len(client.sent) == 3
@@ -0,0 +1,42 @@
+import time
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+import payload_codec
+from replay import to_epoch_ns
+
+
+@pytest.fixture
+def new_york(monkeypatch):
+    monkeypatch.setenv('TZ', 'America/New_York')
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+@pytest.mark.parametrize('naive', [
+    '2026-03-08T01:59:59',   # last second before the spring-forward gap (EST)
+    '2026-03-08T03:00:00',   # first second after it (EDT)
+    '2026-11-01T00:30:00',   # before fall back (EDT)
+    '2026-11-01T02:30:00',   # after it (EST)
+    '2026-01-15T12:00:00',   # winter, far from the replay's import time
+    '2026-07-15T12:00:00',
+])
+def test_naive_timestamps_follow_dst(new_york, naive):
+    epoch_ns = to_epoch_ns(pd.Series([naive]))[0]
+    assert epoch_ns == int(datetime.fromisoformat(naive).timestamp()) * 10**9
+    # Round trip with what the simulator publishes
+    assert payload_codec.ns_to_iso(int(epoch_ns)) == naive
+
+
+def test_across_spring_forward(new_york):
+    stamps = pd.Series(['2026-03-08T01:59:00', '2026-03-08T03:00:00'])
+    start, end = to_epoch_ns(stamps)
+    assert end - start == 60 * 10**9
+
+
+def test_aware_timestamps():
+    assert to_epoch_ns(pd.Series(['1970-01-01T00:00:01+00:00']))[0] == 10**9
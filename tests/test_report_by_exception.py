@@ -0,0 +1,39 @@
+import json
+
+import numpy as np
+
+from report_by_exception import SparkplugNode, SparkplugState, BIRTH, DATA
+from sensor_registry import load_registry
+
+
+def strict_loads(payload):
+    def reject(constant):
+        raise ValueError(f"non-standard JSON constant {constant}")
+    return json.loads(payload, parse_constant=reject)
+
+
+def test_non_finite_metrics_are_null():
+    registry = load_registry()
+    node = SparkplugNode(registry)
+    published = []
+    publish = lambda topic, payload, qos, retain=False: published.append((topic, payload))
+    row = [1.0] * len(registry.sensors)
+    row[0], row[1] = float('nan'), float('inf')
+
+    class Client:
+        def will_set(self, *args, **kwargs):
+            pass
+
+    node.publish_birth(Client(), publish, np.array(row), 0)
+    node.publish_data(publish, row, np.ones(len(row), dtype=bool), 1)
+    (birth_topic, birth), (data_topic, data) = published
+    assert birth_topic == node.topics[BIRTH] and data_topic == node.topics[DATA]
+    birth_values = {metric['name']: metric['value'] for metric in strict_loads(birth)['metrics']}
+    data_values = {metric['alias']: metric['value'] for metric in strict_loads(data)['metrics']}
+    assert birth_values[node.names[0]] is None and birth_values[node.names[1]] is None
+    assert data_values[0] is None and data_values[1] is None and data_values[2] == 1.0
+
+    state = SparkplugState()
+    for topic, payload in published:
+        state.apply(topic, payload)
+    assert state.nodes[(node.group, node.node)]['values'][node.names[2]] == 1.0
@@ -0,0 +1,47 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.local_broker import LocalBroker
+from sensor_simulator import BatteryPlantSimulator, REGISTRY, TOPIC_MODE_BOTH
+
+
+@pytest.mark.parametrize('value', [np.nan, np.inf, -np.inf])
+def test_non_finite_values_publish_valid_json(value):
+    broker = LocalBroker()
+    received = []
+    subscriber = broker.client('subscriber')
+    subscriber.on_message = lambda client, userdata, msg: received.append(msg)
+    subscriber.subscribe('battery_plant/#')
+
+    simulator = BatteryPlantSimulator(client=broker.client('simulator'), topic_mode=TOPIC_MODE_BOTH)
+    row = {column: 1.5 for column in REGISTRY.columns()}
+    row[REGISTRY.columns()[0]] = value
+    simulator.data = pd.DataFrame([row])
+    simulator.prepare_fast_path()
+    assert simulator.publish_rows(1) == len(received)
+
+    # Python's json accepts NaN/Infinity, as json.dumps writes them; nan/inf are rejected
+    payloads = [json.loads(msg.payload) for msg in received]
+    sensor = REGISTRY.sensors[0]
+    [sample] = [payload for msg, payload in zip(received, payloads)
+                if msg.topic == simulator.topics[sensor.process][sensor.sensor]]
+    assert sample['value'] == pytest.approx(value, nan_ok=True)
+    [bundle] = [payload for msg, payload in zip(received, payloads) if msg.topic.endswith(f'{sensor.process}/bundle')]
+    assert bundle['values'][sensor.sensor] == pytest.approx(value, nan_ok=True)
+    assert all(payload['value'] == 1.5 for payload in payloads if 'value' in payload and payload is not sample)
+
+
+def test_on_connect_does_not_wait_for_flow_control(monkeypatch):
+    from test_publish_control import SilentClient
+    monkeypatch.setattr('publish_control.STALL_TIMEOUT', 0.01)
+    client = SilentClient()
+    simulator = BatteryPlantSimulator(client=client, encoding='binary', qos=1)
+    simulator.enable_flow_control(max_inflight=1)
+    simulator.controller.publish('a/b', b'x', qos=1)
+    # The window is full and nothing is acknowledged: metadata still goes out at once
+    simulator.on_connect(client, None, {}, 0)
+    assert simulator.controller.stalls == 0
+    assert len(client.sent) == 1 + len(REGISTRY.sensors)
@@ -0,0 +1,41 @@
+import pytest
+
+import shared_state
+from shared_state import SharedSnapshots, SharedState
+from sensor_registry import load_registry
+
+
+def test_refuses_weakly_ordered_machines(monkeypatch):
+    monkeypatch.setattr(shared_state.platform, 'machine', lambda: 'aarch64')
+    with pytest.raises(RuntimeError):
+        SharedState.create(load_registry(), ['1'], 10)
+
+
+def test_write_and_read_latest(monkeypatch):
+    monkeypatch.setattr(shared_state.platform, 'machine', lambda: 'x86_64')
+    state = SharedState.create(load_registry(), ['1'], 10)
+    try:
+        key = state.keys[0]
+        state.write(key, 2 * 10**9, 1.5)
+        state.commit()
+        timestamps, values = state.history(key)
+        assert list(timestamps) == [2.0] and list(values) == [1.5]
+    finally:
+        state.close()
+
+
+def test_delta_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(shared_state.platform, 'machine', lambda: 'x86_64')
+    state = SharedState.create(load_registry(), ['1'], 10)
+    try:
+        for i in range(10):
+            state.write(state.keys[0], (i + 1) * 10**9, float(i))
+            state.commit()
+        snapshots = SharedSnapshots(state, history=4)
+        snapshot = snapshots.current('1')
+        for since_version in range(-1000, 1000):
+            snapshots.encode_delta('1', snapshot, since_version)
+        assert len(snapshot.deltas) == 5
+        assert min(snapshot.deltas) == snapshot.version - 4
+    finally:
+        state.close()
@@ -0,0 +1,69 @@
+import pytest
+
+from historian import Historian
+from topic_router import TopicRouter
+
+
+def make_router():
+    router = TopicRouter()
+    router.add_subscription('battery_plant/+/process/#')
+    return router
+
+
+@pytest.mark.parametrize('topic', [
+    'battery_plant/../process/../sensor/x',
+    'battery_plant/./process/p/sensor/x',
+    'battery_plant//process//sensor/x',
+    'battery_plant/1/process/p/sensor/',
+    'battery_plant/../process/p/bundle',
+])
+def test_discover_refuses_invalid_levels(topic):
+    router = make_router()
+    assert router.route(topic) is None
+    assert not router.routes
+
+
+def test_discover_registers_sensor():
+    router = make_router()
+    encoding, slot = router.route('battery_plant/2/process/p/sensor/x')
+    assert slot.key == ('2', 'p', 'x')
+    assert router.discover_sensor('2', 'p', 'a\\b') is None
+
+
+def test_historian_key_outside_root(tmp_path):
+    historian = Historian(str(tmp_path / 'root'))
+    with pytest.raises(AssertionError):
+        historian.sensor_dir(('..', '..', 'x'))
+    assert historian.sensor_dir(('1', 'p', 'x')).startswith(str(tmp_path / 'root'))
+
+
+def test_unroutable_topics_are_cached(monkeypatch):
+    router = make_router()
+    topic = 'battery_plant/1/process/x/status'
+    assert router.route(topic) is None
+    monkeypatch.setattr(router, 'discover', lambda topic: pytest.fail("discovered twice"))
+    assert router.route(topic) is None
+
+
+def test_unroutable_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr('topic_router.UNROUTABLE_CACHE_SIZE', 3)
+    router = make_router()
+    for i in range(5):
+        router.route(f'battery_plant/1/process/x/status{i}')
+    assert list(router.unroutable) == [f'battery_plant/1/process/x/status{i}' for i in (2, 3, 4)]
+    # A new subscription can make cached topics routable
+    router.add_subscription('other/#')
+    assert not router.unroutable
+
+
+def test_bundle_flood_is_bounded():
+    router = TopicRouter(max_discovered=3)
+    router.add_subscription('battery_plant/+/process/#')
+    for i in range(100):
+        router.route(f'battery_plant/{i}/process/p{i}/bundle')
+    assert len(router.processes) == 3
+    assert router.refused == 97
+    # Sensors share the limit
+    assert router.route('battery_plant/1/process/p/sensor/x') is None
+    # Known bundles still route
+    assert router.route('battery_plant/0/process/p0/bundle/bin') is not None
@@ -0,0 +1,19 @@
+import web_dashboard as dashboard
+
+
+class Message:
+    def __init__(self, topic):
+        self.topic = topic
+        self.payload = b'{}'
+        self.properties = None
+
+
+def test_received_metric_labels_only_routed_topics(monkeypatch):
+    monkeypatch.setattr(dashboard, 'ingest', dashboard.IngestQueue(100))
+    before = dict(dashboard.messages_received.series)
+    known = dashboard.TOPICS['drying']['temperature']
+    for topic in [known] + [f'battery_plant/1/process/x/status{i}' for i in range(20)]:
+        dashboard.on_message(None, None, Message(topic))
+    labels = set(dashboard.messages_received.series) - set(before)
+    assert labels <= {(known,), (dashboard.UNROUTED_LABEL,)}
+    assert dashboard.messages_received.series[(dashboard.UNROUTED_LABEL,)].value >= 20
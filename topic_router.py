@@ -0,0 +1,234 @@
+import logging
+
+import payload_codec
+
+logger = logging.getLogger(__name__)
+
+# Precompiled topic routing for the dashboard. Every known topic string,
+# including its /bin and /meta variants, maps straight to a preallocated
+# slot, so routing a message is one dict lookup. Topics that are not known
+# yet but match a wildcard subscription are parsed once on first sight and
+# registered, which is how new plants and sensors appear. Discovered plant,
+# process and sensor names become history keys and historian directories, so
+# empty levels, '.', '..', path separators and wildcards are refused. Topics
+# that match a subscription but cannot be routed are remembered in a bounded
+# negative cache, so they cost one dict lookup per message too. Each sensor
+# gets history buffers, so at most max_discovered sensors and processes are
+# registered from messages; further ones are refused.
+#
+#   battery_plant/{plant}/process/{process}/sensor/{sensor}[/bin|/meta]
+#   battery_plant/{plant}/process/{process}/bundle[/bin|/meta]
+
+TOPIC_ROOT = 'battery_plant'
+INVALID_LEVELS = ('', '.', '..')
+INVALID_CHARACTERS = ('/', '\\', '\0', '+', '#')
+
+
+# Unroutable topics remembered; the oldest are evicted first
+UNROUTABLE_CACHE_SIZE = 10000
+# Sensors registered from messages, on top of the precompiled plant
+MAX_DISCOVERED_SENSORS = 1000
+
+
+def valid_level(level):
+    return level not in INVALID_LEVELS and not any(c in level for c in INVALID_CHARACTERS)
+
+
+class SensorSlot:
+    __slots__ = ('plant', 'process', 'sensor', 'topic', 'key', 'unit', 'entry', 'data')
+    bundle = False
+
+    def __init__(self, plant, process, sensor, topic, data):
+        self.plant = plant
+        self.process = process
+        self.sensor = sensor
+        self.topic = topic
+        # History/historian key
+        self.key = (plant, process, sensor)
+        self.unit = ''
+        self.entry = None
+        # The process's {sensor: entry} dict served by the API
+        self.data = data
+
+
+class ProcessSlot:
+    __slots__ = ('plant', 'process', 'topic', 'sensors', 'layout', 'data')
+    bundle = True
+
+    def __init__(self, plant, process, topic, data):
+        self.plant = plant
+        self.process = process
+        self.topic = topic
+        self.sensors = {}
+        # Binary bundle layout from retained metadata: ([SensorSlot], struct)
+        self.layout = None
+        self.data = data
+
+
+class TopicTrie:
+    # MQTT subscription patterns, matched level by level with + and #
+    def __init__(self):
+        self.root = {}
+
+    def insert(self, pattern):
+        node = self.root
+        for level in pattern.split('/'):
+            node = node.setdefault(level, {})
+        node[None] = pattern
+
+    def match(self, topic):
+        return self.match_levels(self.root, topic.split('/'), 0)
+
+    def match_levels(self, node, levels, i):
+        if '#' in node:
+            return True
+        if i == len(levels):
+            return None in node
+        for key in (levels[i], '+'):
+            child = node.get(key)
+            if child is not None and self.match_levels(child, levels, i + 1):
+                return True
+        return False
+
+
+class TopicRouter:
+    def __init__(self, on_register=None, max_discovered=MAX_DISCOVERED_SENSORS):
+        # topic -> (encoding, slot)
+        self.routes = {}
+        # {plant: {process: {sensor: entry}}}
+        self.plants = {}
+        self.processes = {}
+        self.subscriptions = TopicTrie()
+        self.patterns = []
+        # Topics (and bundle sensor names) that were refused, in insertion order
+        self.unroutable = {}
+        self.on_register = on_register
+        self.max_discovered = max_discovered
+        self.discovered = 0
+        # Sensors and processes refused because of the limit
+        self.refused = 0
+
+    def add_subscription(self, pattern):
+        if pattern not in self.patterns:
+            self.patterns.append(pattern)
+            self.subscriptions.insert(pattern)
+            self.unroutable.clear()
+
+    def register_plant(self, plant, topics):
+        # Precompile routes for a {process: {sensor: topic}} table
+        for process, sensors in topics.items():
+            for sensor, topic in sensors.items():
+                self.register_sensor(plant, process, sensor, topic)
+
+    def plant_data(self, plant):
+        return self.plants.setdefault(plant, {})
+
+    def register_process(self, plant, process):
+        slot = self.processes.get((plant, process))
+        if slot is None:
+            topic = payload_codec.bundle_topic(f"{TOPIC_ROOT}/{plant}", process)
+            slot = ProcessSlot(plant, process, topic, self.plant_data(plant).setdefault(process, {}))
+            self.processes[(plant, process)] = slot
+            self.routes[topic] = (payload_codec.ENCODING_JSON, slot)
+            self.routes[payload_codec.binary_topic(topic)] = (payload_codec.ENCODING_BINARY, slot)
+            self.routes[payload_codec.meta_topic(topic)] = (payload_codec.ENCODING_META, slot)
+        return slot
+
+    def register_sensor(self, plant, process, sensor, topic=None):
+        process_slot = self.register_process(plant, process)
+        slot = process_slot.sensors.get(sensor)
+        if slot is not None:
+            return slot
+        if topic is None:
+            topic = f"{TOPIC_ROOT}/{plant}/process/{process}/sensor/{sensor}"
+        slot = SensorSlot(plant, process, sensor, topic, process_slot.data)
+        process_slot.sensors[sensor] = slot
+        process_slot.data.setdefault(sensor, None)
+        self.routes[topic] = (payload_codec.ENCODING_JSON, slot)
+        self.routes[payload_codec.binary_topic(topic)] = (payload_codec.ENCODING_BINARY, slot)
+        self.routes[payload_codec.meta_topic(topic)] = (payload_codec.ENCODING_META, slot)
+        if self.on_register is not None:
+            self.on_register(slot)
+        return slot
+
+    def discover_sensor(self, plant, process, sensor, topic=None):
+        # register_sensor for names taken from messages; None if refused
+        slot = self.sensor_slot(plant, process, sensor)
+        if slot is not None:
+            return slot
+        if (plant, process, sensor) in self.unroutable:
+            return None
+        if not all(valid_level(level) for level in (plant, process, sensor)):
+            logger.warning(f"Refusing sensor with an invalid name: {plant!r}/{process!r}/{sensor!r}")
+            self.refuse((plant, process, sensor))
+            return None
+        if not self.discovery_allowed(f"sensor {plant}/{process}/{sensor}"):
+            self.refuse((plant, process, sensor))
+            return None
+        return self.register_sensor(plant, process, sensor, topic)
+
+    def discover_process(self, plant, process):
+        # register_process for names taken from bundle topics; None if refused
+        slot = self.processes.get((plant, process))
+        if slot is not None:
+            return slot
+        if not (valid_level(plant) and valid_level(process)):
+            logger.warning(f"Refusing process bundle with an invalid name: {plant!r}/{process!r}")
+            return None
+        if not self.discovery_allowed(f"process bundle {plant}/{process}"):
+            return None
+        return self.register_process(plant, process)
+
+    def discovery_allowed(self, name):
+        # Counts a sensor or process against max_discovered
+        if self.discovered >= self.max_discovered:
+            if self.refused == 0:
+                logger.warning(f"Discovery limit ({self.max_discovered}) reached, refusing new sensors and processes")
+            logger.debug(f"Refusing {name}: discovery limit reached")
+            self.refused += 1
+            return False
+        self.discovered += 1
+        return True
+
+    def route(self, topic):
+        # (encoding, slot) for a topic, or None if it is not routable
+        route = self.routes.get(topic)
+        if route is None and topic not in self.unroutable:
+            route = self.discover(topic)
+            if route is None:
+                self.refuse(topic)
+        return route
+
+    def refuse(self, key):
+        if len(self.unroutable) >= UNROUTABLE_CACHE_SIZE:
+            del self.unroutable[next(iter(self.unroutable))]
+        self.unroutable[key] = None
+
+    def discover(self, topic):
+        if not self.subscriptions.match(topic):
+            return None
+        base, _ = payload_codec.split_topic(topic)
+        parts = base.split('/')
+        if len(parts) == 6 and parts[0] == TOPIC_ROOT and parts[2] == 'process' and parts[4] == 'sensor':
+            if self.discover_sensor(parts[1], parts[3], parts[5], base) is None:
+                return None
+            logger.info(f"Registered new sensor {base}")
+        elif len(parts) == 5 and parts[0] == TOPIC_ROOT and parts[2] == 'process' \
+                and parts[4] == payload_codec.BUNDLE_SUFFIX:
+            if self.discover_process(parts[1], parts[3]) is None:
+                return None
+            logger.info(f"Registered new process bundle {base}")
+        else:
+            logger.debug(f"Ignoring unroutable topic {topic}")
+            return None
+        return self.routes.get(topic)
+
+    def sensor_slot(self, plant, process, sensor):
+        process_slot = self.processes.get((plant, process))
+        if process_slot is None:
+            return None
+        return process_slot.sensors.get(sensor)
+
+    def sensor_slots(self):
+        for process_slot in self.processes.values():
+            yield from process_slot.sensors.values()
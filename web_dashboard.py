@@ -1,8 +1,23 @@
-from flask import Flask, render_template
+from flask import Flask, render_template, request, g
+from flask_socketio import SocketIO, emit
 import paho.mqtt.client as mqtt
+import argparse
 import json
 from datetime import datetime
 import logging
+import threading
+import time
+
+import payload_codec
+from history_store import HistoryStore, HISTORY_CAPACITY
+import downsampling
+from historian import Historian, HISTORIAN_DIR
+from ingest_queue import IngestQueue, IngestWorker, POLICIES, INGEST_QUEUE_SIZE, INGEST_BATCH_SIZE
+from topic_router import TopicRouter, MAX_DISCOVERED_SENSORS
+from sensor_registry import load_registry
+import analytics
+import metrics
+from snapshot import SnapshotStore, etag_matches
 
 # Configure logging
 logging.basicConfig(
@@ -12,155 +27,428 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
+socketio = SocketIO(app)
 
 # MQTT Configuration
 MQTT_BROKER = "localhost"
 MQTT_PORT = 1883
 MQTT_CLIENT_ID = "battery_plant_dashboard"
 
+DASHBOARD_PORT = 5001
+
 # Standardized MQTT Topic Structure
 TOPIC_BASE = "battery_plant/1"
-TOPICS = {
-    'mixing': {
-        'temperature': f"{TOPIC_BASE}/process/mixing/sensor/temperature",
-        'humidity': f"{TOPIC_BASE}/process/mixing/sensor/humidity",
-        'pressure': f"{TOPIC_BASE}/process/mixing/sensor/pressure",
-        'viscosity': f"{TOPIC_BASE}/process/mixing/sensor/viscosity",
-        'density': f"{TOPIC_BASE}/process/mixing/sensor/density"
-    },
-    'coating': {
-        'thickness': f"{TOPIC_BASE}/process/coating/sensor/thickness",
-        'speed': f"{TOPIC_BASE}/process/coating/sensor/speed",
-        'temperature': f"{TOPIC_BASE}/process/coating/sensor/temperature",
-        'humidity': f"{TOPIC_BASE}/process/coating/sensor/humidity",
-        'web_tension': f"{TOPIC_BASE}/process/coating/sensor/web_tension"
-    },
-    'drying': {
-        'temperature': f"{TOPIC_BASE}/process/drying/sensor/temperature",
-        'humidity': f"{TOPIC_BASE}/process/drying/sensor/humidity",
-        'air_flow': f"{TOPIC_BASE}/process/drying/sensor/air_flow",
-        'drying_time': f"{TOPIC_BASE}/process/drying/sensor/drying_time"
-    },
-    'calendering': {
-        'pressure': f"{TOPIC_BASE}/process/calendering/sensor/pressure",
-        'temperature': f"{TOPIC_BASE}/process/calendering/sensor/temperature",
-        'speed': f"{TOPIC_BASE}/process/calendering/sensor/speed",
-        'thickness': f"{TOPIC_BASE}/process/calendering/sensor/thickness"
-    },
-    'slitting': {
-        'speed': f"{TOPIC_BASE}/process/slitting/sensor/speed",
-        'tension': f"{TOPIC_BASE}/process/slitting/sensor/tension",
-        'width': f"{TOPIC_BASE}/process/slitting/sensor/width"
-    },
-    'environmental': {
-        'temperature': f"{TOPIC_BASE}/process/environmental/sensor/temperature",
-        'humidity': f"{TOPIC_BASE}/process/environmental/sensor/humidity",
-        'pressure': f"{TOPIC_BASE}/process/environmental/sensor/pressure"
-    },
-    'quality': {
-        'resistance': f"{TOPIC_BASE}/process/quality/sensor/resistance",
-        'porosity': f"{TOPIC_BASE}/process/quality/sensor/porosity",
-        'density': f"{TOPIC_BASE}/process/quality/sensor/density"
-    },
-    'energy': {
-        'power': f"{TOPIC_BASE}/process/energy/sensor/power",
-        'air_pressure': f"{TOPIC_BASE}/process/energy/sensor/air_pressure",
-        'water_temperature': f"{TOPIC_BASE}/process/energy/sensor/water_temperature"
-    }
-}
-
-# Store latest sensor data
-sensor_data = {
-    'mixing': {
-        'temperature': None,
-        'humidity': None,
-        'pressure': None,
-        'viscosity': None,
-        'density': None
-    },
-    'coating': {
-        'thickness': None,
-        'speed': None,
-        'temperature': None,
-        'humidity': None,
-        'web_tension': None
-    },
-    'drying': {
-        'temperature': None,
-        'humidity': None,
-        'air_flow': None,
-        'drying_time': None
-    },
-    'calendering': {
-        'pressure': None,
-        'temperature': None,
-        'speed': None,
-        'thickness': None
-    },
-    'slitting': {
-        'speed': None,
-        'tension': None,
-        'width': None
-    },
-    'environmental': {
-        'temperature': None,
-        'humidity': None,
-        'pressure': None
-    },
-    'quality': {
-        'resistance': None,
-        'porosity': None,
-        'density': None
-    },
-    'energy': {
-        'power': None,
-        'air_pressure': None,
-        'water_temperature': None
-    }
-}
+DEFAULT_PLANT = TOPIC_BASE.split('/')[1]
+
+# Sensors and units come from the shared registry (sensors.json)
+REGISTRY = load_registry()
+TOPICS = REGISTRY.topics(DEFAULT_PLANT)
+
+# Subscribe to per-sensor topics ('sensor') or per-process bundles ('bundle')
+TOPIC_MODE = 'sensor'
+
+# Maximum WebSocket pushes per second; updates arriving in between are coalesced
+PUSH_MAX_RATE = 10
+
+# Sensors changed since the last push: {process: {sensor: entry}}
+pending_updates = {}
+pending_lock = threading.Lock()
+
+# Recent samples per sensor, in fixed-size ring buffers
+history = HistoryStore(capacity=HISTORY_CAPACITY)
+
+# On-disk historian, enabled with --historian-dir
+historian = None
+
+# Raw messages from the MQTT thread, processed in batches by the ingest worker
+ingest = IngestQueue(INGEST_QUEUE_SIZE)
+
+# Shared-memory copy of the latest values and history for web worker
+# processes, set by dashboard_cluster.py
+shared = None
+
+# Socket.IO pushes; off in cluster workers, where the page polls instead
+LIVE_PUSH = True
+
+# Off in cluster workers, which have no ingest queue or metrics of their own
+SERVES_INGEST = True
+
+# Streaming anomaly and limit detection, disabled with --no-analytics
+engine = analytics.AnalyticsEngine(analytics.limits_from_registry(REGISTRY))
+
+# Runtime metrics, served at /metrics. Message series have a single writer
+# (on_message runs on paho's thread, the rest on the ingest worker); HTTP
+# timings may race between request threads, which at worst loses a count.
+E2E_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+telemetry = metrics.MetricsRegistry()
+# Labelled with the topic only once the router has a slot for it, so label
+# cardinality is bounded by the routing table; everything else (unroutable,
+# or the first message of a sensor that is discovered) counts as 'unrouted'
+UNROUTED_LABEL = 'unrouted'
+messages_received = telemetry.counter('uns_messages_received_total', "MQTT messages received per topic",
+                                      ('topic',))
+on_message_seconds = telemetry.histogram('uns_on_message_seconds', "Time spent in the MQTT on_message callback",
+                                         metrics.FAST_BUCKETS)
+handle_seconds = telemetry.histogram('uns_message_handle_seconds', "Time to decode and apply one message",
+                                     metrics.FAST_BUCKETS)
+decode_seconds = telemetry.histogram('uns_json_decode_seconds', "Time spent in json.loads per JSON payload",
+                                     metrics.FAST_BUCKETS)
+e2e_latency = telemetry.histogram('uns_end_to_end_latency_seconds',
+                                  "Payload timestamp to receipt by the dashboard", E2E_BUCKETS)
+http_seconds = telemetry.histogram('uns_http_request_seconds', "HTTP request latency per endpoint",
+                                   metrics.LATENCY_BUCKETS, ('endpoint',))
+telemetry.gauge('uns_ingest_queue_depth', "Messages waiting for the ingest worker", lambda: len(ingest.items))
+telemetry.counter_func('uns_ingest_dropped_total', "Messages dropped by the ingest queue", lambda: ingest.dropped)
+telemetry.gauge('uns_sensors_known', "Sensors with a routing slot", lambda: len(history.buffers))
+telemetry.counter_func('uns_sensors_refused_total', "Discovered sensors and processes refused by the discovery limit",
+                       lambda: router.refused)
+telemetry.gauge('uns_alarms_active', "Alarms currently raised", lambda: len(engine.active) if engine else 0)
+
+# Extra subscription patterns (e.g. battery_plant/+/process/#). Plants and
+# sensors under them register themselves on first sight.
+SUBSCRIPTIONS = []
+
+def register_slot(slot):
+    history.register(slot.key)
+
+def build_router(registry):
+    # Topic -> preallocated slot routing table; the dashboard's own plant is
+    # compiled up front from the registry
+    router = TopicRouter(on_register=register_slot)
+    router.register_plant(DEFAULT_PLANT, registry.topics(DEFAULT_PLANT))
+    # Units are known up front, so binary samples decode before their metadata arrives
+    for sensor in registry.sensors:
+        router.sensor_slot(DEFAULT_PLANT, sensor.process, sensor.sensor).unit = sensor.unit
+    return router
+
+router = build_router(REGISTRY)
+
+# Store latest sensor data ({process: {sensor: entry}} of the default plant)
+sensor_data = router.plants[DEFAULT_PLANT]
+
+# Versioned copies of every plant's sensor data, committed once per ingest
+# batch; the API serves these instead of the dicts the ingest worker writes
+snapshots = SnapshotStore(router.plants)
+
+def subscription_patterns():
+    if TOPIC_MODE == 'bundle':
+        # One message per process per tick, plus binary bundles and metadata
+        patterns = [
+            f"{TOPIC_BASE}/process/+/{payload_codec.BUNDLE_SUFFIX}",
+            f"{TOPIC_BASE}/process/+/{payload_codec.BUNDLE_SUFFIX}/+"
+        ]
+    else:
+        patterns = [topic for sensors in TOPICS.values() for topic in sensors.values()]
+        # Binary-encoded samples and their metadata ({topic}/bin, {topic}/meta)
+        patterns.append(f"{TOPIC_BASE}/process/+/sensor/+/+")
+    return patterns + SUBSCRIPTIONS
 
 def on_connect(client, userdata, flags, rc):
     if rc == 0:
         logger.info("Connected to MQTT broker")
         # Subscribe to all topics
-        for process, sensors in TOPICS.items():
-            for sensor, topic in sensors.items():
-                client.subscribe(topic)
-                logger.info(f"Subscribed to {topic}")
+        for pattern in subscription_patterns():
+            router.add_subscription(pattern)
+            client.subscribe(pattern)
+            logger.info(f"Subscribed to {pattern}")
     else:
         logger.error(f"Failed to connect to MQTT broker with code: {rc}")
 
+def message_topic(msg):
+    topic = msg.topic
+    if payload_codec.message_content_type(msg) == payload_codec.CONTENT_TYPE_BINARY \
+            and payload_codec.split_topic(topic)[1] == payload_codec.ENCODING_JSON:
+        # MQTT v5 content-type negotiation, expressed as the topic suffix
+        topic = payload_codec.binary_topic(topic)
+    return topic
+
+def topic_label(topic):
+    return topic if topic in router.routes else UNROUTED_LABEL
+
 def on_message(client, userdata, msg):
-    try:
-        payload = json.loads(msg.payload.decode())
-        topic_parts = msg.topic.split('/')
-        
-        # Extract process and sensor type from topic
-        process = topic_parts[3]  # e.g., 'mixing', 'coating', etc.
-        sensor_type = topic_parts[-1]  # e.g., 'temperature', 'humidity', etc.
-        
-        # Update sensor data
-        sensor_data[process][sensor_type] = {
-            'value': payload['value'],
-            'unit': payload['unit'],
-            'timestamp': payload['timestamp']
-        }
-        logger.debug(f"Updated {process} {sensor_type}: {payload}")
-    except Exception as e:
-        logger.error(f"Error processing message: {e}")
+    # Runs on paho's network thread, so only hand the raw message over
+    start = time.perf_counter()
+    messages_received.labels(topic_label(msg.topic)).inc()
+    ingest.put((message_topic(msg), msg.payload, time.time()))
+    on_message_seconds.observe(time.perf_counter() - start)
+
+def process_batch(batch):
+    # Runs on the ingest worker: decode, update state, then fan out once per batch
+    updates = {}
+    for topic, payload, recv_ts in batch:
+        start = time.perf_counter()
+        try:
+            epoch = handle_message(topic, payload, updates)
+        except Exception as e:
+            logger.error(f"Error processing message on {topic}: {e}")
+            continue
+        handle_seconds.observe(time.perf_counter() - start)
+        if epoch is not None:
+            e2e_latency.observe(recv_ts - epoch)
+    if updates:
+        snapshots.commit(updates)
+        if shared is not None:
+            shared.commit()
+        queue_updates(updates)
+
+def handle_message(topic, payload, updates):
+    # Returns the sample's epoch time, or None for messages without one
+    route = router.route(topic)
+    if route is None:
+        return None
+    encoding, slot = route
+    if slot.bundle:
+        return handle_bundle(slot, encoding, payload, updates)
+    if encoding == payload_codec.ENCODING_META:
+        slot.unit = payload_codec.decode_meta(payload)['unit']
+        return None
+    if encoding == payload_codec.ENCODING_BINARY:
+        timestamp_ns, value = payload_codec.decode_binary(payload)
+        unit = slot.unit
+        timestamp = payload_codec.ns_to_iso(timestamp_ns)
+        epoch = timestamp_ns / 1e9
+    else:
+        start = time.perf_counter()
+        payload = json.loads(payload)
+        decode_seconds.observe(time.perf_counter() - start)
+        value = payload['value']
+        unit = payload['unit']
+        timestamp = payload['timestamp']
+        epoch = datetime.fromisoformat(timestamp).timestamp()
+    
+    # Update sensor data
+    entry = {
+        'value': value,
+        'unit': unit,
+        'timestamp': timestamp
+    }
+    update_slot(slot, entry, epoch, updates)
+    logger.debug(f"Updated {slot.topic}: {entry}")
+    return epoch
+
+def handle_bundle(process_slot, encoding, payload, updates):
+    if encoding == payload_codec.ENCODING_META:
+        meta = payload_codec.decode_meta(payload)
+        # Refused sensors keep their position in the layout as None
+        slots = [router.discover_sensor(process_slot.plant, process_slot.process, sensor)
+                 for sensor in meta['sensors']]
+        for slot, unit in zip(slots, meta['units']):
+            if slot is not None:
+                slot.unit = unit
+        process_slot.layout = (slots, payload_codec.bundle_struct(len(slots)))
+        return None
+    if encoding == payload_codec.ENCODING_BINARY:
+        if process_slot.layout is None:
+            logger.warning(f"No metadata for {process_slot.topic} yet, dropping binary bundle")
+            return None
+        slots, bundle_layout = process_slot.layout
+        timestamp_ns, values = payload_codec.decode_bundle_binary(payload, bundle_layout)
+        units = [slot.unit if slot is not None else '' for slot in slots]
+        timestamp = payload_codec.ns_to_iso(timestamp_ns)
+        epoch = timestamp_ns / 1e9
+    else:
+        start = time.perf_counter()
+        bundle = json.loads(payload)
+        decode_seconds.observe(time.perf_counter() - start)
+        slots = [process_slot.sensors.get(sensor)
+                 or router.discover_sensor(process_slot.plant, process_slot.process, sensor)
+                 for sensor in bundle['values']]
+        values = bundle['values'].values()
+        units = bundle['units'].values()
+        timestamp = bundle['timestamp']
+        epoch = datetime.fromisoformat(timestamp).timestamp()
+
+    # Update all of the process's sensors in one pass
+    for slot, value, unit in zip(slots, values, units):
+        if slot is None:
+            continue
+        update_slot(slot, {'value': value, 'unit': unit, 'timestamp': timestamp}, epoch, updates)
+    logger.debug(f"Updated {process_slot.topic}: {len(slots)} sensors")
+    return epoch
+
+def update_slot(slot, entry, epoch, updates):
+    slot.entry = entry
+    slot.data[slot.sensor] = entry
+    history.append(slot.key, epoch, entry['value'])
+    if historian is not None:
+        historian.append(slot.key, int(epoch * 1e9), entry['value'], entry['unit'])
+    if shared is not None:
+        shared.write(slot.key, int(epoch * 1e9), entry['value'])
+    if engine is not None:
+        for alarm in engine.update(slot.key, entry['timestamp'], entry['value']):
+            publish_alarm(alarm)
+    updates.setdefault(slot.plant, {}).setdefault(slot.process, {})[slot.sensor] = entry
+
+def publish_alarm(alarm):
+    logger.warning(f"Alarm {alarm['state']}: {alarm['plant']}/{alarm['process']}/{alarm['sensor']} "
+                   f"{alarm['kind']} (value {alarm['value']}, score {alarm['score']:.2f})")
+    client.publish(analytics.alarm_topic(alarm), analytics.encode_alarm(alarm))
+
+def queue_updates(updates):
+    # Only the default plant is pushed to the page
+    with pending_lock:
+        for process, entries in updates.get(DEFAULT_PLANT, {}).items():
+            pending_updates.setdefault(process, {}).update(entries)
+
+def push_updates():
+    # Push only the sensors that changed since the last frame, at most
+    # PUSH_MAX_RATE times per second
+    global pending_updates
+    while True:
+        socketio.sleep(1.0 / PUSH_MAX_RATE)
+        with pending_lock:
+            if not pending_updates:
+                continue
+            updates, pending_updates = pending_updates, {}
+        socketio.emit('sensor_update', updates)
+
+@socketio.on('connect')
+def on_client_connect():
+    # New clients start from a full snapshot, then receive deltas
+    emit('snapshot', snapshots.current(DEFAULT_PLANT).data)
 
 # Set up MQTT client
 client = mqtt.Client(MQTT_CLIENT_ID)
 client.on_connect = on_connect
 client.on_message = on_message
 
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_time(response):
+    if request.endpoint is not None:
+        http_seconds.labels(request.endpoint).observe(time.perf_counter() - g.request_start)
+    return response
+
 @app.route('/')
 def index():
-    return render_template('index.html', sensor_data=sensor_data)
+    return render_template('index.html', sensor_data=sensor_data, processes=REGISTRY.dashboard_processes(),
+                           live_push=LIVE_PUSH)
 
 @app.route('/api/sensor-data')
 def get_sensor_data():
-    return sensor_data
+    return sensor_data_response(request.args, request.headers.get('If-None-Match'))
+
+@app.route('/metrics')
+def get_metrics():
+    if not SERVES_INGEST:
+        return {'error': "Metrics are served by the ingest process"}, 404
+    return telemetry.render(), 200, {'Content-Type': metrics.CONTENT_TYPE}
+
+@app.route('/api/ingest-stats')
+def get_ingest_stats():
+    if not SERVES_INGEST:
+        return {'error': "Ingest stats are served by the ingest process"}, 404
+    return ingest.stats()
+
+@app.route('/api/alarms')
+def get_alarms():
+    return alarms_response()
+
+@app.route('/api/analytics/<process>/<sensor>')
+def get_sensor_analytics(process, sensor):
+    return analytics_response(request.args, process, sensor)
+
+@app.route('/api/history/<process>/<sensor>')
+def get_sensor_history(process, sensor):
+    return history_response(request.args, process, sensor)
+
+# API handlers shared with the asyncio dashboard (async_dashboard.py). They
+# take the query arguments as a mapping and return (body, status).
+
+def sensor_data_response(args, if_none_match=None):
+    # Returns (body bytes, status, headers). The body is the plant's snapshot,
+    # or with ?since_version=N only the sensors changed after version N.
+    # Matching If-None-Match gets 304 without a body.
+    plant = args.get('plant', DEFAULT_PLANT)
+    snapshot = snapshots.current(plant)
+    if snapshot is None:
+        return json.dumps({'error': f"Unknown plant: {plant}"}).encode(), 404, {'Content-Type': 'application/json'}
+    since_version = args.get('since_version')
+    etag = snapshots.etag(snapshot)
+    headers = {
+        'Content-Type': 'application/json',
+        'ETag': etag,
+        'X-Snapshot-Version': str(snapshot.version),
+        # Clients may cache but must revalidate
+        'Cache-Control': 'no-cache'
+    }
+    if etag_matches(if_none_match, etag):
+        return b'', 304, headers
+    if since_version is None:
+        return snapshots.encode(snapshot), 200, headers
+    try:
+        since_version = int(since_version)
+    except ValueError:
+        return json.dumps({'error': f"Invalid since_version: {since_version}"}).encode(), 400, \
+            {'Content-Type': 'application/json'}
+    return snapshots.encode_delta(plant, snapshot, since_version), 200, headers
+
+def alarms_response():
+    if engine is None:
+        return {'error': "Analytics disabled"}, 404
+    return {
+        'active': list(engine.active.values()),
+        'raised': engine.raised,
+        'samples': engine.samples
+    }, 200
+
+def analytics_response(args, process, sensor):
+    if engine is None:
+        return {'error': "Analytics disabled"}, 404
+    plant = args.get('plant', DEFAULT_PLANT)
+    stats = engine.stats((plant, process, sensor))
+    if stats is None:
+        return {'error': f"Unknown sensor: {process}/{sensor}"}, 404
+    return stats, 200
+
+def parse_time(text):
+    # Epoch seconds or an ISO 8601 timestamp
+    try:
+        return float(text)
+    except ValueError:
+        return datetime.fromisoformat(text).timestamp()
+
+def history_response(args, process, sensor):
+    try:
+        since = args.get('since')
+        until = args.get('until')
+        since = parse_time(since) if since else None
+        until = parse_time(until) if until else None
+    except ValueError as e:
+        return {'error': f"Invalid time: {e}"}, 400
+
+    plant = args.get('plant', DEFAULT_PLANT)
+    key = (plant, process, sensor)
+
+    # ?points=N returns a downsampled series (min/max/mean buckets or LTTB)
+    try:
+        points = int(args.get('points') or 0)
+    except ValueError:
+        return {'error': f"Invalid points: {args.get('points')}"}, 400
+    if points:
+        method = args.get('method', downsampling.METHOD_MINMAX)
+        if method not in downsampling.METHODS:
+            return {'error': f"Unknown method: {method}"}, 400
+        result = history.downsample(key, since, until, points, method)
+        if result is None:
+            return {'error': f"Unknown sensor: {process}/{sensor}"}, 404
+        result.update(plant=plant, process=process, sensor=sensor)
+        return result, 200
+
+    samples = history.slice(key, since, until)
+    if samples is None:
+        return {'error': f"Unknown sensor: {process}/{sensor}"}, 404
+    timestamps, values = samples
+    return {
+        'plant': plant,
+        'process': process,
+        'sensor': sensor,
+        'timestamps': timestamps.tolist(),
+        'values': values.tolist()
+    }, 200
 
 def start_mqtt_client():
     try:
@@ -169,6 +457,76 @@ def start_mqtt_client():
     except Exception as e:
         logger.error(f"Error connecting to MQTT broker: {e}")
 
+def add_arguments(parser):
+    # Options shared with the asyncio dashboard
+    parser.add_argument('--topic-mode', choices=['sensor', 'bundle'], default=TOPIC_MODE,
+                        help="Subscribe to per-sensor topics or per-process bundles")
+    parser.add_argument('--push-rate', type=float, default=PUSH_MAX_RATE,
+                        help="Maximum WebSocket pushes per second")
+    parser.add_argument('--history-capacity', type=int, default=HISTORY_CAPACITY,
+                        help="Samples of history kept per sensor")
+    parser.add_argument('--historian-dir', nargs='?', const=HISTORIAN_DIR, default=None,
+                        help=f"Persist samples to disk (default directory: {HISTORIAN_DIR})")
+    parser.add_argument('--reload-hours', type=float, default=24,
+                        help="Hours of history reloaded from the historian at startup")
+    parser.add_argument('--subscribe', action='append', default=[], metavar='PATTERN',
+                        help="Extra subscription, e.g. 'battery_plant/+/process/#' (repeatable)")
+    parser.add_argument('--max-discovered-sensors', type=int, default=MAX_DISCOVERED_SENSORS,
+                        help="Sensors and processes registered from wildcard subscriptions before new ones "
+                             "are refused")
+    parser.add_argument('--registry', default=None, help="Sensor registry file (default: sensors.json)")
+    parser.add_argument('--no-analytics', action='store_true', help="Disable anomaly and limit detection")
+    parser.add_argument('--z-threshold', type=float, default=analytics.Z_THRESHOLD,
+                        help="z-score that raises an anomaly alarm")
+
+def configure(args):
+    # Apply the shared options to the module state and start the historian
+    global TOPIC_MODE, PUSH_MAX_RATE, SUBSCRIPTIONS, REGISTRY, TOPICS, router, sensor_data
+    global engine, history, historian, snapshots
+    TOPIC_MODE = args.topic_mode
+    PUSH_MAX_RATE = args.push_rate
+    SUBSCRIPTIONS = args.subscribe
+    if args.registry:
+        REGISTRY = load_registry(args.registry)
+        TOPICS = REGISTRY.topics(DEFAULT_PLANT)
+        router = build_router(REGISTRY)
+        sensor_data = router.plants[DEFAULT_PLANT]
+    router.max_discovered = args.max_discovered_sensors
+    engine = None if args.no_analytics else analytics.AnalyticsEngine(
+        analytics.limits_from_registry(REGISTRY), z_threshold=args.z_threshold)
+    history = HistoryStore([slot.key for slot in router.sensor_slots()], args.history_capacity)
+    logger.info(f"History store: up to {history.sensor_bytes() / 1e6:.1f} MB per sensor, "
+                f"{history.memory_bytes() / 1e6:.1f} MB allocated for {len(history.buffers)} known sensors, "
+                f"at most {len(history.buffers) + router.max_discovered} sensors")
+
+    if args.historian_dir:
+        historian = Historian(args.historian_dir)
+        start = time.perf_counter()
+        latest = historian.load_recent(history, args.reload_hours * 3600)
+        for key, (timestamp_ns, value, unit) in latest.items():
+            slot = router.register_sensor(*key)
+            slot.unit = unit
+            slot.entry = {'value': value, 'unit': unit, 'timestamp': payload_codec.ns_to_iso(timestamp_ns)}
+            slot.data[slot.sensor] = slot.entry
+        logger.info(f"Reloaded {len(latest)} sensors from {args.historian_dir} "
+                    f"in {(time.perf_counter() - start) * 1000:.0f} ms")
+        historian.start()
+    snapshots = SnapshotStore(router.plants)
+
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Battery plant web dashboard")
+    add_arguments(parser)
+    parser.add_argument('--queue-size', type=int, default=INGEST_QUEUE_SIZE,
+                        help="Maximum raw messages waiting for processing")
+    parser.add_argument('--overload-policy', choices=POLICIES, default=POLICIES[0],
+                        help="Drop the oldest queued message or block the MQTT thread when the queue is full")
+    parser.add_argument('--batch-size', type=int, default=INGEST_BATCH_SIZE,
+                        help="Maximum messages processed per batch")
+    args = parser.parse_args()
+    configure(args)
+
+    ingest = IngestQueue(args.queue_size, args.overload_policy, args.batch_size)
+    IngestWorker(ingest, process_batch).start()
     start_mqtt_client()
-    app.run(debug=True, use_reloader=False, port=5001) 
\ No newline at end of file
+    socketio.start_background_task(push_updates)
+    socketio.run(app, debug=True, use_reloader=False, port=DASHBOARD_PORT)